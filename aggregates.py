@@ -0,0 +1,433 @@
+# tools/aggregates.py - Materialized dashboard aggregates, maintained incrementally on every save
+
+import os
+import json
+import logging
+import datetime
+import threading
+import contextlib
+from change_detector import KIND_DELTA, record_kind, record_location, incident_key
+from columnar_store import weather_row
+
+# fcntl is POSIX-only; without it only one process should save the aggregates.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger('Aggregates')
+logger.setLevel(logging.INFO)
+
+AGGREGATES_FILE = 'aggregates.json'
+# Held while the aggregates file is replaced, so processes sharing it never interleave writes
+LOCK_FILE = 'aggregates.lock'
+# Incidents with one of these statuses are no longer active
+INACTIVE_STATUSES = frozenset({'complete', 'completed', 'resolved', 'closed', 'cancelled'})
+
+
+def _hour_of(value) -> int:
+    """Hours since the epoch of an ISO timestamp (naive ones are local time), or None."""
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    return int(parsed.timestamp() // 3600)
+
+
+def _hour_start(hour: int) -> str:
+    return datetime.datetime.fromtimestamp(hour * 3600).isoformat()
+
+
+def _bump(counts: dict, key, amount: int = 1):
+    value = counts.get(key, 0) + amount
+    if value:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+
+def _new_hour() -> dict:
+    return {
+        "incidents": 0,
+        "by_type": {},
+        "by_impact": {},
+        "keys": [],
+        "temperature_count": 0,
+        "temperature_sum": 0.0,
+        "temperature_min": None,
+        "temperature_max": None,
+        "conditions": {},
+    }
+
+
+class _LocationAggregate:
+    """Everything the dashboard shows for one monitoring_location."""
+
+    __slots__ = ('hours', 'hour_keys', 'newest_hour', 'window_start', 'sightings', 'expiring',
+                 'by_type', 'by_impact', 'incidents', 'active', 'latest_weather', 'latest_weather_at')
+
+    def __init__(self):
+        # Hourly buckets for the trend window: hour -> bucket (see _new_hour)
+        self.hours = {}
+        self.hour_keys = {}          # hour -> set of incident keys already counted in that bucket
+        self.newest_hour = None
+        # Rolling window of distinct incidents: every incident last seen at or after
+        # window_start is counted once in by_type / by_impact / incidents
+        self.window_start = None
+        self.sightings = {}          # incident key -> [last hour seen, type, impact]
+        self.expiring = {}           # hour -> set of incident keys last seen in that hour
+        self.by_type = {}
+        self.by_impact = {}
+        self.incidents = 0
+        # Incidents in the latest feed that are not completed: key -> incident
+        self.active = {}
+        self.latest_weather = None
+        self.latest_weather_at = None
+
+
+class DashboardAggregates:
+    """
+    Dashboard views kept up to date as records are saved, instead of being
+    recomputed from raw payloads on every read.
+
+    Per monitoring_location:
+    * hourly buckets of incident counts by type and impact, and of temperature
+      and conditions, for the last `trend_hours` hours;
+    * distinct incidents by type and impact over the last `window_hours`
+      hours, as running totals: reading them is O(1), and expiring old hours
+      only touches the incidents last seen in them;
+    * the set of currently active incidents, following snapshots and deltas.
+
+    Everything is derived from the log, so the state is persisted with the
+    sequence number it reaches (`applied_upto`) and caught up from the store
+    after a restart, or rebuilt from a full scan if the file is lost. Records
+    must be applied densely, in log order: apply() rejects a gap, which the
+    caller fills with catch_up() from the store. Processes sharing the directory
+    replace the file under a file lock.
+    """
+
+    def __init__(self, directory: str, window_hours: int = 24, trend_hours: int = 168):
+        self.path = os.path.join(directory, AGGREGATES_FILE)
+        self.window_hours = window_hours
+        self.trend_hours = max(trend_hours, window_hours)
+        self.applied_upto = 0
+        self._locations = {}
+        self._lock = threading.RLock()
+        self.load()
+
+    # --- Persistence ---
+
+    def load(self):
+        """Loads the persisted aggregates; a missing or unreadable file leaves them empty (rebuild from the store)."""
+        with self._lock:
+            try:
+                with open(self.path, 'r') as f:
+                    state = json.load(f)
+            except FileNotFoundError:
+                return
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable aggregates file {self.path}: {e}")
+                return
+            self._locations = {}
+            for location, saved in state.get("locations", {}).items():
+                aggregate = self._locations[location] = _LocationAggregate()
+                for hour, bucket in saved["hours"].items():
+                    aggregate.hours[int(hour)] = bucket
+                    aggregate.hour_keys[int(hour)] = set(bucket["keys"])
+                aggregate.newest_hour = saved["newest_hour"]
+                aggregate.active = saved["active"]
+                aggregate.latest_weather = saved["latest_weather"]
+                aggregate.latest_weather_at = saved["latest_weather_at"]
+                aggregate.window_start = saved["window_start"]
+                for key, (hour, incident_type, impact) in saved["sightings"].items():
+                    self._count_sighting(aggregate, key, hour, incident_type, impact)
+            self.applied_upto = state.get("applied_upto", 0)
+
+    def save(self):
+        """Writes the aggregates atomically (temporary file, then rename)."""
+        with self._lock:
+            locations = {}
+            for location, aggregate in self._locations.items():
+                for hour, bucket in aggregate.hours.items():
+                    bucket["keys"] = sorted(aggregate.hour_keys.get(hour, ()))
+                locations[location] = {
+                    "hours": aggregate.hours,
+                    "newest_hour": aggregate.newest_hour,
+                    "window_start": aggregate.window_start,
+                    "sightings": aggregate.sightings,
+                    "active": aggregate.active,
+                    "latest_weather": aggregate.latest_weather,
+                    "latest_weather_at": aggregate.latest_weather_at,
+                }
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with self._process_locked():
+                with open(tmp_path, 'w') as f:
+                    json.dump({"applied_upto": self.applied_upto, "locations": locations}, f, separators=(',', ':'))
+                os.replace(tmp_path, self.path)
+
+    @contextlib.contextmanager
+    def _process_locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(os.path.dirname(self.path) or '.', LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    # --- Updates ---
+
+    def apply(self, seq: int, record: dict):
+        """
+        Folds one stored record into the aggregates (records already applied are ignored).
+
+        Raises:
+            ValueError: `seq` is past `applied_upto`, i.e. records in between were not
+                applied; catch up from the store instead.
+        """
+        with self._lock:
+            if seq < self.applied_upto:
+                return
+            if seq > self.applied_upto:
+                raise ValueError(f"Out-of-order aggregate update: expected seq {self.applied_upto}, got {seq}.")
+            self.applied_upto = seq + 1
+            hour = _hour_of(record.get('fetch_timestamp'))
+            location = record_location(record)
+            if hour is None or location is None:
+                return
+            aggregate = self._locations.get(location)
+            if aggregate is None:
+                aggregate = self._locations[location] = _LocationAggregate()
+                aggregate.window_start = hour - self.window_hours + 1
+            if aggregate.newest_hour is None or hour > aggregate.newest_hour:
+                aggregate.newest_hour = hour
+                self._advance(aggregate, hour)
+                self._prune(aggregate)
+            if hour < aggregate.newest_hour - self.trend_hours + 1:
+                return  # older than anything the dashboard shows
+
+            bucket = aggregate.hours.get(hour)
+            if bucket is None:
+                bucket = aggregate.hours[hour] = _new_hour()
+                aggregate.hour_keys[hour] = set()
+            self._apply_weather(aggregate, bucket, record, hour)
+            self._apply_incidents(aggregate, bucket, record, hour)
+
+    def _apply_weather(self, aggregate: _LocationAggregate, bucket: dict, record: dict, hour: int):
+        row = weather_row(record)
+        if row is None:
+            return
+        temperature, condition = row["temperature_c"], row["condition"]
+        if temperature is not None:
+            bucket["temperature_count"] += 1
+            bucket["temperature_sum"] += temperature
+            bucket["temperature_min"] = temperature if bucket["temperature_min"] is None \
+                else min(bucket["temperature_min"], temperature)
+            bucket["temperature_max"] = temperature if bucket["temperature_max"] is None \
+                else max(bucket["temperature_max"], temperature)
+        if condition:
+            _bump(bucket["conditions"], str(condition))
+        if aggregate.latest_weather_at is None or record.get('fetch_timestamp') >= aggregate.latest_weather_at:
+            aggregate.latest_weather = {"temperature_c": temperature, "condition": condition,
+                                        "wind_speed_kph": row["wind_speed_kph"]}
+            aggregate.latest_weather_at = record.get('fetch_timestamp')
+
+    def _apply_incidents(self, aggregate: _LocationAggregate, bucket: dict, record: dict, hour: int):
+        if record_kind(record) == KIND_DELTA:
+            body = record.get('delta') or {}
+            incidents = list(body.get('incidents_added') or []) + list(body.get('incidents_updated') or [])
+            resolved = body.get('incidents_resolved') or []
+        else:
+            body = record.get('raw_payload') or {}
+            incidents = body.get('raw_incidents') or []
+            # A snapshot lists every current incident, unless the incident source failed this cycle
+            resolved = [] if 'incidents' in (body.get('partial_sources') or {}) else None
+
+        current = {}
+        for incident in incidents:
+            if isinstance(incident, dict) and 'error' not in incident:
+                current[incident_key(incident)] = incident
+
+        # 1. Currently active incidents
+        if resolved is None:
+            aggregate.active = {}
+        for key in resolved or ():
+            aggregate.active.pop(key, None)
+        for key, incident in current.items():
+            if str(incident.get('status', '')).casefold() in INACTIVE_STATUSES:
+                aggregate.active.pop(key, None)
+            else:
+                aggregate.active[key] = incident
+
+        # Deltas only carry changes, so incidents that are still active count as seen again
+        seen_now = dict(current)
+        seen_now.update(aggregate.active)
+
+        # 2. Hourly bucket: each incident counted once per hour
+        seen = aggregate.hour_keys[hour]
+        for key, incident in seen_now.items():
+            incident_type, impact = str(incident.get('type', 'Unknown')), str(incident.get('impact', 'Unknown'))
+            if key not in seen:
+                seen.add(key)
+                bucket["incidents"] += 1
+                _bump(bucket["by_type"], incident_type)
+                _bump(bucket["by_impact"], impact)
+            # 3. Rolling window: each incident counted once while it keeps being seen
+            self._count_sighting(aggregate, key, hour, incident_type, impact)
+
+    def _count_sighting(self, aggregate: _LocationAggregate, key: str, hour: int, incident_type: str, impact: str):
+        if hour < aggregate.window_start:
+            return
+        previous = aggregate.sightings.get(key)
+        if previous is not None:
+            if previous[0] > hour:
+                return
+            self._uncount(aggregate, key, previous)
+        aggregate.sightings[key] = [hour, incident_type, impact]
+        aggregate.expiring.setdefault(hour, set()).add(key)
+        aggregate.incidents += 1
+        _bump(aggregate.by_type, incident_type)
+        _bump(aggregate.by_impact, impact)
+
+    @staticmethod
+    def _uncount(aggregate: _LocationAggregate, key: str, sighting: list):
+        hour, incident_type, impact = sighting
+        keys = aggregate.expiring.get(hour)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del aggregate.expiring[hour]
+        aggregate.incidents -= 1
+        _bump(aggregate.by_type, incident_type, -1)
+        _bump(aggregate.by_impact, impact, -1)
+
+    def _advance(self, aggregate: _LocationAggregate, now_hour: int):
+        """Moves the rolling window to end at `now_hour`, dropping incidents last seen before it."""
+        start = now_hour - self.window_hours + 1
+        if aggregate.window_start is not None and start <= aggregate.window_start:
+            return
+        # Only hours that still hold incidents need visiting
+        for hour in [h for h in aggregate.expiring if h < start]:
+            for key in list(aggregate.expiring[hour]):
+                self._uncount(aggregate, key, aggregate.sightings.pop(key))
+        aggregate.window_start = start
+
+    def _prune(self, aggregate: _LocationAggregate):
+        oldest = aggregate.newest_hour - self.trend_hours + 1
+        for hour in [h for h in aggregate.hours if h < oldest]:
+            del aggregate.hours[hour]
+            aggregate.hour_keys.pop(hour, None)
+
+    def catch_up(self, scanned_records) -> int:
+        """Applies records past `applied_upto`, given a store.scan(applied_upto) iterator of (seq, record)."""
+        with self._lock:
+            count = 0
+            for seq, record in scanned_records:
+                if seq < self.applied_upto:
+                    continue
+                if seq > self.applied_upto:
+                    # The store no longer has the records in between (dropped by retention)
+                    self.applied_upto = seq
+                self.apply(seq, record)
+                count += 1
+            return count
+
+    def rebuild(self, scanned_records) -> int:
+        """Discards the aggregates and recomputes them from a store.scan() iterator of (seq, record)."""
+        with self._lock:
+            self._locations = {}
+            self.applied_upto = 0
+            count = self.catch_up(scanned_records)
+            self.save()
+            logger.info(f"Rebuilt dashboard aggregates from {count} records.")
+            return count
+
+    # --- Reads ---
+
+    def locations(self) -> list:
+        with self._lock:
+            return sorted(self._locations)
+
+    def _current(self, location: str, now: datetime.datetime = None) -> _LocationAggregate:
+        aggregate = self._locations.get(location)
+        if aggregate is not None:
+            self._advance(aggregate, _hour_of((now or datetime.datetime.now()).isoformat()))
+        return aggregate
+
+    def incident_counts(self, location: str, now: datetime.datetime = None) -> dict:
+        """Distinct incidents seen in the last `window_hours`, in total and by type and impact."""
+        with self._lock:
+            aggregate = self._current(location, now)
+            if aggregate is None:
+                return {"window_hours": self.window_hours, "incidents": 0, "by_type": {}, "by_impact": {}}
+            return {"window_hours": self.window_hours, "incidents": aggregate.incidents,
+                    "by_type": dict(aggregate.by_type), "by_impact": dict(aggregate.by_impact)}
+
+    def active_incidents(self, location: str) -> list:
+        """Incidents in the latest feed of the location that are not completed."""
+        with self._lock:
+            aggregate = self._locations.get(location)
+            return list(aggregate.active.values()) if aggregate is not None else []
+
+    def hourly(self, location: str, hours: int = None, now: datetime.datetime = None) -> list:
+        """
+        Hourly buckets, oldest first, for the last `hours` (at most `trend_hours`): incident
+        counts by type and impact plus temperature min/max/mean and the dominant condition.
+        """
+        hours = min(hours or self.trend_hours, self.trend_hours)
+        end = _hour_of((now or datetime.datetime.now()).isoformat())
+        results = []
+        with self._lock:
+            aggregate = self._locations.get(location)
+            if aggregate is None:
+                return results
+            for hour in range(end - hours + 1, end + 1):
+                bucket = aggregate.hours.get(hour)
+                if bucket is None:
+                    continue
+                conditions = bucket["conditions"]
+                results.append({
+                    "hour_start": _hour_start(hour),
+                    "incidents": bucket["incidents"],
+                    "by_type": dict(bucket["by_type"]),
+                    "by_impact": dict(bucket["by_impact"]),
+                    "temperature_min": bucket["temperature_min"],
+                    "temperature_max": bucket["temperature_max"],
+                    "temperature_mean": (bucket["temperature_sum"] / bucket["temperature_count"]
+                                         if bucket["temperature_count"] else None),
+                    "dominant_condition": max(conditions, key=conditions.get) if conditions else None,
+                })
+        return results
+
+    def weather_stats(self, location: str, now: datetime.datetime = None) -> dict:
+        """Latest reading plus temperature min/max/mean and condition counts over the last `window_hours`."""
+        end = _hour_of((now or datetime.datetime.now()).isoformat())
+        with self._lock:
+            aggregate = self._locations.get(location)
+            if aggregate is None:
+                return {}
+            count, total, low, high, conditions = 0, 0.0, None, None, {}
+            for hour in range(end - self.window_hours + 1, end + 1):
+                bucket = aggregate.hours.get(hour)
+                if bucket is None or not (bucket["temperature_count"] or bucket["conditions"]):
+                    continue
+                count += bucket["temperature_count"]
+                total += bucket["temperature_sum"]
+                if bucket["temperature_min"] is not None:
+                    low = bucket["temperature_min"] if low is None else min(low, bucket["temperature_min"])
+                    high = bucket["temperature_max"] if high is None else max(high, bucket["temperature_max"])
+                for condition, n in bucket["conditions"].items():
+                    _bump(conditions, condition, n)
+            return {
+                "window_hours": self.window_hours,
+                "latest": dict(aggregate.latest_weather) if aggregate.latest_weather else None,
+                "latest_at": aggregate.latest_weather_at,
+                "readings": count,
+                "temperature_min": low,
+                "temperature_max": high,
+                "temperature_mean": total / count if count else None,
+                "conditions": conditions,
+            }
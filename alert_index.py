@@ -0,0 +1,194 @@
+# tools/alert_index.py - In-memory secondary indexes over the alert log store
+
+import re
+import bisect
+import logging
+import datetime
+import threading
+from array import array
+from change_detector import record_incidents, record_location
+
+logger = logging.getLogger('AlertIndex')
+logger.setLevel(logging.INFO)
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def normalize_key(value) -> str:
+    """Normalizes an indexed string value (case and surrounding whitespace)."""
+    return str(value).strip().casefold()
+
+
+def location_tokens(location) -> set:
+    """Splits an incident location into the word tokens it is indexed under."""
+    return {token.casefold() for token in _TOKEN_PATTERN.findall(str(location or ''))}
+
+
+def parse_timestamp(value) -> float:
+    """Converts an ISO timestamp (or datetime) into epoch seconds."""
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+
+
+def _intersect_bounds(postings: array, lo: int, hi: int) -> tuple:
+    return bisect.bisect_left(postings, lo), bisect.bisect_left(postings, hi)
+
+
+def incident_matches(incident: dict, incident_type: str = None, incident_location: str = None) -> bool:
+    """True if a single incident satisfies the given type and location filters."""
+    if not isinstance(incident, dict):
+        return False
+    if incident_type is not None and normalize_key(incident.get('type', '')) != normalize_key(incident_type):
+        return False
+    if incident_location is not None and not location_tokens(incident_location) <= location_tokens(incident.get('location')):
+        return False
+    return True
+
+
+class AlertIndex:
+    """
+    Secondary indexes over stored alert records, keyed by sequence number.
+
+    * `fetch_timestamp`: records are appended in time order, so the timestamps form
+      a sorted array and a time range maps to a contiguous sequence range.
+    * `monitoring_location`, incident `type` and incident `location` tokens: sorted
+      posting lists of sequence numbers.
+
+    A query walks the smallest matching posting list (newest first) and checks the
+    others by binary search, so its cost follows the result size rather than the
+    history size.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._base_seq = None
+        self._timestamps = array('d')
+        self._by_location = {}
+        self._by_incident_type = {}
+        self._by_incident_token = {}
+
+    @property
+    def first_seq(self) -> int:
+        return self._base_seq or 0
+
+    @property
+    def next_seq(self) -> int:
+        return (self._base_seq or 0) + len(self._timestamps)
+
+    # --- Maintenance ---
+
+    def build(self, records):
+        """Indexes an iterable of (seq, record) pairs, e.g. a full store scan."""
+        count = 0
+        for seq, record in records:
+            self.add(seq, record)
+            count += 1
+        logger.info(f"Built alert index over {count} records.")
+
+    def add(self, seq: int, record: dict):
+        """Indexes one newly appended record."""
+        with self._lock:
+            if self._base_seq is None:
+                self._base_seq = seq
+            if seq != self.next_seq:
+                # Only dense, in-order appends are indexed; a gap means the index
+                # missed writes and must be rebuilt from the store.
+                raise ValueError(f"Out-of-order index update: expected seq {self.next_seq}, got {seq}.")
+
+            try:
+                timestamp = parse_timestamp(record.get('fetch_timestamp'))
+            except (TypeError, ValueError):
+                timestamp = self._timestamps[-1] if self._timestamps else 0.0
+            if self._timestamps and timestamp < self._timestamps[-1]:
+                # Keep the array sorted if the wall clock stepped backwards.
+                timestamp = self._timestamps[-1]
+            self._timestamps.append(timestamp)
+
+            location = record_location(record)
+            if location:
+                self._post(self._by_location, normalize_key(location), seq)
+
+            incident_types = set()
+            incident_tokens = set()
+            for incident in record_incidents(record):
+                if not isinstance(incident, dict):
+                    continue
+                if incident.get('type'):
+                    incident_types.add(normalize_key(incident['type']))
+                incident_tokens |= location_tokens(incident.get('location'))
+            for key in incident_types:
+                self._post(self._by_incident_type, key, seq)
+            for key in incident_tokens:
+                self._post(self._by_incident_token, key, seq)
+
+    @staticmethod
+    def _post(index: dict, key: str, seq: int):
+        postings = index.get(key)
+        if postings is None:
+            postings = index[key] = array('q')
+        postings.append(seq)
+
+    # --- Queries ---
+
+    def _seq_range(self, start, end) -> tuple:
+        lo_pos = 0 if start is None else bisect.bisect_left(self._timestamps, parse_timestamp(start))
+        hi_pos = len(self._timestamps) if end is None else bisect.bisect_right(self._timestamps, parse_timestamp(end))
+        base = self._base_seq or 0
+        return base + lo_pos, base + hi_pos
+
+    def query(self, start=None, end=None, location: str = None, incident_type: str = None,
+              incident_location: str = None, limit: int = None) -> list:
+        """
+        Returns matching sequence numbers, newest first.
+
+        Args:
+            start: Earliest `fetch_timestamp` (inclusive), ISO string or datetime.
+            end: Latest `fetch_timestamp` (inclusive), ISO string or datetime.
+            location: Exact `monitoring_location` (case-insensitive).
+            incident_type: Incident `type` that must appear in the record.
+            incident_location: Words that must all appear in some incident `location`.
+            limit: Maximum number of sequence numbers to return.
+        """
+        with self._lock:
+            lo, hi = self._seq_range(start, end)
+            if lo >= hi:
+                return []
+
+            postings = []
+            if location is not None:
+                postings.append(self._by_location.get(normalize_key(location), array('q')))
+            if incident_type is not None:
+                postings.append(self._by_incident_type.get(normalize_key(incident_type), array('q')))
+            if incident_location is not None:
+                tokens = location_tokens(incident_location)
+                postings.extend(self._by_incident_token.get(token, array('q')) for token in tokens)
+
+            if not postings:
+                seqs = range(hi - 1, lo - 1, -1)
+                return list(seqs if limit is None else seqs[:limit])
+
+            # Restrict every list to the time range, then drive from the smallest.
+            bounded = []
+            for plist in postings:
+                first, last = _intersect_bounds(plist, lo, hi)
+                if first >= last:
+                    return []
+                bounded.append((last - first, plist, first, last))
+            bounded.sort(key=lambda item: item[0])
+            _, driver, first, last = bounded[0]
+            others = bounded[1:]
+
+            results = []
+            for pos in range(last - 1, first - 1, -1):
+                seq = driver[pos]
+                if all(self._contains(plist, seq, o_first, o_last) for _, plist, o_first, o_last in others):
+                    results.append(seq)
+                    if limit is not None and len(results) >= limit:
+                        break
+            return results
+
+    @staticmethod
+    def _contains(postings: array, seq: int, first: int, last: int) -> bool:
+        pos = bisect.bisect_left(postings, seq, first, last)
+        return pos < last and postings[pos] == seq
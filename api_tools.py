@@ -1,14 +1,31 @@
 import requests
-from config import WEATHER_API_KEY, WEATHER_API_URL, TARGET_CITY, CITY_DATA_API_URL
+from config import (WEATHER_API_KEY, WEATHER_API_URL, TARGET_CITY, CITY_DATA_API_URL,
+                    NEIGHBORHOOD_CENTER, PROXIMITY_RADIUS_M, GAZETTEER_PATH)
+from http_transport import get_transport, is_retryable
+from resilience import get_upstream, CircuitOpenError
+from geo_proximity import Gazetteer, ProximityEngine
 import json
+import math
 
 
-def get_weather_data(city_name: str = TARGET_CITY) -> str:
+def _guarded_get_json(upstream: str, api_url: str, params: dict = None):
+    """
+    GETs JSON through the upstream's circuit breaker, hedging and retry budget
+    (see resilience.py). While the breaker is open the last known payload for the
+    same URL and params is returned instead.
+    """
+    key = (api_url, tuple(sorted((params or {}).items())))
+    return get_upstream(upstream, retryable=is_retryable).call(
+        key, lambda: get_transport().get_json(api_url, params=params))
+
+
+def get_weather_data(city_name: str = TARGET_CITY, api_url: str = WEATHER_API_URL) -> str:
     """
     Fetches current weather data for the specified city.
 
     Args:
         city_name: The city to fetch weather for. Defaults to TARGET_CITY.
+        api_url: The weather endpoint. Defaults to WEATHER_API_URL.
 
     Returns:
         A JSON string containing the raw weather data.
@@ -22,34 +39,41 @@ def get_weather_data(city_name: str = TARGET_CITY) -> str:
     }
 
     try:
-        response = requests.get(WEATHER_API_URL, params=params)
-        response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
+        # Pooled keep-alive transport; raises HTTPError for bad responses (4xx or 5xx)
+        weather = _guarded_get_json('weather', api_url, params=params)
 
         # Return a string representation of the data for the next agent
-        return json.dumps(response.json(), indent=2)
+        return json.dumps(weather)
 
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, CircuitOpenError) as e:
         return json.dumps({"error": f"Failed to fetch weather data: {e}"})
 
 
-def get_city_incident_data() -> str:
+def get_city_incident_data(api_url: str = CITY_DATA_API_URL) -> str:
     """
     Fetches raw data from the city's open data portal (e.g., incidents, roadworks).
+    Uses conditional GETs, so an unchanged feed (304) reuses the previously parsed payload.
+    Slow or failing feeds are hedged, retried within a budget, and served from the
+    last known payload while their circuit breaker is open.
+
+    Args:
+        api_url: The incident feed endpoint. Defaults to CITY_DATA_API_URL.
 
     Returns:
         A JSON string containing the raw incident data.
     """
-    print(f"-> Fetching city incident data from {CITY_DATA_API_URL}...")
+    print(f"-> Fetching city incident data from {api_url}...")
 
     # NOTE: In a real scenario, this API might require specific headers or keys.
     # This example simulates a successful raw data fetch.
 
     try:
-        # Simulate fetching actual data with location/description
-        response = requests.get(CITY_DATA_API_URL)
-        response.raise_for_status()
+        # Fetch actual data with location/description
+        feed = _guarded_get_json('incidents', api_url)
+        if isinstance(feed, list):
+            return json.dumps(feed)
 
-        # Simulate a typical response from a city data API
+        # The placeholder endpoint does not serve a feed yet: simulate a typical response
         simulated_data = [
             {"id": "I101", "type": "ROADWORK", "status": "PLANNED", "location": "Kerkstraat near #25",
              "details": "Major road resurfacing scheduled for tomorrow, 08:00 - 18:00."},
@@ -61,31 +85,53 @@ def get_city_incident_data() -> str:
              "details": "Local market running all day today."}
         ]
 
-        return json.dumps(simulated_data, indent=2)
+        return json.dumps(simulated_data)
 
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, CircuitOpenError) as e:
         return json.dumps({"error": f"Failed to fetch city data: {e}"})
 
 
 
-# Placeholder function for proximity checking
-def check_proximity_score(raw_data: str) -> float:
-    """
-    Simulates checking if an event mentioned in raw_data is close
-    to the neighborhood center (not truly implemented here,
-    but provides a tool for the Analyst Agent to use).
+# Score returned when no location in the data can be geocoded
+UNRESOLVED_PROXIMITY_SCORE = 0.3
+
+_proximity_engine = None
 
-    Returns a float score (0.0 to 1.0) or simply True/False for locality.
-    """
 
-    # In a real implementation, this would parse location (Lat/Lon) from the raw_data
-    # and calculate the distance to the center (e.g., using Haversine formula).
+def get_proximity_engine() -> ProximityEngine:
+    """Returns the engine scoring against the monitored neighborhood, creating it on first use."""
+    global _proximity_engine
+    if _proximity_engine is None:
+        _proximity_engine = ProximityEngine({TARGET_CITY: NEIGHBORHOOD_CENTER}, radius_m=PROXIMITY_RADIUS_M,
+                                            gazetteer=Gazetteer(path=GAZETTEER_PATH))
+    return _proximity_engine
 
-    # For this demonstration, we assume the LLM handles the relevance reasoning
-    # based on the text provided, so this tool is minimized.
 
-    if "Kerkstraat" in raw_data or "Flood" in raw_data:
-        # Assume these events are highly local and critical
-        return 0.9
+def check_proximity_score(raw_data: str) -> float:
+    """
+    Scores how close the events mentioned in raw_data are to the neighborhood center.
 
-    return 0.3  # Assume low proximity for other items
\ No newline at end of file
+    Incident locations are geocoded with the offline gazetteer and scored by
+    haversine distance: 1.0 at NEIGHBORHOOD_CENTER, falling to 0.0 at
+    PROXIMITY_RADIUS_M. raw_data may be a JSON incident list, a data package,
+    a single incident, or a plain location string.
+
+    Returns a float score (0.0 to 1.0): the highest score of any incident.
+    """
+    try:
+        parsed = json.loads(raw_data)
+    except (TypeError, ValueError):
+        parsed = raw_data
+
+    if isinstance(parsed, dict):
+        incidents = parsed.get('raw_incidents', [parsed])
+    elif isinstance(parsed, list):
+        incidents = parsed
+    else:
+        incidents = [{"location": str(parsed)}]
+
+    scores = get_proximity_engine().best_scores([i for i in incidents if isinstance(i, dict)])
+    resolved = [float(score) for score in scores if not math.isnan(score)]  # NaN: not geocoded
+    if not resolved:
+        return UNRESOLVED_PROXIMITY_SCORE
+    return max(resolved)
@@ -0,0 +1,79 @@
+# tools/batching.py - Background thread that drains a queue in batches (group commits, webhook batches)
+
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger('Batching')
+logger.setLevel(logging.INFO)
+
+# Queued by close(): everything before it is handled, then the thread stops
+_STOP = object()
+
+
+class BatchWorker:
+    """
+    Hands queued items to `handle` in batches, on a background thread.
+
+    The thread waits for an item, then keeps collecting until `max_batch` items
+    are waiting or `max_delay_s` has passed since the first one, and calls
+    handle(batch) once for the whole batch. With `max_queue`, put() blocks while
+    the queue is full, which pushes back on producers. close() stops accepting
+    items, handles everything already queued and stops the thread.
+    """
+
+    def __init__(self, handle, max_batch: int, max_delay_s: float, max_queue: int = 0, name: str = 'batch-worker'):
+        self.handle = handle
+        self.max_batch = max(1, int(max_batch))
+        self.max_delay_s = max_delay_s
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, item, timeout: float = None):
+        """
+        Queues one item.
+
+        Raises:
+            queue.Full: The queue stayed full for `timeout` seconds.
+            RuntimeError: The worker is closed.
+        """
+        if self._closed:
+            raise RuntimeError(f"{self.name} is closed.")
+        self._queue.put(item, timeout=timeout)
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def close(self):
+        """Handles everything already queued and stops the thread."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay_s
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self.handle(batch)
+            except Exception as e:
+                # A failing batch must not stop the thread; handlers report their own failures
+                logger.error(f"{self.name} failed to handle a batch of {len(batch)}: {e}", exc_info=True)
@@ -0,0 +1,353 @@
+# benchmarks.py - Reproducible benchmarks for the perceive -> publish pipeline and storage layer
+#
+# Usage:
+#   python benchmarks.py                                  # everything, default sizes
+#   python benchmarks.py --only storage --sizes 1000,100000
+#   python benchmarks.py --latency-ms 50 --output bench.json
+#   python benchmarks.py --only writers --writers 1,4,16   # log vs SQLite backend, N writer processes
+#
+# Results are written as JSON so runs can be diffed between versions.
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import platform
+import argparse
+import datetime
+import tempfile
+import contextlib
+import tracemalloc
+import subprocess
+import multiprocessing
+
+import db_tools
+import api_tools
+from sensor_agent import SensorAgent, DEFAULT_SOURCES, mock_get_ov_updates
+from stub_server import start_stub_server
+from storage_backends import BACKEND_LOG, BACKEND_SQLITE
+from subscriptions import Subscription, SubscriptionIndex
+from records import DataPackage
+from metrics import percentile
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+DEFAULT_WRITERS = [1, 4, 8]
+DEFAULT_SUBSCRIPTIONS = 100000
+DEFAULT_IN_FLIGHT = 5000
+# Records are pre-loaded in chunks of this size (not timed)
+_POPULATE_CHUNK = 10000
+
+
+# --- Helpers ---
+
+def _summarize(name: str, durations: list, **params) -> dict:
+    """Turns a list of per-operation durations (seconds) into a result row."""
+    durations = sorted(durations)
+    n = len(durations)
+    total = sum(durations)
+
+    return {
+        "name": name,
+        "params": params,
+        "n": n,
+        "mean_s": total / n if n else 0.0,
+        "p50_s": percentile(durations, 0.50),
+        "p99_s": percentile(durations, 0.99),
+        "max_s": durations[-1] if n else 0.0,
+        "ops_per_s": n / total if total else 0.0,
+    }
+
+
+def _timed(fn, repeat: int) -> list:
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def sample_package(city: str = "Benchmark City") -> dict:
+    """A package shaped like SensorAgent.perceive output."""
+    return {
+        "fetch_time_utc": datetime.datetime.utcnow().isoformat() + "Z",
+        "monitoring_location": city,
+        "raw_weather": {"source": "WeatherAPI", "city": city, "temperature_c": round(random.uniform(5.0, 25.0), 1),
+                        "condition": random.choice(["Sunny", "Partly Cloudy", "Heavy Rain", "Foggy"]),
+                        "wind_speed_kph": random.randint(5, 40)},
+        "raw_incidents": [
+            {"type": "Roadwork", "location": "Main Street, near City Hall", "details": "Lane closure until 18:00.",
+             "impact": "High"},
+            {"type": "Minor Incident", "location": "Kerkstraat 45",
+             "details": "Police investigating a minor fender-bender.", "impact": "Medium"},
+        ],
+        "raw_ov_updates": [],
+        "partial_sources": {},
+    }
+
+
+def _populate(store, count: int):
+    now = datetime.datetime.now()
+    written = 0
+    while written < count:
+        chunk = min(_POPULATE_CHUNK, count - written)
+        records = [{
+            "fetch_timestamp": (now + datetime.timedelta(microseconds=written + i)).isoformat(),
+            "raw_payload": sample_package(f"City {(written + i) % 500}"),
+            "published_by": "Benchmark",
+            "id": f"bench{written + i}",
+        } for i in range(chunk)]
+        store.append_many(records)
+        written += chunk
+    store.flush()
+
+
+# --- Benchmarks ---
+
+def bench_perceive(latency_s: float, jitter_s: float, repeat: int) -> list:
+    """SensorAgent.perceive against the local stub server (weather + incidents over HTTP)."""
+    server, base_url = start_stub_server(latency_s=latency_s, jitter_s=jitter_s)
+    try:
+        sources = {
+            "weather": ("raw_weather",
+                        lambda city: json.loads(api_tools.get_weather_data(city, api_url=base_url + '/weather')), dict),
+            "incidents": ("raw_incidents",
+                          lambda city: json.loads(api_tools.get_city_incident_data(api_url=base_url + '/incidents')),
+                          list),
+            "ov_updates": ("raw_ov_updates", mock_get_ov_updates, list),
+        }
+        sensor = SensorAgent(sources=sources)
+        sensor.perceive("Warmup")
+        durations = _timed(lambda: sensor.perceive("Benchmark City"), repeat)
+        return [_summarize("sensor.perceive", durations, latency_ms=latency_s * 1000, jitter_ms=jitter_s * 1000)]
+    finally:
+        server.shutdown()
+
+
+def bench_storage(sizes: list, repeat: int, work_dir: str) -> list:
+    """save_presentation_data and fetch_recent_data against stores of increasing size."""
+    results = []
+    for size in sizes:
+        log_dir = os.path.join(work_dir, f"store_{size}")
+        db_tools.configure_storage(log_dir)
+        db_tools.initialize_db()
+        _populate(db_tools.get_store(), size)
+
+        package = sample_package()
+        durations = _timed(lambda: db_tools.save_presentation_data(package), repeat)
+        results.append(_summarize("db_tools.save_presentation_data", durations, stored_records=size))
+
+        durations = _timed(lambda: db_tools.fetch_recent_data(limit=10), repeat)
+        results.append(_summarize("db_tools.fetch_recent_data", durations, stored_records=size, limit=10))
+
+        results.append({"name": "store.size", "params": {"stored_records": size},
+                        "bytes": db_tools.get_store().size_bytes,
+                        "bytes_per_record": db_tools.get_store().size_bytes / max(1, db_tools.get_store().count)})
+        db_tools.configure_storage(os.path.join(work_dir, "idle"))
+        shutil.rmtree(log_dir, ignore_errors=True)
+    return results
+
+
+def bench_cycle(repeat: int, work_dir: str) -> list:
+    """run_neighborhood_watch_cycle end to end (mocked sources, real storage)."""
+    db_tools.configure_storage(os.path.join(work_dir, "cycle"))
+    db_tools.initialize_db()
+    import orchestrator  # builds the module-level agents
+    # A plain sources mapping polls every source each cycle; the default agent's polling
+    # intervals would serve all but the first cycle from its cache
+    sensor = SensorAgent(sources=DEFAULT_SOURCES)
+    try:
+        durations = _timed(lambda: orchestrator.run_neighborhood_watch_cycle("Benchmark City", sensor=sensor), repeat)
+    finally:
+        sensor.close()
+    return [_summarize("orchestrator.run_neighborhood_watch_cycle", durations)]
+
+
+def _writer_process(backend: str, log_dir: str, count: int, start_barrier):
+    logging.disable(logging.INFO)
+    with contextlib.redirect_stdout(sys.stderr):
+        db_tools.configure_storage(log_dir, backend)
+        db_tools.initialize_db()
+        package = sample_package(f"Writer {os.getpid()}")
+        start_barrier.wait()
+        for _ in range(count):
+            db_tools.save_presentation_data(package)
+        db_tools.close_db()
+
+
+def bench_writers(writer_counts: list, records_per_writer: int, work_dir: str) -> list:
+    """N processes calling save_presentation_data concurrently, per storage backend."""
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for backend in (BACKEND_LOG, BACKEND_SQLITE):
+        for writers in writer_counts:
+            log_dir = os.path.join(work_dir, f"writers_{backend}_{writers}")
+            start_barrier = context.Barrier(writers + 1)
+            processes = [context.Process(target=_writer_process,
+                                         args=(backend, log_dir, records_per_writer, start_barrier))
+                         for _ in range(writers)]
+            for process in processes:
+                process.start()
+            start_barrier.wait()
+            started = time.perf_counter()
+            for process in processes:
+                process.join()
+            elapsed = time.perf_counter() - started
+
+            # Every record must be there and readable: no lost updates, no torn writes
+            db_tools.configure_storage(log_dir, backend)
+            stored = sum(1 for _ in db_tools.get_store().scan())
+            expected = writers * records_per_writer
+            results.append({
+                "name": "db_tools.save_presentation_data.concurrent",
+                "params": {"backend": backend, "writers": writers, "records_per_writer": records_per_writer},
+                "elapsed_s": elapsed,
+                "records_per_s": expected / elapsed if elapsed else 0.0,
+                "stored_records": stored,
+                "intact": stored == expected,
+            })
+            db_tools.configure_storage(os.path.join(work_dir, "idle"))
+            shutil.rmtree(log_dir, ignore_errors=True)
+    return results
+
+
+def bench_subscriptions(count: int, repeat: int) -> list:
+    """Building the subscription index and matching packages against `count` subscriptions."""
+    incident_types = ["Roadwork", "Event", "Minor Incident", "OV Update"]
+    keywords = ["closure", "police", "delay", "festival", "traffic"]
+    subscriptions = [
+        # Spread over central Amsterdam, where the sample incidents geocode
+        Subscription(f"bench{i}", random.uniform(52.33, 52.40), random.uniform(4.84, 4.94),
+                     random.choice([300.0, 800.0, 1500.0, 3000.0]),
+                     random.sample(incident_types, random.randint(0, 2)), random.sample(keywords, random.randint(0, 2)))
+        for i in range(count)
+    ]
+    index = SubscriptionIndex()
+    index.add_many(subscriptions)
+    durations = _timed(index._build, 1)
+    results = [_summarize("subscriptions.build_index", durations, subscriptions=count)]
+
+    package = sample_package()
+    matches = len(index.match(package))
+    durations = _timed(lambda: index.match(package), repeat)
+    results.append(_summarize("subscriptions.match_package", durations, subscriptions=count,
+                              incidents=len(package["raw_incidents"]), matches=matches))
+    return results
+
+
+def _allocated_bytes(build) -> int:
+    tracemalloc.start()
+    try:
+        kept = build()
+        return tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+        del kept
+
+
+def bench_records(count: int, repeat: int) -> list:
+    """
+    Memory and (de)serialization cost of `count` in-flight packages, as dicts vs compact
+    records. Compact json.dumps of the dicts is the baseline the others are compared with.
+    """
+    # Round-trip through JSON so strings are fresh per package, as they are when parsed from an API
+    packages = [json.loads(json.dumps(sample_package(f"City {i % 100}"))) for i in range(count)]
+    records = [DataPackage.from_dict(package) for package in packages]
+    rounds = max(1, repeat // 50)
+    results = []
+    for kind, items, encode, decode in (
+            ("dict_compact", packages, lambda p: json.dumps(p, separators=(',', ':')), json.loads),
+            ("dict_indent2", packages, lambda p: json.dumps(p, indent=2), json.loads),
+            ("record", records, lambda r: json.dumps(r.to_dict(), separators=(',', ':')),
+             lambda text: DataPackage.from_dict(json.loads(text)))):
+        texts = [encode(item) for item in items]
+        results.append(_summarize(f"records.encode.{kind}", _timed(lambda: [encode(item) for item in items], rounds),
+                                  packages=count, bytes=sum(len(text) for text in texts)))
+        results.append(_summarize(f"records.decode.{kind}", _timed(lambda: [decode(text) for text in texts], rounds),
+                                  packages=count,
+                                  in_flight_bytes=_allocated_bytes(lambda: [decode(text) for text in texts])))
+    return results
+
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_benchmarks(only: list = None, sizes: list = None, repeat: int = 200, latency_s: float = 0.02,
+                   jitter_s: float = 0.0, seed: int = 1234, writers: list = None,
+                   subscriptions: int = DEFAULT_SUBSCRIPTIONS) -> dict:
+    """Runs the selected benchmark groups and returns the JSON-serializable report."""
+    random.seed(seed)
+    only = only or ["perceive", "storage", "cycle", "writers", "subscriptions", "records"]
+    sizes = sizes or DEFAULT_SIZES
+    writers = writers or DEFAULT_WRITERS
+    work_dir = tempfile.mkdtemp(prefix='nw_bench_')
+    original_log_dir = db_tools.DB_LOG_DIR
+    original_backend = db_tools.STORAGE_BACKEND
+    results = []
+    # api_tools prints progress lines; keep stdout clean for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            if "perceive" in only:
+                results += bench_perceive(latency_s, jitter_s, max(1, repeat // 10))
+            if "storage" in only:
+                results += bench_storage(sizes, repeat, work_dir)
+            if "cycle" in only:
+                results += bench_cycle(repeat, work_dir)
+            if "writers" in only:
+                results += bench_writers(writers, repeat, work_dir)
+            if "subscriptions" in only:
+                results += bench_subscriptions(subscriptions, repeat)
+            if "records" in only:
+                results += bench_records(DEFAULT_IN_FLIGHT, repeat)
+        finally:
+            db_tools.configure_storage(original_log_dir, original_backend)
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return {"environment": _environment(), "results": results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Neighborhood Watch benchmarks")
+    parser.add_argument('--only', help="Comma-separated groups: perceive,storage,cycle,writers,subscriptions,records")
+    parser.add_argument('--sizes', help="Comma-separated stored-record counts for the storage group")
+    parser.add_argument('--writers', help="Comma-separated writer process counts for the writers group")
+    parser.add_argument('--subscriptions', type=int, default=DEFAULT_SUBSCRIPTIONS,
+                        help="Subscription count for the subscriptions group")
+    parser.add_argument('--repeat', type=int, default=200, help="Timed operations per benchmark")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Stub server latency per request")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Extra random stub latency per request")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    # Keep per-operation INFO logging out of the timings
+    logging.disable(logging.INFO)
+
+    report = run_benchmarks(
+        only=args.only.split(',') if args.only else None,
+        sizes=[int(size) for size in args.sizes.split(',')] if args.sizes else None,
+        repeat=args.repeat,
+        latency_s=args.latency_ms / 1000.0,
+        jitter_s=args.jitter_ms / 1000.0,
+        writers=[int(count) for count in args.writers.split(',')] if args.writers else None,
+        subscriptions=args.subscriptions,
+    )
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(report['results'])} results to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
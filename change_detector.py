@@ -0,0 +1,169 @@
+# tools/change_detector.py - Content hashing and delta computation between consecutive cycles
+
+import json
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger('ChangeDetector')
+logger.setLevel(logging.INFO)
+
+# --- Record kinds ---
+# A snapshot holds the full package in "raw_payload" (the original record shape);
+# a delta holds only what changed since the previous record of the same location.
+KIND_SNAPSHOT = "snapshot"
+KIND_DELTA = "delta"
+
+# Package blocks compared as a whole: package key -> sensor source name
+_BLOCKS = {"raw_weather": "weather", "raw_ov_updates": "ov_updates"}
+
+
+def content_hash(value) -> str:
+    """Stable hash of any JSON-serializable value."""
+    encoded = json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def incident_key(incident: dict) -> str:
+    """Identity of an incident across cycles: its feed id, else its type and location."""
+    if incident.get('id'):
+        return str(incident['id'])
+    return content_hash([str(incident.get('type', '')).casefold(), str(incident.get('location', '')).casefold()])
+
+
+def record_kind(record: dict) -> str:
+    """The kind of a stored record; records written before deltas existed are snapshots."""
+    return record.get('record_kind', KIND_SNAPSHOT)
+
+
+def record_incidents(record: dict) -> list:
+    """Incidents carried by a stored record: all of them for a snapshot, new/updated ones for a delta."""
+    if record_kind(record) == KIND_DELTA:
+        delta = record.get('delta') or {}
+        return list(delta.get('incidents_added') or []) + list(delta.get('incidents_updated') or [])
+    return list((record.get('raw_payload') or {}).get('raw_incidents') or [])
+
+
+def record_location(record: dict):
+    """The monitoring_location of a stored record of either kind."""
+    body = record.get('delta') if record_kind(record) == KIND_DELTA else record.get('raw_payload')
+    return (body or {}).get('monitoring_location')
+
+
+class _LocationState:
+    __slots__ = ('block_hashes', 'incident_hashes', 'deltas_since_snapshot')
+
+    def __init__(self, block_hashes: dict, incident_hashes: dict):
+        self.block_hashes = block_hashes
+        self.incident_hashes = incident_hashes
+        self.deltas_since_snapshot = 0
+
+
+class ChangeDetector:
+    """
+    Tracks the content hashes of the last published package per monitoring_location
+    and turns each new package into a snapshot, a delta, or nothing.
+
+    A location's first package (in this process) and every `snapshot_every`-th change
+    after it are stored as full snapshots, which bounds how many deltas a reader has
+    to replay to rebuild a package.
+    """
+
+    def __init__(self, snapshot_every: int = 24):
+        self.snapshot_every = snapshot_every
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def forget(self, location: str):
+        """Drops a location's state, e.g. after a failed write, so its next package is a snapshot."""
+        with self._lock:
+            self._states.pop(location, None)
+
+    def forget_all(self):
+        """Drops every location's state, so each location's next package is a snapshot."""
+        with self._lock:
+            self._states.clear()
+
+    def diff(self, package: dict) -> tuple:
+        """
+        Compares a package with the previous one of its location.
+
+        Returns:
+            (KIND_SNAPSHOT, package), (KIND_DELTA, delta) or (None, None) when nothing changed.
+            A delta has "monitoring_location", "fetch_time_utc", any changed blocks under
+            their package keys, and "incidents_added" / "incidents_updated" / "incidents_resolved".
+        """
+        location = package.get('monitoring_location')
+        partial = package.get('partial_sources') or {}
+        block_hashes = {key: content_hash(package.get(key)) for key in _BLOCKS}
+        incident_hashes = {}
+        incidents_by_key = {}
+        for incident in package.get('raw_incidents') or []:
+            if isinstance(incident, dict) and 'error' not in incident:
+                key = incident_key(incident)
+                incident_hashes[key] = content_hash(incident)
+                incidents_by_key[key] = incident
+
+        with self._lock:
+            state = self._states.get(location)
+            if state is None or state.deltas_since_snapshot + 1 >= self.snapshot_every:
+                self._states[location] = _LocationState(block_hashes, incident_hashes)
+                return KIND_SNAPSHOT, package
+
+            delta = {}
+            for key, source in _BLOCKS.items():
+                # A source that failed or timed out this cycle says nothing about change
+                if source not in partial and block_hashes[key] != state.block_hashes.get(key):
+                    delta[key] = package.get(key)
+                    state.block_hashes[key] = block_hashes[key]
+
+            if 'incidents' not in partial:
+                added = [incidents_by_key[k] for k in incident_hashes if k not in state.incident_hashes]
+                updated = [incidents_by_key[k] for k, h in incident_hashes.items()
+                           if k in state.incident_hashes and state.incident_hashes[k] != h]
+                resolved = [k for k in state.incident_hashes if k not in incident_hashes]
+                if added:
+                    delta['incidents_added'] = added
+                if updated:
+                    delta['incidents_updated'] = updated
+                if resolved:
+                    delta['incidents_resolved'] = resolved
+                state.incident_hashes = incident_hashes
+
+            if not delta:
+                return None, None
+
+            state.deltas_since_snapshot += 1
+            delta['monitoring_location'] = location
+            delta['fetch_time_utc'] = package.get('fetch_time_utc')
+            if partial:
+                delta['partial_sources'] = partial
+            cached = package.get('cached_sources')
+            if cached:
+                delta['cached_sources'] = cached
+            return KIND_DELTA, delta
+
+
+def apply_delta(package: dict, delta: dict) -> dict:
+    """
+    Applies a stored delta to a full package and returns the updated package.
+    The input package is not modified.
+    """
+    rebuilt = dict(package)
+    for key in _BLOCKS:
+        if key in delta:
+            rebuilt[key] = delta[key]
+    rebuilt['fetch_time_utc'] = delta.get('fetch_time_utc', rebuilt.get('fetch_time_utc'))
+    rebuilt['partial_sources'] = delta.get('partial_sources', {})
+    rebuilt['cached_sources'] = delta.get('cached_sources', {})
+
+    incidents = {}
+    for incident in rebuilt.get('raw_incidents') or []:
+        if isinstance(incident, dict) and 'error' not in incident:
+            incidents[incident_key(incident)] = incident
+    for key in delta.get('incidents_resolved') or []:
+        incidents.pop(key, None)
+    for incident in (delta.get('incidents_updated') or []) + (delta.get('incidents_added') or []):
+        incidents[incident_key(incident)] = incident
+    rebuilt['raw_incidents'] = list(incidents.values())
+    return rebuilt
@@ -0,0 +1,336 @@
+# tools/columnar_store.py - Flattened, typed Parquet tables of alert history for pandas dashboards
+
+import os
+import glob
+import time
+import shutil
+import logging
+import datetime
+import threading
+import contextlib
+from change_detector import KIND_DELTA, record_kind, record_location, record_incidents
+
+# pyarrow is optional: without it the columnar stage is simply disabled.
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# fcntl is POSIX-only; without it only one process should use the tables.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger('ColumnarStore')
+logger.setLevel(logging.INFO)
+
+WEATHER_TABLE = 'weather'
+INCIDENTS_TABLE = 'incidents'
+# Sequence number of the first log record not yet written to Parquet
+WATERMARK_FILE = 'watermark'
+# Held while part files and the watermark change, and while they are read
+LOCK_FILE = 'tables.lock'
+
+
+def _schemas() -> dict:
+    # Low-cardinality strings are dictionary-encoded: stored once per file and
+    # loaded into pandas as Categoricals.
+    category = pa.dictionary(pa.int32(), pa.string())
+    return {
+        WEATHER_TABLE: pa.schema([
+            ("record_id", pa.string()),
+            ("fetch_timestamp", pa.timestamp('us')),
+            ("monitoring_location", category),
+            ("temperature_c", pa.float64()),
+            ("condition", category),
+            ("wind_speed_kph", pa.float64()),
+        ]),
+        INCIDENTS_TABLE: pa.schema([
+            ("record_id", pa.string()),
+            ("fetch_timestamp", pa.timestamp('us')),
+            ("monitoring_location", category),
+            ("record_kind", category),
+            ("type", category),
+            ("location", category),
+            ("impact", category),
+            ("status", category),
+            ("details", pa.string()),
+        ]),
+    }
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _timestamp(value):
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def weather_row(record: dict):
+    """Flattens the weather block of a stored record, or None if the record carries none."""
+    body = record.get('delta') if record_kind(record) == KIND_DELTA else record.get('raw_payload')
+    weather = (body or {}).get('raw_weather')
+    if not isinstance(weather, dict) or not weather or 'error' in weather:
+        return None
+    # Accept both the mocked shape and OpenWeatherMap's nested shape
+    temperature = weather.get('temperature_c', (weather.get('main') or {}).get('temp'))
+    condition = weather.get('condition')
+    if condition is None and weather.get('weather'):
+        condition = (weather['weather'][0] or {}).get('main')
+    wind = weather.get('wind_speed_kph')
+    if wind is None and (weather.get('wind') or {}).get('speed') is not None:
+        wind = _float(weather['wind']['speed']) * 3.6
+    return {
+        "record_id": record.get('id'),
+        "fetch_timestamp": _timestamp(record.get('fetch_timestamp')),
+        "monitoring_location": record_location(record),
+        "temperature_c": _float(temperature),
+        "condition": condition,
+        "wind_speed_kph": _float(wind),
+    }
+
+
+def incident_rows(record: dict) -> list:
+    """Flattens the incidents of a stored record (all of them, or the new/updated ones of a delta)."""
+    rows = []
+    for incident in record_incidents(record):
+        if not isinstance(incident, dict) or 'error' in incident:
+            continue
+        rows.append({
+            "record_id": record.get('id'),
+            "fetch_timestamp": _timestamp(record.get('fetch_timestamp')),
+            "monitoring_location": record_location(record),
+            "record_kind": record_kind(record),
+            "type": incident.get('type'),
+            "location": incident.get('location'),
+            "impact": incident.get('impact'),
+            "status": incident.get('status'),
+            "details": incident.get('details'),
+        })
+    return rows
+
+
+class ColumnarStore:
+    """
+    Weather time-series and incidents tables kept alongside the primary log store.
+
+    Rows are buffered with the sequence number of their log record and written out
+    as a new Parquet part file every `flush_rows` rows, or on the first append
+    `flush_interval_s` after the oldest unwritten one (and on flush()), so updates
+    are incremental and the watermark keeps moving when few records arrive.
+    compact() merges the parts of a table once there are more than `max_parts`.
+    Reads memory-map the part files and include rows still in the buffer.
+
+    A watermark file records how far into the log the Parquet files reach. Readers
+    call catch_up() with the log records past it, so the tables follow appends made
+    by any process, and rows still buffered when a process died are recovered.
+    Several processes may share the tables: part files and the watermark only change
+    under a file lock, and a flush writes only the buffered rows past the current
+    watermark, so rows another process already wrote are never duplicated.
+    """
+
+    def __init__(self, directory: str, flush_rows: int = 5000, max_parts: int = 64,
+                 flush_interval_s: float = 300.0):
+        if pa is None:
+            raise ImportError("pyarrow is required for the columnar store.")
+        self.directory = directory
+        self.flush_rows = flush_rows
+        self.flush_interval_s = flush_interval_s
+        self.max_parts = max_parts
+        self._schemas = _schemas()
+        # name -> [(seq, row)], in log order
+        self._buffers = {name: [] for name in self._schemas}
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+        self._part_counter = 0
+        self._buffered_upto = self.watermark
+        # Monotonic time of the oldest append not yet written out (None when there is none)
+        self._pending_since = None
+
+    def _table_dir(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _parts(self, name: str) -> list:
+        return sorted(glob.glob(os.path.join(self._table_dir(name), 'part-*.parquet')))
+
+    @contextlib.contextmanager
+    def _process_locked(self):
+        """Holds the cross-process lock on the tables (re-entrant; call with self._lock held)."""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._lock_file = open(os.path.join(self.directory, LOCK_FILE), 'a')
+        if not self._lock_depth:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        self._lock_depth += 1
+        try:
+            yield
+        finally:
+            self._lock_depth -= 1
+            if not self._lock_depth:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    @property
+    def watermark(self) -> int:
+        """Sequence number of the first log record that is not yet in the Parquet files."""
+        try:
+            with open(os.path.join(self.directory, WATERMARK_FILE), 'r') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    @property
+    def next_seq(self) -> int:
+        """Sequence number of the first log record neither written out nor buffered here."""
+        with self._lock:
+            return max(self._buffered_upto, self.watermark)
+
+    def _write_watermark(self, seq: int):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, WATERMARK_FILE)
+        with open(path + '.tmp', 'w') as f:
+            f.write(str(seq))
+        os.replace(path + '.tmp', path)
+
+    # --- Writes ---
+
+    def catch_up(self, scanned_records) -> int:
+        """
+        Buffers log records this store does not have yet, given a store.scan(next_seq)
+        iterator of (seq, record). Returns the number of records taken.
+        """
+        with self._lock:
+            start = self.next_seq
+            count = 0
+            for seq, record in scanned_records:
+                if seq >= start:
+                    self.append([seq], [record])
+                    count += 1
+            if count:
+                logger.debug(f"Caught up {count} records into the columnar tables.")
+            return count
+
+    def append(self, seqs: list, records: list):
+        """
+        Buffers the flattened rows of newly published records.
+
+        Args:
+            seqs: Sequence numbers of the records, ascending.
+            records: Stored records, in log order.
+        """
+        with self._lock:
+            for seq, record in zip(seqs, records):
+                row = weather_row(record)
+                if row is not None:
+                    self._buffers[WEATHER_TABLE].append((seq, row))
+                self._buffers[INCIDENTS_TABLE].extend((seq, row) for row in incident_rows(record))
+            if seqs:
+                self._buffered_upto = max(self._buffered_upto, seqs[-1] + 1)
+                if self._pending_since is None:
+                    self._pending_since = time.monotonic()
+            if (any(len(rows) >= self.flush_rows for rows in self._buffers.values())
+                    or (self._pending_since is not None and self.flush_interval_s is not None
+                        and time.monotonic() - self._pending_since >= self.flush_interval_s)):
+                self.flush()
+
+    def flush(self):
+        """Writes the buffered rows past the watermark as new part files."""
+        with self._lock, self._process_locked():
+            written_upto = self.watermark
+            for name, entries in self._buffers.items():
+                rows = [row for seq, row in entries if seq >= written_upto]
+                if rows:
+                    self._write_part(name, self._to_table(name, rows))
+                self._buffers[name] = []
+                if len(self._parts(name)) > self.max_parts:
+                    self.compact(name)
+            if self._buffered_upto > written_upto:
+                self._write_watermark(self._buffered_upto)
+            self._pending_since = None
+
+    def _to_table(self, name: str, rows: list):
+        return pa.Table.from_pylist(rows, schema=self._schemas[name])
+
+    def _write_part(self, name: str, table):
+        os.makedirs(self._table_dir(name), exist_ok=True)
+        self._part_counter += 1
+        part_name = f"part-{time.time_ns():020d}-{os.getpid()}-{self._part_counter:06d}.parquet"
+        final_path = os.path.join(self._table_dir(name), part_name)
+        # Write then rename, so readers never see a half-written part
+        pq.write_table(table, final_path + '.tmp', compression='zstd')
+        os.replace(final_path + '.tmp', final_path)
+
+    def compact(self, name: str):
+        """Merges every part file of a table into one."""
+        with self._lock, self._process_locked():
+            parts = self._parts(name)
+            if len(parts) < 2:
+                return
+            merged = pa.concat_tables([pq.read_table(path, memory_map=True) for path in parts])
+            # The merged part is named after all existing parts, so file order stays chronological
+            self._write_part(name, merged)
+            for path in parts:
+                os.remove(path)
+            logger.info(f"Compacted {len(parts)} parts of the {name} table.")
+
+    def rebuild(self, scanned_records):
+        """Drops both tables and rebuilds them from a store.scan() iterator of (seq, record)."""
+        with self._lock, self._process_locked():
+            for name in self._schemas:
+                shutil.rmtree(self._table_dir(name), ignore_errors=True)
+                self._buffers[name] = []
+            self._write_watermark(0)
+            self._buffered_upto = 0
+            self._pending_since = None
+            count = 0
+            for seq, record in scanned_records:
+                self.append([seq], [record])
+                count += 1
+            self.flush()
+            logger.info(f"Rebuilt columnar tables from {count} records.")
+
+    def close(self):
+        """Writes out the buffer and releases the lock file."""
+        with self._lock:
+            self.flush()
+            if self._lock_file is not None and not self._lock_depth:
+                self._lock_file.close()
+                self._lock_file = None
+
+    # --- Reads ---
+
+    def load_table(self, name: str):
+        """The full table as a pyarrow Table (memory-mapped parts plus buffered rows)."""
+        with self._lock, self._process_locked():
+            written_upto = self.watermark
+            tables = [pq.read_table(path, memory_map=True) for path in self._parts(name)]
+            # Buffered rows another process has written out meanwhile are already in the parts
+            rows = [row for seq, row in self._buffers[name] if seq >= written_upto]
+            if rows:
+                tables.append(self._to_table(name, rows))
+        if not tables:
+            return self._schemas[name].empty_table()
+        return pa.concat_tables(tables).unify_dictionaries()
+
+    def load_frame(self, name: str):
+        """
+        The full table as a pandas DataFrame. Dictionary columns become Categoricals
+        and numeric columns are handed over without copying.
+        """
+        return self.load_table(name).to_pandas(split_blocks=True, self_destruct=True)
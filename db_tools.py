@@ -1,34 +1,427 @@
-# tools/db_tools.py - Updated to use local JSON file storage (No Firestore)
+# tools/db_tools.py - Updated to use an append-only segmented log store (No Firestore)
 
 import os
 import json
 import datetime
 import logging
+import threading
+import collections
+from log_store import NEWEST_FIRST, OLDEST_FIRST, encode_record, decode_record
+from storage_backends import StorageBackend, open_backend
+from config import STORAGE_BACKEND, RETENTION_SEGMENT_DAYS, RETENTION_DAILY_DAYS
+from alert_index import AlertIndex, incident_matches
+from metrics import STORE_BYTES, STORE_RECORDS
+from change_detector import (ChangeDetector, KIND_SNAPSHOT, KIND_DELTA, record_kind, record_incidents,
+                             record_location, apply_delta)
+from columnar_store import ColumnarStore, WEATHER_TABLE, INCIDENTS_TABLE, pa
+from retention import RollupStore, RetentionCompactor
+from aggregates import DashboardAggregates
 
 # --- Configuration ---
-# File path for persistent storage
+# Legacy single-file storage; its records are imported into the log store once.
 DB_FILE_PATH = 'GoogleCloudHackathon/data/alerts.json'
+# Directory holding the segmented log (or SQLite database) that replaces the single JSON file
+DB_LOG_DIR = 'GoogleCloudHackathon/data/alerts_log'
+# In delta publishing, every Nth change of a location is stored as a full snapshot
+DELTA_SNAPSHOT_EVERY = 24
+# Parquet tables (weather time-series, incidents) for dashboards live in this
+# subdirectory of DB_LOG_DIR; buffered rows are written out every N rows, or once
+# the oldest of them has waited this many seconds
+COLUMNAR_SUBDIR = 'columnar'
+COLUMNAR_FLUSH_ROWS = 5000
+COLUMNAR_FLUSH_INTERVAL_S = 300
+# Hourly/daily rollups of records dropped by retention live in this subdirectory
+ROLLUP_SUBDIR = 'rollups'
+# Newest records kept in memory for fetch_recent_data
+RECENT_CACHE_SIZE = 200
+# Materialized dashboard aggregates live in this subdirectory: distinct incidents over a
+# rolling window, and hourly buckets for trends; they are persisted every N applied records
+AGGREGATES_SUBDIR = 'aggregates'
+AGGREGATE_WINDOW_HOURS = 24
+AGGREGATE_TREND_HOURS = 168
+AGGREGATES_SAVE_EVERY = 500
 logger = logging.getLogger('DBTools')
 logger.setLevel(logging.INFO)
 
+_store = None
+_index = None
+_index_lock = threading.Lock()
+_columnar = None
+_columnar_lock = threading.Lock()
+_rollups = None
+_compactor = None
+_aggregates = None
+_aggregates_unsaved = 0
+_aggregates_lock = threading.RLock()
+_initialized = False
 
-def initialize_db():
+# Read cache of the newest results, newest first, as (seq, encoded result) pairs. Results
+# are kept serialized, so callers and publishers never share (and mutate) them. It
+# reflects the store up to (excluding) _recent_upto; None means it has to be loaded.
+_recent = collections.deque()
+_recent_upto = None
+_recent_lock = threading.Lock()
+_detector = ChangeDetector(snapshot_every=DELTA_SNAPSHOT_EVERY)
+
+# Read at scrape time, so the write path pays nothing for them
+STORE_BYTES.set_function(lambda: _store.size_bytes if _store is not None else 0)
+STORE_RECORDS.set_function(lambda: _store.count if _store is not None else 0)
+
+
+def configure_storage(log_dir: str, backend: str = None):
     """
-    Initializes the local file system storage.
-    Creates the necessary directory and the data file if it doesn't exist.
+    Points the module at another storage directory (closing the current store), e.g. for benchmarks.
+
+    Args:
+        log_dir: Directory for the store and its side tables.
+        backend: "log" or "sqlite"; keeps the current backend if omitted.
+    """
+    global DB_LOG_DIR, STORAGE_BACKEND, _store, _index, _columnar, _rollups, _aggregates, _initialized
+    close_db()
+    DB_LOG_DIR = log_dir
+    STORAGE_BACKEND = backend or STORAGE_BACKEND
+    _store = None
+    _index = None
+    _columnar = None
+    _rollups = None
+    _aggregates = None
+    _initialized = False
+    _invalidate_recent()
+    # Delta chains belong to the previous store
+    _detector.forget_all()
+
+
+def get_store() -> StorageBackend:
+    """Returns the process-wide store (of the STORAGE_BACKEND kind), creating it on first use."""
+    global _store
+    if _store is None:
+        _store = open_backend(STORAGE_BACKEND, DB_LOG_DIR)
+    return _store
+
+
+def get_index() -> AlertIndex:
+    """
+    Returns the secondary index over the store, building it from a scan on first use.
+    Every call first indexes the records appended since (by any process), so queries
+    never miss recent writes.
+    """
+    global _index
+    store = get_store()
+    with _index_lock:
+        # Picks up appends (and retention drops) of other processes
+        store.refresh()
+        index = _index
+        if index is not None and (index.first_seq < store.first_seq or index.next_seq > store.next_seq):
+            # Records it refers to were dropped, or the store was replaced: rebuild
+            index = None
+        if index is None:
+            index = AlertIndex()
+            index.build(store.scan(store.first_seq))
+        elif index.next_seq < store.next_seq:
+            try:
+                for seq, record in store.scan(index.next_seq):
+                    index.add(seq, record)
+            except ValueError as e:
+                logger.warning(f"Rebuilding alert index: {e}")
+                index = AlertIndex()
+                index.build(store.scan(store.first_seq))
+        _index = index
+        return index
+
+
+def _index_appended(seqs: list, records: list):
+    """Keeps an already-built index in step with this process's appends."""
+    global _index
+    if not seqs:
+        return
+    with _index_lock:
+        if _index is None or _index.next_seq != seqs[0]:
+            return  # not built, or behind: the next query catches up from the store
+        try:
+            for seq, record in zip(seqs, records):
+                _index.add(seq, record)
+        except ValueError as e:
+            # The index fell out of step with the store; rebuild it on the next query.
+            logger.warning(f"Discarding alert index: {e}")
+            _index = None
+
+
+def get_columnar():
     """
+    Returns the Parquet tables kept alongside the store, creating them on first use.
+    Every call first catches up on records appended since (by any process), so the
+    tables never lag the log. Returns None when pyarrow is not installed.
+    """
+    global _columnar
+    if pa is None:
+        return None
+    store = get_store()
+    with _columnar_lock:
+        if _columnar is None:
+            _columnar = ColumnarStore(os.path.join(DB_LOG_DIR, COLUMNAR_SUBDIR), flush_rows=COLUMNAR_FLUSH_ROWS,
+                                      flush_interval_s=COLUMNAR_FLUSH_INTERVAL_S)
+        # Picks up appends of other processes (e.g. the orchestrator)
+        store.refresh()
+        if _columnar.next_seq < store.next_seq:
+            _columnar.catch_up(store.scan(_columnar.next_seq))
+        return _columnar
+
+
+def _columnar_appended(seqs: list, records: list):
+    """
+    Feeds this process's appends to the Parquet tables, if they are loaded and in step.
+    Loading them (and catching up from the log) is left to startup (load_columnar())
+    or the first dashboard read, so it never lands on a save.
+    """
+    if _columnar is None or not seqs:
+        return
     try:
-        # 1. Create the data directory if it doesn't exist
-        os.makedirs(os.path.dirname(DB_FILE_PATH), exist_ok=True)
+        with _columnar_lock:
+            if _columnar.next_seq != seqs[0]:
+                return  # behind: the next read catches up from the store
+            _columnar.append(seqs, records)
+    except Exception as e:
+        # The log stays authoritative; the missed rows are caught up from it on the next read
+        logger.warning(f"Failed to update columnar tables: {e}")
 
-        # 2. Check if the file exists and initialize it as an empty JSON list if not
-        if not os.path.exists(DB_FILE_PATH) or os.path.getsize(DB_FILE_PATH) == 0:
-            with open(DB_FILE_PATH, 'w') as f:
-                json.dump([], f)
-            logger.info(f"Local database file created at: {DB_FILE_PATH}")
-        else:
-            logger.info(f"Local database file already exists at: {DB_FILE_PATH}")
 
+def get_aggregates() -> DashboardAggregates:
+    """
+    Returns the materialized dashboard aggregates, loading them on first use and
+    catching up on records appended since they were last saved (a full scan if
+    the file was lost).
+    """
+    global _aggregates
+    with _aggregates_lock:
+        if _aggregates is None:
+            aggregates = DashboardAggregates(os.path.join(DB_LOG_DIR, AGGREGATES_SUBDIR),
+                                             window_hours=AGGREGATE_WINDOW_HOURS, trend_hours=AGGREGATE_TREND_HOURS)
+            caught_up = _catch_up_aggregates(aggregates)
+            if caught_up:
+                logger.info(f"Caught up {caught_up} records into the dashboard aggregates.")
+            _aggregates = aggregates
+        return _aggregates
+
+
+def _catch_up_aggregates(aggregates: DashboardAggregates) -> int:
+    """Applies every record the aggregates miss, including other processes' appends (call under _aggregates_lock)."""
+    global _aggregates_unsaved
+    store = get_store()
+    store.refresh()
+    if store.next_seq <= aggregates.applied_upto:
+        return 0
+    count = aggregates.catch_up(store.scan(aggregates.applied_upto))
+    _aggregates_unsaved += count
+    if _aggregates_unsaved >= AGGREGATES_SAVE_EVERY:
+        aggregates.save()
+        _aggregates_unsaved = 0
+    return count
+
+
+def _aggregates_appended(seqs: list, records: list):
+    """
+    Folds newly appended records into the dashboard aggregates, if they are loaded.
+    Loading them (and catching up from the log) is left to the first dashboard read
+    or to startup, so it never lands on a save.
+    """
+    global _aggregates_unsaved
+    aggregates = _aggregates
+    if aggregates is None or not seqs:
+        return
+    try:
+        with _aggregates_lock:
+            if seqs[0] != aggregates.applied_upto:
+                # Another process appended in between: read the missing range (and these
+                # records, which are already stored) from the log instead
+                _catch_up_aggregates(aggregates)
+                return
+            for seq, record in zip(seqs, records):
+                aggregates.apply(seq, record)
+            _aggregates_unsaved += len(seqs)
+            if _aggregates_unsaved >= AGGREGATES_SAVE_EVERY:
+                aggregates.save()
+                _aggregates_unsaved = 0
+    except Exception as e:
+        # The log stays authoritative; the missed records are caught up from it on the next read
+        logger.warning(f"Failed to update dashboard aggregates: {e}")
+
+
+def _synced_aggregates() -> DashboardAggregates:
+    """The aggregates, first catching up on records other processes appended since the last read."""
+    aggregates = get_aggregates()
+    with _aggregates_lock:
+        _catch_up_aggregates(aggregates)
+    return aggregates
+
+
+def get_rollups() -> RollupStore:
+    """Returns the hourly/daily rollups of records already dropped by retention."""
+    global _rollups
+    if _rollups is None:
+        _rollups = RollupStore(os.path.join(DB_LOG_DIR, ROLLUP_SUBDIR))
+    return _rollups
+
+
+def _segments_dropped(next_seq: int):
+    """Invalidates state that still refers to records dropped by retention."""
+    global _index
+    # Rebuilt from the remaining segments on the next query
+    with _index_lock:
+        _index = None
+    # Deltas are re-based by _rebase_before_drop; still start this process's chains afresh
+    _detector.forget_all()
+
+
+def _rebase_before_drop(base_seq: int, next_seq: int):
+    """
+    Appends a consolidated snapshot for every delta-published location whose latest
+    snapshot is about to be dropped, so its kept deltas, or its current state if it
+    has not changed since, can still be rebuilt.
+    """
+    store = get_store()
+    locations = set()
+    for seq, record in store.iter_records(OLDEST_FIRST, base_seq):
+        if seq >= next_seq:
+            break
+        locations.add(record_location(record))
+    locations.discard(None)
+
+    rebased = 0
+    for location in sorted(locations):
+        while True:
+            chain = _snapshot_chain(location)
+            # Snapshots written outside delta mode (no record_kind) start no chain
+            if not chain or chain[-1][0] >= next_seq or 'record_kind' not in chain[-1][1]:
+                break
+            record = _make_record(_replay(chain), KIND_SNAPSHOT)
+            record["published_by"] = "RetentionCompactor"
+            seq = store.append(record)
+            _index_appended([seq], [record])
+            _columnar_appended([seq], [record])
+            _recent_appended([seq], [record])
+            _aggregates_appended([seq], [record])
+            rebased += 1
+            # Another writer may have appended a delta while the chain was replayed; it would
+            # then sit before the new snapshot, so replay again until none did
+            head_seq = chain[0][0]
+            if not any(head_seq < other < seq for other in get_index().query(location=location, limit=64)):
+                break
+    if rebased:
+        store.flush()
+        logger.info(f"Appended {rebased} consolidated snapshots before dropping records below seq {next_seq}.")
+
+
+def _make_compactor(full_days: float, hourly_days: float, interval_s: float,
+                    daily_days: float) -> RetentionCompactor:
+    return RetentionCompactor(get_store(), get_rollups(), full_days=full_days, hourly_days=hourly_days,
+                              interval_s=interval_s, on_dropped=_segments_dropped, before_drop=_rebase_before_drop,
+                              segment_days=RETENTION_SEGMENT_DAYS, daily_days=daily_days)
+
+
+def start_retention(full_days: float, hourly_days: float, interval_s: float,
+                    daily_days: float = RETENTION_DAILY_DAYS):
+    """
+    Starts background retention: records older than `full_days` are rolled up
+    hourly (then daily after `hourly_days`, deleted after `daily_days`) and their
+    log segments deleted. Runs every `interval_s` seconds off the write path;
+    stopped by close_db().
+    """
+    global _compactor
+    if _compactor is not None:
+        _compactor.stop()
+    _compactor = _make_compactor(full_days, hourly_days, interval_s, daily_days)
+    _compactor.start()
+    logger.info(f"Retention started: full records for {full_days} days, hourly rollups for {hourly_days} days.")
+
+
+def compact_history(full_days: float, hourly_days: float, daily_days: float = RETENTION_DAILY_DAYS) -> int:
+    """
+    Runs one retention pass in the calling thread.
+
+    Returns:
+        The number of records rolled up and dropped, or -1 on failure.
+    """
+    if not initialize_db():
+        return -1
+    try:
+        return _make_compactor(full_days, hourly_days, 0, daily_days).compact_once()
+
+    except Exception as e:
+        logger.error(f"Retention pass failed: {e}", exc_info=True)
+        return -1
+
+
+def fetch_rollups(resolution: str = None, location: str = None, start=None, end=None) -> list:
+    """
+    Retrieves long-term trends for periods whose full records were dropped by retention.
+
+    Args:
+        resolution: "hourly", "daily", or None for both.
+        location: The `monitoring_location` (case-insensitive).
+        start: Earliest bucket start (inclusive), as an ISO string or datetime.
+        end: Latest bucket start (inclusive), as an ISO string or datetime.
+
+    Returns:
+        Rollups oldest first, each with record and incident counts (total and per type),
+        temperature min/max/mean and the dominant weather condition.
+    """
+    if not initialize_db():
+        return []
+    try:
+        return get_rollups().query(resolution=resolution, location=location, start=start, end=end)
+
+    except Exception as e:
+        logger.error(f"Failed to read rollups: {e}", exc_info=True)
+        return []
+
+
+def close_db():
+    """Flushes pending appends to stable storage and closes the store (e.g. on shutdown)."""
+    global _compactor
+    if _compactor is not None:
+        _compactor.stop()
+        _compactor = None
+    if _columnar is not None:
+        try:
+            _columnar.close()
+        except Exception as e:
+            logger.warning(f"Failed to flush columnar tables: {e}")
+    if _aggregates is not None:
+        try:
+            _aggregates.save()
+        except Exception as e:
+            logger.warning(f"Failed to save dashboard aggregates: {e}")
+    if _store is not None:
+        _store.close()
+        logger.info(f"Local log store at {DB_LOG_DIR} flushed and closed.")
+
+
+def _migrate_legacy_file(store: StorageBackend):
+    """Imports records from the old alerts.json file into an empty log store."""
+    if store.count or not os.path.exists(DB_FILE_PATH) or os.path.getsize(DB_FILE_PATH) == 0:
+        return
+    with open(DB_FILE_PATH, 'r') as f:
+        legacy_records = json.load(f)
+    if legacy_records:
+        store.append_many(legacy_records)
+        store.flush()
+        logger.info(f"Imported {len(legacy_records)} records from {DB_FILE_PATH} into {DB_LOG_DIR}.")
+
+
+def initialize_db():
+    """
+    Initializes the local file system storage.
+    Opens (or creates) the segmented log directory and imports any legacy JSON records.
+    Only the first successful call does any work.
+    """
+    global _initialized
+    if _initialized:
+        return True
+    try:
+        store = get_store()
+        store.open()
+        _migrate_legacy_file(store)
+        _initialized = True
         return True
 
     except Exception as e:
@@ -36,9 +429,40 @@ def initialize_db():
         return False
 
 
+def _make_record(body: dict, kind: str = None) -> dict:
+    """Wraps a package (or a delta) with the metadata stored alongside it."""
+    # Add metadata required for sorting (since we don't have Firestore's SERVER_TIMESTAMP)
+    record = {
+        "fetch_timestamp": datetime.datetime.now().isoformat(),
+        "raw_payload": body,
+        "published_by": "MessengerAgent",
+        "id": datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")  # Simple unique ID
+    }
+    if kind == KIND_DELTA:
+        record["delta"] = record.pop("raw_payload")
+    if kind is not None:
+        record["record_kind"] = kind
+    return record
+
+
+def _to_result(doc: dict) -> dict:
+    """Shapes a stored record for callers; delta records also carry their kind and delta."""
+    result = {
+        "id": doc.get('id', 'N/A'),
+        # Convert the ISO string back to a datetime object if needed for display/sorting,
+        # but we'll keep it simple here.
+        "timestamp": doc.get('fetch_timestamp', 'N/A'),
+        "payload": doc.get('raw_payload', {})
+    }
+    if record_kind(doc) == KIND_DELTA:
+        result["kind"] = KIND_DELTA
+        result["delta"] = doc.get('delta', {})
+    return result
+
+
 def save_presentation_data(data: dict) -> bool:
     """
-    Saves the structured raw data package to the local JSON file.
+    Appends the structured raw data package to the local log store.
 
     Args:
         data: The dictionary containing the raw, packaged data from the Sensor Agent.
@@ -50,39 +474,202 @@ def save_presentation_data(data: dict) -> bool:
         return False
 
     try:
-        # Add metadata required for sorting (since we don't have Firestore's SERVER_TIMESTAMP)
-        record = {
-            "fetch_timestamp": datetime.datetime.now().isoformat(),
-            "raw_payload": data,
-            "published_by": "MessengerAgent",
-            "id": datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")  # Simple unique ID
-        }
+        record = _make_record(data)
+
+        # A single append to the active log segment; fsync is batched by the store
+        seq = get_store().append(record)
+        _index_appended([seq], [record])
+        _columnar_appended([seq], [record])
+        _recent_appended([seq], [record])
+        _aggregates_appended([seq], [record])
+
+        logger.info(f"Data saved successfully to {DB_LOG_DIR}.")
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to save data to local log store: {e}", exc_info=True)
+        return False
 
-        # Read all existing records
-        with open(DB_FILE_PATH, 'r') as f:
-            all_records = json.load(f)
 
-        # Append the new record and write back
-        all_records.append(record)
+def save_presentation_delta(data: dict) -> bool:
+    """
+    Stores only what changed since the previous package of the same monitoring_location.
+    Unchanged packages are skipped entirely; changes are stored as explicit deltas
+    (added / updated / resolved incidents, changed weather and OV blocks), with a
+    periodic full snapshot. Use rebuild_snapshot() to read a full package back.
+
+    Args:
+        data: The dictionary containing the raw, packaged data from the Sensor Agent.
+
+    Returns:
+        True if the package was stored or needed no write, False otherwise.
+    """
+    if not initialize_db():
+        return False
 
-        # Keep the file size manageable by only storing the last 100 records
-        # This prevents the file from growing indefinitely in a loop
-        all_records = all_records[-100:]
+    location = data.get('monitoring_location')
+    try:
+        kind, body = _detector.diff(data)
+        if kind is None:
+            logger.info(f"No changes for {location}; nothing written.")
+            return True
 
-        with open(DB_FILE_PATH, 'w') as f:
-            json.dump(all_records, f, indent=4)
+        record = _make_record(body, kind)
+        seq = get_store().append(record)
+        _index_appended([seq], [record])
+        _columnar_appended([seq], [record])
+        _recent_appended([seq], [record])
+        _aggregates_appended([seq], [record])
 
-        logger.info(f"Data saved successfully to {DB_FILE_PATH}.")
+        logger.info(f"Stored {kind} for {location} in {DB_LOG_DIR}.")
         return True
 
     except Exception as e:
-        logger.error(f"Failed to save data to local JSON file: {e}", exc_info=True)
+        # The detector already advanced; force a snapshot next time so no change is lost
+        _detector.forget(location)
+        logger.error(f"Failed to save delta to local log store: {e}", exc_info=True)
         return False
 
 
+def save_presentation_batch(packages: list, delta: bool = False) -> list:
+    """
+    Group commit: stores many packages with a single append and a single fsync.
+
+    Args:
+        packages: Raw data packages from the Sensor Agent(s).
+        delta: Store only changes between cycles, as save_presentation_delta does.
+
+    Returns:
+        One bool per package, in order: True if it was durably stored (or needed no
+        write in delta mode), False otherwise.
+    """
+    if not packages:
+        return []
+    if not initialize_db():
+        return [False] * len(packages)
+
+    results = [False] * len(packages)
+    records = []
+    positions = []
+    locations = []
+    for position, package in enumerate(packages):
+        location = package.get('monitoring_location') if delta else None
+        try:
+            if delta:
+                kind, body = _detector.diff(package)
+                if kind is None:
+                    results[position] = True
+                    continue
+                record = _make_record(body, kind)
+            else:
+                record = _make_record(package)
+        except Exception as e:
+            # The detector may already have advanced; force a snapshot next time
+            if location is not None:
+                _detector.forget(location)
+            logger.error(f"Rejected package {position} of batch: {e}")
+            continue
+        records.append(record)
+        positions.append(position)
+        locations.append(location)
+
+    try:
+        store = get_store()
+        try:
+            seqs = store.append_many(records)
+        except (TypeError, ValueError):
+            # An unserializable package fails the whole group before anything is written;
+            # retry one by one so only that package is rejected.
+            seqs, kept = [], []
+            for record, position, location in zip(records, positions, locations):
+                try:
+                    seqs.append(store.append(record))
+                    kept.append((record, position, location))
+                except (TypeError, ValueError) as e:
+                    if location is not None:
+                        _detector.forget(location)
+                    logger.error(f"Rejected package {position} of batch: {e}")
+            records = [record for record, _, _ in kept]
+            positions = [position for _, position, _ in kept]
+            locations = [location for _, _, location in kept]
+        store.flush()
+        _index_appended(seqs, records)
+        _columnar_appended(seqs, records)
+        _recent_appended(seqs, records)
+        _aggregates_appended(seqs, records)
+        for position in positions:
+            results[position] = True
+        logger.info(f"Group-committed {len(records)} of {len(packages)} packages to {DB_LOG_DIR}.")
+
+    except Exception as e:
+        for location in locations:
+            if location is not None:
+                _detector.forget(location)
+        logger.error(f"Failed to group-commit {len(records)} packages to local log store: {e}", exc_info=True)
+
+    return results
+
+
+def _invalidate_recent():
+    global _recent_upto
+    with _recent_lock:
+        _recent.clear()
+        _recent_upto = None
+
+
+def _recent_appended(seqs: list, records: list):
+    """Pushes records appended by this process onto the read cache, if it is in step."""
+    global _recent_upto
+    if not seqs:
+        return
+    with _recent_lock:
+        if _recent_upto != seqs[0]:
+            return  # not loaded, or behind: the next read catches up from the store
+        for seq, record in zip(seqs, records):
+            _recent.appendleft((seq, encode_record(_to_result(record))))
+        while len(_recent) > RECENT_CACHE_SIZE:
+            _recent.pop()
+        _recent_upto = seqs[-1] + 1
+
+
+def _read_recent(store: StorageBackend, limit: int) -> list:
+    """Serves the newest `limit` results from the cache, reading only what it is missing."""
+    global _recent_upto
+    with _recent_lock:
+        # Picks up appends from other processes (e.g. the orchestrator) with two stat calls
+        store.refresh()
+        next_seq, first_seq = store.next_seq, store.first_seq
+        if _recent_upto is None or _recent_upto > next_seq:
+            _recent.clear()
+            _recent_upto = next_seq
+            for seq, doc in store.read_last(RECENT_CACHE_SIZE):
+                _recent.append((seq, encode_record(_to_result(doc))))
+        elif _recent_upto < next_seq:
+            # Only the records appended since the last read are parsed
+            missing = []
+            for seq, doc in store.iter_records(NEWEST_FIRST):
+                if seq < _recent_upto or len(missing) >= RECENT_CACHE_SIZE:
+                    break
+                missing.append((seq, encode_record(_to_result(doc))))
+            if len(missing) >= RECENT_CACHE_SIZE:
+                _recent.clear()
+            _recent.extendleft(reversed(missing))
+            while len(_recent) > RECENT_CACHE_SIZE:
+                _recent.pop()
+            _recent_upto = next_seq
+        # Retention may have dropped the oldest cached records
+        while _recent and _recent[-1][0] < first_seq:
+            _recent.pop()
+        # Decoded per call, so every caller gets results of its own
+        return [decode_record(encoded) for _, encoded in list(_recent)[:limit]]
+
+
 def fetch_recent_data(limit: int = 10) -> list:
     """
     Retrieves the most recent data packages for the frontend dashboard.
+    The newest RECENT_CACHE_SIZE results are cached in memory (serialized); repeated
+    calls only check the store for new records and read nothing from it when it is
+    unchanged. The returned dicts are the caller's own to modify.
 
     Args:
         limit: The maximum number of records to retrieve.
@@ -94,29 +681,346 @@ def fetch_recent_data(limit: int = 10) -> list:
         return []
 
     try:
-        with open(DB_FILE_PATH, 'r') as f:
-            all_records = json.load(f)
+        store = get_store()
+        if limit <= RECENT_CACHE_SIZE:
+            results = _read_recent(store, limit)
+        else:
+            # Only the newest `limit` records are read, located via the segment offset indexes
+            store.refresh()
+            results = [_to_result(doc) for _, doc in store.read_last(limit)]
+
+        logger.debug(f"Fetched {len(results)} recent records from local log store.")
+        return results
+
+    except json.JSONDecodeError:
+        logger.error(f"Failed to decode a record in {DB_LOG_DIR}. Store may be corrupt.", exc_info=True)
+        return []
+    except Exception as e:
+        logger.error(f"Failed to fetch data from local log store: {e}", exc_info=True)
+        return []
 
-        # The records are already saved in order (oldest first due to append), 
-        # so reversing and slicing gives the most recent records.
-        recent_records = all_records[::-1][:limit]
+
+def iter_history(order: str = NEWEST_FIRST, cursor: int = None):
+    """
+    Lazily walks every stored data package in constant memory, for backfills,
+    exports and pagination. Stop early by breaking out of the loop.
+
+    Args:
+        order: "newest" (NEWEST_FIRST) or "oldest" (OLDEST_FIRST).
+        cursor: Resume after this record; pass the "cursor" of the last result seen.
+
+    Yields:
+        Dictionaries shaped like fetch_recent_data results, plus a "cursor" key.
+    """
+    if not initialize_db():
+        return
+    start_seq = None
+    if cursor is not None:
+        start_seq = int(cursor) - 1 if order == NEWEST_FIRST else int(cursor) + 1
+        if start_seq < 0:
+            return
+    for seq, doc in get_store().iter_records(order, start_seq):
+        result = _to_result(doc)
+        result["cursor"] = seq
+        yield result
+
+
+def fetch_history_page(limit: int = 10, cursor: int = None, order: str = NEWEST_FIRST) -> tuple:
+    """
+    Retrieves one page of stored data packages for dashboard pagination.
+
+    Args:
+        limit: The maximum number of records on the page.
+        cursor: The "next_cursor" returned with the previous page (None for the first page).
+        order: "newest" (NEWEST_FIRST) or "oldest" (OLDEST_FIRST).
+
+    Returns:
+        (results, next_cursor); next_cursor is None once the history is exhausted.
+    """
+    try:
+        results = []
+        for result in iter_history(order, cursor):
+            results.append(result)
+            if len(results) >= limit:
+                break
+        next_cursor = results[-1]["cursor"] if len(results) == limit else None
+        return results, next_cursor
+
+    except Exception as e:
+        logger.error(f"Failed to page through local log store: {e}", exc_info=True)
+        return [], None
+
+
+def query_alerts(start=None, end=None, location: str = None, incident_type: str = None,
+                 incident_location: str = None, limit: int = None) -> list:
+    """
+    Retrieves stored data packages matching the given filters, newest first.
+    Backed by secondary indexes, so cost scales with the number of matches.
+
+    Args:
+        start: Earliest fetch timestamp (inclusive), as an ISO string or datetime.
+        end: Latest fetch timestamp (inclusive), as an ISO string or datetime.
+        location: The `monitoring_location` of the package (case-insensitive).
+        incident_type: An incident `type`, e.g. "Roadwork" (case-insensitive).
+        incident_location: Words of an incident `location`, e.g. "Kerkstraat".
+        limit: The maximum number of records to retrieve.
+
+    Returns:
+        A list of dictionaries shaped like fetch_recent_data results. When an incident
+        filter is given, "matched_incidents" lists the incidents that satisfied it.
+    """
+    if not initialize_db():
+        return []
+
+    try:
+        filters_incidents = incident_type is not None or incident_location is not None
+        # Incident filters are re-checked per incident below, so the limit is applied after that
+        seqs = get_index().query(start=start, end=end, location=location, incident_type=incident_type,
+                                 incident_location=incident_location, limit=None if filters_incidents else limit)
+        store = get_store()
 
         results = []
-        for doc in recent_records:
-            results.append({
-                "id": doc.get('id', 'N/A'),
-                # Convert the ISO string back to a datetime object if needed for display/sorting, 
-                # but we'll keep it simple here.
-                "timestamp": doc.get('fetch_timestamp', 'N/A'),
-                "payload": doc.get('raw_payload', {})
-            })
-
-        logger.info(f"Successfully fetched {len(results)} recent records from local file.")
+        for seq in seqs:
+            try:
+                doc = store.read_at(seq)
+            except IndexError:
+                continue  # dropped by retention since the index was read
+            result = _to_result(doc)
+            if filters_incidents:
+                result["matched_incidents"] = [
+                    incident for incident in record_incidents(doc)
+                    if incident_matches(incident, incident_type, incident_location)
+                ]
+                # Type and location may have matched on different incidents of the same package
+                if not result["matched_incidents"]:
+                    continue
+            results.append(result)
+            if limit is not None and len(results) >= limit:
+                break
+
+        logger.info(f"Query matched {len(results)} records.")
         return results
 
-    except json.JSONDecodeError:
-        logger.error(f"Failed to decode JSON from {DB_FILE_PATH}. File may be corrupt.", exc_info=True)
+    except Exception as e:
+        logger.error(f"Failed to query local log store: {e}", exc_info=True)
         return []
+
+
+def rebuild_snapshot(location: str, at=None) -> dict:
+    """
+    Rebuilds the full data package of a location as it was at a point in time,
+    by replaying the deltas stored after the latest snapshot before `at`.
+
+    Args:
+        location: The monitoring_location to rebuild.
+        at: Point in time (ISO string or datetime); defaults to now.
+
+    Returns:
+        The package in the usual Sensor Agent shape, or {} if nothing was stored yet.
+    """
+    if not initialize_db():
+        return {}
+
+    try:
+        chain = _snapshot_chain(location, at)
+        return _replay(chain) if chain else {}
+
+    except Exception as e:
+        logger.error(f"Failed to rebuild snapshot for {location}: {e}", exc_info=True)
+        return {}
+
+
+def _snapshot_chain(location: str, at=None) -> list:
+    """
+    A location's (seq, record) pairs from its newest record (before `at`) back to its
+    latest full snapshot, newest first; [] if no snapshot is left to start from.
+    """
+    store = get_store()
+    chain = []
+    for seq in get_index().query(end=at, location=location):
+        doc = store.read_at(seq)
+        chain.append((seq, doc))
+        if record_kind(doc) == KIND_SNAPSHOT:
+            return chain
+    return []
+
+
+def _replay(chain: list) -> dict:
+    """The package a _snapshot_chain() describes: its snapshot with the later deltas applied."""
+    package = chain[-1][1].get('raw_payload', {})
+    for _, doc in reversed(chain[:-1]):
+        package = apply_delta(package, doc.get('delta', {}))
+    return package
+
+
+def _fetch_frame(name: str):
+    if not initialize_db():
+        return None
+    try:
+        columnar = get_columnar()
+        if columnar is None:
+            logger.warning("pyarrow is not installed; columnar tables are unavailable.")
+            return None
+        return columnar.load_frame(name)
+
     except Exception as e:
-        logger.error(f"Failed to fetch data from local file: {e}", exc_info=True)
-        return []
\ No newline at end of file
+        logger.error(f"Failed to load the {name} table: {e}", exc_info=True)
+        return None
+
+
+def fetch_weather_frame():
+    """
+    The weather time-series of every stored package as a pandas DataFrame
+    (record_id, fetch_timestamp, monitoring_location, temperature_c, condition, wind_speed_kph).
+
+    Returns:
+        The DataFrame, or None if pyarrow is not installed or the table could not be read.
+    """
+    return _fetch_frame(WEATHER_TABLE)
+
+
+def fetch_incidents_frame():
+    """
+    One row per stored incident as a pandas DataFrame (record_id, fetch_timestamp,
+    monitoring_location, record_kind, type, location, impact, status, details).
+    Delta records contribute only their added and updated incidents.
+
+    Returns:
+        The DataFrame, or None if pyarrow is not installed or the table could not be read.
+    """
+    return _fetch_frame(INCIDENTS_TABLE)
+
+
+def load_columnar() -> bool:
+    """
+    Loads the Parquet tables and catches them up with the log now, e.g. at daemon
+    startup, so every later save flattens its own records into them incrementally
+    and dashboard reads only parse what other processes appended.
+
+    Returns:
+        True if the tables are loaded, False otherwise (including without pyarrow).
+    """
+    if not initialize_db():
+        return False
+    try:
+        if get_columnar() is None:
+            logger.warning("pyarrow is not installed; columnar tables are unavailable.")
+            return False
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to load columnar tables: {e}", exc_info=True)
+        return False
+
+
+def export_columnar() -> bool:
+    """
+    Rebuilds the Parquet tables from the whole log store (e.g. after upgrading, or
+    if the files were removed). They otherwise catch up with the log on every read.
+
+    Returns:
+        True if the tables were rebuilt, False otherwise.
+    """
+    if not initialize_db():
+        return False
+    try:
+        columnar = get_columnar()
+        if columnar is None:
+            logger.warning("pyarrow is not installed; columnar export skipped.")
+            return False
+        with _columnar_lock:
+            columnar.rebuild(get_store().scan())
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to export columnar tables: {e}", exc_info=True)
+        return False
+
+
+# --- Dashboard Aggregates ---
+
+
+def fetch_dashboard_summary(location: str = None) -> dict:
+    """
+    The dashboard's headline views, read from the materialized aggregates: the cost
+    does not depend on how much history is stored.
+
+    Args:
+        location: The `monitoring_location`; None returns every location.
+
+    Returns:
+        location -> {"incident_counts": distinct incidents in the last AGGREGATE_WINDOW_HOURS
+        by type and impact, "weather": latest reading and rolling temperature/condition
+        statistics, "active_incidents": incidents currently active}.
+    """
+    if not initialize_db():
+        return {}
+    try:
+        aggregates = _synced_aggregates()
+        locations = [location] if location is not None else aggregates.locations()
+        return {
+            name: {
+                "incident_counts": aggregates.incident_counts(name),
+                "weather": aggregates.weather_stats(name),
+                "active_incidents": aggregates.active_incidents(name),
+            }
+            for name in locations
+        }
+
+    except Exception as e:
+        logger.error(f"Failed to read dashboard aggregates: {e}", exc_info=True)
+        return {}
+
+
+def fetch_hourly_trend(location: str, hours: int = AGGREGATE_WINDOW_HOURS) -> list:
+    """
+    Hourly incident counts (by type and impact) and temperature min/max/mean for the
+    last `hours` (up to AGGREGATE_TREND_HOURS), oldest first, e.g. for "this week" charts.
+    """
+    if not initialize_db():
+        return []
+    try:
+        return _synced_aggregates().hourly(location, hours)
+
+    except Exception as e:
+        logger.error(f"Failed to read hourly trend for {location}: {e}", exc_info=True)
+        return []
+
+
+def load_aggregates() -> bool:
+    """
+    Loads the dashboard aggregates and catches them up with the log now, e.g. at
+    daemon startup, so later saves keep them current and dashboard reads find them warm.
+
+    Returns:
+        True if the aggregates are loaded, False otherwise.
+    """
+    if not initialize_db():
+        return False
+    try:
+        get_aggregates()
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to load dashboard aggregates: {e}", exc_info=True)
+        return False
+
+
+def rebuild_aggregates() -> bool:
+    """
+    Recomputes the dashboard aggregates from the records in the store (e.g. if their
+    file was lost). They are otherwise kept up to date once loaded.
+
+    Returns:
+        True if the aggregates were rebuilt, False otherwise.
+    """
+    if not initialize_db():
+        return False
+    try:
+        with _aggregates_lock:
+            get_aggregates().rebuild(get_store().scan())
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to rebuild dashboard aggregates: {e}", exc_info=True)
+        return False
@@ -0,0 +1,222 @@
+# tools/geo_proximity.py - Offline geocoding and vectorized proximity scoring
+
+import os
+import re
+import json
+import math
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger('GeoProximity')
+logger.setLevel(logging.INFO)
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE_LAT = 111320.0
+
+# --- Built-in gazetteer ---
+# Normalized place name -> (lat, lon). Covers the cities we monitor and the
+# street/landmark names used by the mocked feeds; extend it with a JSON file
+# ({"name": [lat, lon], ...}) passed to Gazetteer(path=...).
+BUILTIN_PLACES = {
+    "amsterdam": (52.3676, 4.9041),
+    "rotterdam": (51.9244, 4.4777),
+    "utrecht": (52.0907, 5.1214),
+    "den haag": (52.0705, 4.3007),
+    "kerkstraat": (52.3646, 4.8857),
+    "vondelpark": (52.3580, 4.8686),
+    "museumplein": (52.3573, 4.8815),
+    "dam": (52.3731, 4.8926),
+    "old town bridge": (52.3638, 4.9023),
+    "city hall": (52.3675, 4.9011),
+    "main street": (52.3700, 4.8918),
+    "central park": (52.3867, 4.8756),
+    "coolsingel": (51.9225, 4.4792),
+    "erasmusbrug": (51.9094, 4.4868),
+}
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_place(name: str) -> str:
+    """Lower-cases a place name and strips punctuation and repeated whitespace."""
+    return _SPACES.sub(' ', _NON_WORD.sub(' ', str(name).casefold())).strip()
+
+
+def _candidate_names(location: str):
+    """Progressively looser forms of a location string, most specific first."""
+    first_part = str(location).split(',')[0]
+    seen = set()
+    for text in (location, first_part, re.split(r"\bnear\b", first_part, flags=re.IGNORECASE)[0]):
+        tokens = normalize_place(text).split()
+        # "Kerkstraat 45" -> "kerkstraat", "Vondelpark West entrance" -> "vondelpark"
+        while tokens:
+            name = ' '.join(tokens)
+            if name not in seen:
+                seen.add(name)
+                yield name
+            tokens = tokens[:-1]
+
+
+class Gazetteer:
+    """
+    Offline lookup of incident `location` strings to (lat, lon).
+    Lookups are cached, so each distinct string is only resolved once.
+    """
+
+    def __init__(self, places: dict = None, path: str = None, cache_size: int = 100000):
+        self._places = {normalize_place(k): tuple(v) for k, v in (places or BUILTIN_PLACES).items()}
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                self._places.update({normalize_place(k): tuple(v) for k, v in json.load(f).items()})
+            logger.info(f"Loaded gazetteer entries from {path}.")
+        self.cache_size = cache_size
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, lat: float, lon: float):
+        with self._lock:
+            self._places[normalize_place(name)] = (lat, lon)
+            self._cache.clear()
+
+    def resolve(self, location: str):
+        """Returns (lat, lon) for a location string, or None if it is not known."""
+        if not location:
+            return None
+        cached = self._cache.get(location, False)
+        if cached is not False:
+            return cached
+        coords = None
+        for name in _candidate_names(location):
+            coords = self._places.get(name)
+            if coords is not None:
+                break
+        with self._lock:
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[location] = coords
+        return coords
+
+    def resolve_many(self, locations: list) -> tuple:
+        """Resolves a batch into (lat, lon) float arrays; unknown locations are NaN."""
+        lats = np.full(len(locations), np.nan)
+        lons = np.full(len(locations), np.nan)
+        for i, location in enumerate(locations):
+            coords = self.resolve(location)
+            if coords is not None:
+                lats[i], lons[i] = coords
+        return lats, lons
+
+
+def haversine_matrix(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Great-circle distances in meters between every point of set 1 (rows) and set 2 (columns).
+    All inputs are 1-D arrays of degrees.
+    """
+    lat1 = np.radians(np.asarray(lat1, dtype=float))[:, None]
+    lon1 = np.radians(np.asarray(lon1, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(lat2, dtype=float))[None, :]
+    lon2 = np.radians(np.asarray(lon2, dtype=float))[None, :]
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class NeighborhoodGrid:
+    """
+    Uniform lat/lon grid over neighborhood centers.
+    Cells are at least `radius_m` wide, so every neighborhood within `radius_m` of a
+    point lies in the point's cell or one of its 8 neighbours.
+    """
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, radius_m: float):
+        self.cell_lat = radius_m / METERS_PER_DEGREE_LAT
+        # Size longitude cells for the highest latitude, where degrees are narrowest
+        max_abs_lat = float(np.max(np.abs(lats))) if len(lats) else 0.0
+        self.cell_lon = radius_m / (METERS_PER_DEGREE_LAT * max(math.cos(math.radians(max_abs_lat)), 1e-6))
+        rows, cols = self.cells_of(lats, lons)
+        self._cells = {}
+        for index, key in enumerate(zip(rows.tolist(), cols.tolist())):
+            self._cells.setdefault(key, []).append(index)
+        self._cells = {key: np.asarray(members, dtype=np.int64) for key, members in self._cells.items()}
+
+    def cells_of(self, lats: np.ndarray, lons: np.ndarray) -> tuple:
+        return (np.floor(np.asarray(lats) / self.cell_lat).astype(np.int64),
+                np.floor(np.asarray(lons) / self.cell_lon).astype(np.int64))
+
+    def candidates(self, row: int, col: int) -> np.ndarray:
+        """Neighborhood indices in the 3x3 block of cells around (row, col)."""
+        found = [self._cells[key] for key in ((row + dr, col + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1))
+                 if key in self._cells]
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+
+class ProximityEngine:
+    """
+    Scores batches of incidents against many neighborhood centers.
+
+    Incidents are geocoded with the gazetteer, bucketed into grid cells, and each
+    cell's incidents are compared (one vectorized haversine call) only with the
+    neighborhoods in the surrounding cells. Scores fall linearly from 1.0 at the
+    center to 0.0 at `radius_m`.
+    """
+
+    def __init__(self, neighborhoods: dict, radius_m: float = 1500.0, gazetteer: Gazetteer = None):
+        self.names = list(neighborhoods)
+        self.radius_m = float(radius_m)
+        self.gazetteer = gazetteer or Gazetteer()
+        centers = np.asarray([neighborhoods[name] for name in self.names], dtype=float).reshape(-1, 2)
+        self.lats = centers[:, 0]
+        self.lons = centers[:, 1]
+        self.grid = NeighborhoodGrid(self.lats, self.lons, self.radius_m)
+
+    def match(self, incidents: list) -> tuple:
+        """
+        Finds every (incident, neighborhood) pair within the radius.
+
+        Args:
+            incidents: Incident dicts with a `location` string.
+
+        Returns:
+            Four aligned arrays: incident index, neighborhood index, distance (m), score.
+        """
+        locations = [incident.get('location') if isinstance(incident, dict) else None for incident in incidents]
+        lats, lons = self.gazetteer.resolve_many(locations)
+        resolved = np.flatnonzero(~np.isnan(lats))
+        if not len(resolved) or not self.names:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0), np.empty(0)
+
+        rows, cols = self.grid.cells_of(lats[resolved], lons[resolved])
+        # Group incidents by cell so each group shares one candidate list
+        cell_keys = np.stack([rows, cols], axis=1)
+        unique_cells, group_of = np.unique(cell_keys, axis=0, return_inverse=True)
+        group_of = group_of.reshape(-1)
+
+        out_incidents, out_neighborhoods, out_distances = [], [], []
+        for group, (row, col) in enumerate(unique_cells.tolist()):
+            candidates = self.grid.candidates(row, col)
+            if not len(candidates):
+                continue
+            members = resolved[group_of == group]
+            distances = haversine_matrix(lats[members], lons[members], self.lats[candidates], self.lons[candidates])
+            hit_rows, hit_cols = np.nonzero(distances <= self.radius_m)
+            out_incidents.append(members[hit_rows])
+            out_neighborhoods.append(candidates[hit_cols])
+            out_distances.append(distances[hit_rows, hit_cols])
+
+        if not out_incidents:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0), np.empty(0)
+        distances = np.concatenate(out_distances)
+        return (np.concatenate(out_incidents), np.concatenate(out_neighborhoods), distances,
+                1.0 - distances / self.radius_m)
+
+    def best_scores(self, incidents: list) -> np.ndarray:
+        """Highest score of each incident over all neighborhoods (0.0 if none is in range, NaN if not geocoded)."""
+        locations = [incident.get('location') if isinstance(incident, dict) else None for incident in incidents]
+        lats, _ = self.gazetteer.resolve_many(locations)
+        scores = np.where(np.isnan(lats), np.nan, 0.0)
+        incident_idx, _, _, match_scores = self.match(incidents)
+        np.maximum.at(scores, incident_idx, match_scores)
+        return scores
@@ -0,0 +1,142 @@
+# tools/http_transport.py - Shared pooled HTTP transport for all source fetchers
+
+import time
+import logging
+import threading
+import collections
+import requests
+from requests.adapters import HTTPAdapter
+from config import HTTP_TIMEOUT_S, HTTP_POOL_HOSTS, HTTP_POOL_MAXSIZE, HTTP_CACHE_ENTRIES
+
+logger = logging.getLogger('HttpTransport')
+logger.setLevel(logging.INFO)
+
+
+class TransportResponse:
+    """The parsed result of one GET, plus whether it was served from the conditional-GET cache."""
+
+    __slots__ = ('payload', 'status_code', 'not_modified', 'elapsed_s')
+
+    def __init__(self, payload, status_code: int, not_modified: bool, elapsed_s: float):
+        self.payload = payload
+        self.status_code = status_code
+        self.not_modified = not_modified
+        self.elapsed_s = elapsed_s
+
+
+class _CacheEntry:
+    __slots__ = ('etag', 'last_modified', 'payload')
+
+    def __init__(self, etag, last_modified, payload):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.payload = payload
+
+
+class HttpTransport:
+    """
+    Keep-alive HTTP client shared by every source fetcher.
+
+    * One `requests.Session`, so DNS/TCP/TLS setup is paid once per pooled connection.
+    * At most `pool_maxsize` connections per host; callers block for a free one
+      instead of opening more.
+    * gzip/deflate response compression.
+    * Conditional GETs: the ETag / Last-Modified of each URL is remembered with its
+      parsed payload, and a 304 Not Modified returns that payload without
+      re-downloading or re-parsing the body.
+    """
+
+    def __init__(self, pool_hosts: int = HTTP_POOL_HOSTS, pool_maxsize: int = HTTP_POOL_MAXSIZE,
+                 timeout=HTTP_TIMEOUT_S, cache_entries: int = HTTP_CACHE_ENTRIES):
+        self.timeout = timeout
+        self.cache_entries = cache_entries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_maxsize, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+        self._cache = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(url: str, params: dict) -> tuple:
+        return url, tuple(sorted((params or {}).items()))
+
+    def fetch(self, url: str, params: dict = None, headers: dict = None) -> TransportResponse:
+        """
+        Performs a (conditional) GET and returns the parsed JSON payload.
+
+        Raises:
+            requests.exceptions.RequestException: On connection errors, timeouts
+                and 4xx/5xx responses, like a bare `requests.get` + `raise_for_status`.
+        """
+        key = self._cache_key(url, params)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+
+        request_headers = dict(headers or {})
+        if cached is not None:
+            if cached.etag:
+                request_headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                request_headers['If-Modified-Since'] = cached.last_modified
+
+        started = time.monotonic()
+        response = self.session.get(url, params=params, headers=request_headers, timeout=self.timeout)
+
+        if response.status_code == 304 and cached is not None:
+            with self._cache_lock:
+                self._cache.move_to_end(key)
+            return TransportResponse(cached.payload, 304, True, time.monotonic() - started)
+
+        response.raise_for_status()
+        payload = response.json()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            with self._cache_lock:
+                self._cache[key] = _CacheEntry(etag, last_modified, payload)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+        return TransportResponse(payload, response.status_code, False, time.monotonic() - started)
+
+    def get_json(self, url: str, params: dict = None, headers: dict = None):
+        """Shortcut for fetch(...).payload."""
+        return self.fetch(url, params=params, headers=headers).payload
+
+    def post_json(self, url: str, payload, headers: dict = None) -> int:
+        """
+        POSTs a JSON body over the pooled session and returns the status code.
+
+        Raises:
+            requests.exceptions.RequestException: On connection errors, timeouts and 4xx/5xx responses.
+        """
+        response = self.session.post(url, json=payload, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.status_code
+
+    def close(self):
+        self.session.close()
+
+
+def is_retryable(exc: Exception) -> bool:
+    """True for failures worth retrying: connection errors, timeouts, 429 and 5xx responses."""
+    if isinstance(exc, requests.exceptions.HTTPError):
+        status = exc.response.status_code if exc.response is not None else None
+        return status is None or status == 429 or status >= 500
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HttpTransport:
+    """Returns the process-wide transport, creating it on first use."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = HttpTransport()
+    return _transport
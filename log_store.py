@@ -0,0 +1,542 @@
+# tools/log_store.py - Append-only, line-delimited segmented log for alert records
+
+import os
+import json
+import mmap
+import time
+import struct
+import logging
+import threading
+import contextlib
+from metrics import STORE_WRITE_LATENCY
+
+# fcntl is POSIX-only; without it the store supports a single writer process.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger('LogStore')
+logger.setLevel(logging.INFO)
+
+# --- Configuration ---
+# Segment files are named after the sequence number of their first record, so
+# sequence numbers stay stable even when old segments are dropped.
+SEGMENT_SUFFIX = '.log'
+INDEX_SUFFIX = '.idx'
+LOCK_FILE = 'write.lock'
+DEFAULT_MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_FSYNC_EVERY = 32          # fsync after this many unsynced appends ...
+DEFAULT_FSYNC_INTERVAL_S = 1.0    # ... or after this many seconds, whichever comes first
+NEWEST_FIRST = 'newest'
+OLDEST_FIRST = 'oldest'
+
+# Each index entry is the byte offset of one record inside its segment.
+_INDEX_ENTRY = struct.Struct('<Q')
+
+_APPEND_LATENCY = STORE_WRITE_LATENCY.labels('append')
+_FSYNC_LATENCY = STORE_WRITE_LATENCY.labels('fsync')
+
+
+def encode_record(record: dict) -> bytes:
+    """Serializes one record as a single compact JSON line."""
+    return json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+def decode_record(line: bytes) -> dict:
+    """Parses one JSON line written by encode_record."""
+    return json.loads(line)
+
+
+class _Segment:
+    """A single log segment: a data file of JSON lines plus its sidecar offset index."""
+
+    def __init__(self, directory: str, base_seq: int):
+        self.base_seq = base_seq
+        name = f"{base_seq:016d}"
+        self.data_path = os.path.join(directory, name + SEGMENT_SUFFIX)
+        self.index_path = os.path.join(directory, name + INDEX_SUFFIX)
+        self.count = 0
+        self.size = 0
+
+    def load(self):
+        """Reads the segment's size and record count from disk."""
+        self.size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        index_size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        self.count = index_size // _INDEX_ENTRY.size
+
+    def offset_of(self, local: int) -> int:
+        with open(self.index_path, 'rb') as f:
+            f.seek(local * _INDEX_ENTRY.size)
+            return _INDEX_ENTRY.unpack(f.read(_INDEX_ENTRY.size))[0]
+
+    def read_local(self, local: int) -> dict:
+        start = self.offset_of(local)
+        with open(self.data_path, 'rb') as f:
+            f.seek(start)
+            return decode_record(f.readline())
+
+    def iter_local(self, count: int, size: int, start: int, step: int):
+        """
+        Yields (local_index, record) from `start`, moving by `step` (+1 or -1), over the
+        first `count` records (`size` bytes). Both files are memory-mapped, so only the
+        pages holding the visited records are read.
+        """
+        if count <= 0 or not 0 <= start < count:
+            return
+        try:
+            index_file = open(self.index_path, 'rb')
+        except FileNotFoundError:
+            return  # dropped by retention after the iteration started
+        with index_file:
+            try:
+                data_file = open(self.data_path, 'rb')
+            except FileNotFoundError:
+                return
+            with data_file:
+                index_map = mmap.mmap(index_file.fileno(), count * _INDEX_ENTRY.size, access=mmap.ACCESS_READ)
+                data_map = mmap.mmap(data_file.fileno(), size, access=mmap.ACCESS_READ)
+                try:
+                    local = start
+                    while 0 <= local < count:
+                        begin = _INDEX_ENTRY.unpack_from(index_map, local * _INDEX_ENTRY.size)[0]
+                        # Records are single lines; the data may run ahead of the index
+                        end = data_map.find(b'\n', begin, size) + 1 or size
+                        yield local, decode_record(data_map[begin:end])
+                        local += step
+                finally:
+                    index_map.close()
+                    data_map.close()
+
+    def recover(self):
+        """
+        Repairs the segment after an unclean shutdown.
+        Drops a trailing partial line and rebuilds the offset index if it does not
+        match the data file.
+        """
+        if not os.path.exists(self.data_path):
+            open(self.data_path, 'ab').close()
+        offsets = []
+        valid_end = 0
+        with open(self.data_path, 'rb') as f:
+            position = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                offsets.append(position)
+                position += len(line)
+                valid_end = position
+
+        if valid_end != os.path.getsize(self.data_path):
+            logger.warning(f"Truncating partial record at end of {self.data_path}.")
+            with open(self.data_path, 'r+b') as f:
+                f.truncate(valid_end)
+
+        expected = b''.join(_INDEX_ENTRY.pack(o) for o in offsets)
+        current = b''
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                current = f.read()
+        if current != expected:
+            logger.warning(f"Rebuilding offset index for {self.data_path}.")
+            with open(self.index_path, 'wb') as f:
+                f.write(expected)
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.size = valid_end
+        self.count = len(offsets)
+
+
+class SegmentedLogStore:
+    """
+    Append-only store of alert records.
+    Records are written as JSON lines into size-bounded segment files. Every
+    segment has a sidecar index of record offsets, so a record can be located by
+    its global sequence number without scanning. Appends are a single write to
+    the active segment; fsync is batched by count and time.
+
+    With `process_lock`, appends from several processes are serialized by an
+    exclusive flock on the directory's lock file, and each writer refreshes its view
+    of the active segment before writing.
+    """
+
+    def __init__(self, directory: str, max_segment_bytes: int = DEFAULT_MAX_SEGMENT_BYTES,
+                 fsync_every: int = DEFAULT_FSYNC_EVERY, fsync_interval_s: float = DEFAULT_FSYNC_INTERVAL_S,
+                 process_lock: bool = False):
+        self.directory = directory
+        self.process_lock = process_lock and fcntl is not None
+        self._lock_file = None
+        self._lock_depth = 0
+        self.max_segment_bytes = max_segment_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval_s = fsync_interval_s
+        self._lock = threading.RLock()
+        self._segments = []
+        self._data_file = None
+        self._index_file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._dir_mtime_ns = None
+
+    # --- Lifecycle ---
+
+    def open(self):
+        """Loads the existing segments (recovering the active one) and opens it for appends."""
+        with self._lock:
+            if self._data_file is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            if self.process_lock and self._lock_file is None:
+                self._lock_file = open(os.path.join(self.directory, LOCK_FILE), 'a')
+            bases = sorted(
+                int(name[:-len(SEGMENT_SUFFIX)])
+                for name in os.listdir(self.directory)
+                if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+            )
+            self._segments = [_Segment(self.directory, base) for base in bases]
+            for segment in self._segments[:-1]:
+                segment.load()
+            if not self._segments:
+                self._segments.append(_Segment(self.directory, 0))
+            # Recovery truncates a partial line, which must not race another process's write
+            with self._process_locked():
+                self._segments[-1].recover()
+            self._open_active()
+            self._dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+            logger.info(f"Opened log store at {self.directory} with {self.count} records "
+                        f"in {len(self._segments)} segment(s).")
+
+    def close(self):
+        """Syncs and closes the active segment."""
+        with self._lock:
+            self._close_segment_files()
+            if self._lock_file is not None and not self._lock_depth:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def _close_segment_files(self):
+        if self._data_file is None:
+            return
+        self._sync()
+        self._data_file.close()
+        self._index_file.close()
+        self._data_file = None
+        self._index_file = None
+
+    @contextlib.contextmanager
+    def _process_locked(self):
+        """Holds the cross-process writer lock (re-entrant; a no-op without process_lock)."""
+        if self._lock_file is None:
+            yield
+            return
+        if not self._lock_depth:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        self._lock_depth += 1
+        try:
+            yield
+        finally:
+            self._lock_depth -= 1
+            if not self._lock_depth:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def refresh(self) -> bool:
+        """
+        Picks up records appended (or segments added/dropped) by another process.
+        Costs three stat calls when nothing changed.
+
+        Returns:
+            True if the store changed since it was opened or last refreshed.
+        """
+        with self._lock:
+            if self._data_file is None:
+                self.open()
+                return True
+            active = self._segments[-1]
+            count = os.stat(active.index_path).st_size // _INDEX_ENTRY.size
+            changed = count != active.count
+            if changed:
+                active.count = count
+                active.size = os.path.getsize(active.data_path)
+            # A segment following the active one means another process rolled over; the
+            # directory mtime also catches dropped segments, but is too coarse on its own.
+            successor = os.path.join(self.directory, f"{active.base_seq + active.count:016d}{SEGMENT_SUFFIX}")
+            if os.path.exists(successor) or os.stat(self.directory).st_mtime_ns != self._dir_mtime_ns:
+                self._close_segment_files()
+                self.open()
+                return True
+            return changed
+
+    def _open_active(self):
+        active = self._segments[-1]
+        # Unbuffered append handles: every append is immediately visible to readers.
+        self._data_file = open(active.data_path, 'ab', buffering=0)
+        self._index_file = open(active.index_path, 'ab', buffering=0)
+
+    def _roll_segment(self):
+        """Closes the full active segment and starts a new one."""
+        self._sync()
+        self._data_file.close()
+        self._index_file.close()
+        new_segment = _Segment(self.directory, self.next_seq)
+        self._segments.append(new_segment)
+        self._open_active()
+        self._dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+        logger.info(f"Rolled over to new segment {new_segment.data_path}.")
+
+    # --- Writes ---
+
+    def append(self, record: dict) -> int:
+        """
+        Appends a single record.
+
+        Returns:
+            The global sequence number assigned to the record.
+        """
+        return self.append_many([record])[0]
+
+    def append_many(self, records: list) -> list:
+        """
+        Appends several records with one write per file.
+        Either every record is encoded and written, or the store is left unchanged.
+
+        Returns:
+            The sequence numbers assigned to the records, in order.
+        """
+        # Encode first, so an unserializable record fails the call before anything is written
+        lines = [encode_record(record) for record in records]
+        with self._lock:
+            self.open()
+            if not self.process_lock:
+                return self._append_lines(lines)
+            with self._process_locked():
+                # Another process may have appended or rolled since our last write
+                self.refresh()
+                return self._append_lines(lines)
+
+    def _append_lines(self, lines: list) -> list:
+        with self._lock:
+            seqs = []
+            pending_data = []
+            pending_index = []
+            pending_bytes = 0
+            for line in lines:
+                active = self._segments[-1]
+                if (active.count or pending_data) and active.size + pending_bytes + len(line) > self.max_segment_bytes:
+                    self._write_pending(pending_data, pending_index)
+                    pending_data, pending_index, pending_bytes = [], [], 0
+                    self._roll_segment()
+                    active = self._segments[-1]
+                seqs.append(active.base_seq + active.count + len(pending_data))
+                pending_index.append(_INDEX_ENTRY.pack(active.size + pending_bytes))
+                pending_data.append(line)
+                pending_bytes += len(line)
+            self._write_pending(pending_data, pending_index)
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval_s:
+                self._sync()
+            return seqs
+
+    def _write_pending(self, pending_data: list, pending_index: list):
+        # Data first, index second: a crash in between leaves a record without an
+        # index entry, which recover() rebuilds on the next open.
+        if not pending_data:
+            return
+        data = b''.join(pending_data)
+        active = self._segments[-1]
+        try:
+            with _APPEND_LATENCY.time():
+                self._data_file.write(data)
+                self._index_file.write(b''.join(pending_index))
+        except OSError:
+            # Drop whatever part of the write landed, so the segment matches its index again
+            self._data_file.close()
+            self._index_file.close()
+            active.recover()
+            self._open_active()
+            raise
+        active.size += len(data)
+        active.count += len(pending_data)
+        self._unsynced += len(pending_data)
+
+    def flush(self):
+        """Forces any unsynced appends to stable storage."""
+        with self._lock:
+            if self._data_file is not None:
+                self._sync()
+
+    def _sync(self):
+        if self._unsynced:
+            with _FSYNC_LATENCY.time():
+                os.fsync(self._data_file.fileno())
+                os.fsync(self._index_file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    # --- Retention ---
+
+    def sealed_segments(self) -> list:
+        """(base_seq, next_seq) of every segment except the active one, oldest first."""
+        with self._lock:
+            self.open()
+            return [(segment.base_seq, segment.base_seq + segment.count) for segment in self._segments[:-1]]
+
+    def seal(self, upto: int = None) -> bool:
+        """
+        Seals the active segment early (if it has records) and starts a new one, so
+        retention can drop it once its records are old enough.
+
+        Args:
+            upto: Only seal if the active segment ends there (None: wherever it ends);
+                segments cannot be split in the middle.
+
+        Returns:
+            True if a segment was sealed.
+        """
+        with self._lock:
+            self.open()
+            with self._process_locked():
+                self.refresh()
+                if not self._segments[-1].count or (upto is not None and upto != self.next_seq):
+                    return False
+                self._roll_segment()
+                return True
+
+    def drop_segments_before(self, seq: int) -> int:
+        """
+        Deletes sealed segments whose records all precede `seq`. Sequence numbers of the
+        remaining records do not change; the dropped ones become unreadable.
+
+        Returns:
+            The number of records dropped.
+        """
+        with self._lock:
+            self.open()
+            with self._process_locked():
+                self.refresh()
+                return self._drop_segments_before(seq)
+
+    def _drop_segments_before(self, seq: int) -> int:
+        with self._lock:
+            dropped = 0
+            while len(self._segments) > 1 and self._segments[0].base_seq + self._segments[0].count <= seq:
+                segment = self._segments.pop(0)
+                for path in (segment.data_path, segment.index_path):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                dropped += segment.count
+                logger.info(f"Dropped segment {segment.data_path} ({segment.count} records).")
+            self._dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+            return dropped
+
+    # --- Reads ---
+
+    @property
+    def first_seq(self) -> int:
+        return self._segments[0].base_seq if self._segments else 0
+
+    @property
+    def next_seq(self) -> int:
+        if not self._segments:
+            return 0
+        active = self._segments[-1]
+        return active.base_seq + active.count
+
+    @property
+    def count(self) -> int:
+        return self.next_seq - self.first_seq
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(segment.size for segment in self._segments)
+
+    def _segment_for(self, seq: int) -> _Segment:
+        # Segments are few and sorted; walk back from the newest, which is where
+        # almost all reads land.
+        for segment in reversed(self._segments):
+            if seq >= segment.base_seq:
+                if seq < segment.base_seq + segment.count:
+                    return segment
+                break
+        raise IndexError(f"Sequence number {seq} is not in the store.")
+
+    def read_at(self, seq: int) -> dict:
+        """Returns the record with the given sequence number."""
+        with self._lock:
+            self.open()
+            segment = self._segment_for(seq)
+            return segment.read_local(seq - segment.base_seq)
+
+    def scan(self, start_seq: int = 0):
+        """
+        Yields (seq, record) pairs oldest first, starting at `start_seq`.
+        Segments are read sequentially, so this is the cheap way to replay history.
+        """
+        with self._lock:
+            self.open()
+            segments = list(self._segments)
+            counts = [segment.count for segment in segments]
+        for segment, count in zip(segments, counts):
+            if segment.base_seq + count <= start_seq:
+                continue
+            seq = segment.base_seq
+            try:
+                f = open(segment.data_path, 'rb')
+            except FileNotFoundError:
+                continue  # dropped by retention after the scan started
+            with f:
+                if start_seq > seq:
+                    f.seek(segment.offset_of(start_seq - seq))
+                    seq = start_seq
+                while seq < segment.base_seq + count:
+                    yield seq, decode_record(f.readline())
+                    seq += 1
+
+    def iter_records(self, order: str = NEWEST_FIRST, start_seq: int = None):
+        """
+        Lazily yields (seq, record) pairs in either direction, in constant memory.
+        The records present when iteration starts are visited; later appends are not.
+        Stop early by breaking out of the loop (or closing the generator).
+
+        Args:
+            order: NEWEST_FIRST or OLDEST_FIRST.
+            start_seq: First sequence number to yield (inclusive); defaults to the
+                newest or oldest record depending on `order`.
+        """
+        if order not in (NEWEST_FIRST, OLDEST_FIRST):
+            raise ValueError(f"Unknown order {order!r}; use {NEWEST_FIRST!r} or {OLDEST_FIRST!r}.")
+        with self._lock:
+            self.open()
+            segments = [(segment, segment.count, segment.size) for segment in self._segments]
+            next_seq = self.next_seq
+        if order == NEWEST_FIRST:
+            start_seq = next_seq - 1 if start_seq is None else min(start_seq, next_seq - 1)
+            segments.reverse()
+            step = -1
+        else:
+            start_seq = 0 if start_seq is None else start_seq
+            step = 1
+        for segment, count, size in segments:
+            if order == NEWEST_FIRST and segment.base_seq > start_seq:
+                continue
+            if order == OLDEST_FIRST and segment.base_seq + count <= start_seq:
+                continue
+            local = start_seq - segment.base_seq if segment.base_seq <= start_seq < segment.base_seq + count \
+                else (count - 1 if step < 0 else 0)
+            for local, record in segment.iter_local(count, size, local, step):
+                yield segment.base_seq + local, record
+
+    def read_last(self, limit: int) -> list:
+        """
+        Returns up to `limit` of the newest records, newest first, as (seq, record) pairs.
+        Only the requested records are read from disk.
+        """
+        results = []
+        if limit <= 0:
+            return results
+        for item in self.iter_records(NEWEST_FIRST):
+            results.append(item)
+            if len(results) >= limit:
+                break
+        return results
@@ -1,8 +1,13 @@
 # agents/messenger_agent.py
 
 import logging
+from concurrent.futures import Future
 # Assumes tools/db_tools.py has the function to save the data to the database
-from db_tools import save_presentation_data
+from db_tools import save_presentation_data, save_presentation_delta, save_presentation_batch
+from config import PUBLISH_MODE, PUBLISH_BATCH_MAX, PUBLISH_BATCH_DELAY_S
+from metrics import STAGE_LATENCY, PUBLISH_FAILURES
+from records import as_dict
+from batching import BatchWorker
 
 # --- Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -14,23 +19,32 @@ class MessengerAgent:
     The Messenger Agent (Act/Present Component).
     Receives the raw data package from the Sensor Agent and publishes it
     directly to the database for the frontend dashboard (Streamlit) to retrieve.
+    With a notifier (subscriptions.SubscriptionNotifier), new incidents of every
+    stored package are also pushed to matching subscribers.
     """
 
-    def __init__(self, role: str = "Data Publisher and Presentation Layer"):
+    def __init__(self, role: str = "Data Publisher and Presentation Layer", publish_mode: str = PUBLISH_MODE,
+                 notifier=None):
         self.role = role
-        logger.info(f"Messenger Agent initialized with role: {self.role}")
+        # "full": store every package; "delta": store only changes since the previous cycle
+        if publish_mode not in ("full", "delta"):
+            raise ValueError(f"Unknown publish mode: {publish_mode}")
+        self.publish_mode = publish_mode
+        self.notifier = notifier
+        logger.info(f"Messenger Agent initialized with role: {self.role} (publish mode: {self.publish_mode})")
 
     def act(self, raw_data: dict) -> str:
         """
         Publishes the raw, packaged data to the presentation database.
 
         Args:
-            raw_data: A dictionary containing the raw, structured data
-                      collected and packaged by the Sensor Agent.
+            raw_data: A dictionary (or records.DataPackage) containing the raw,
+                      structured data collected and packaged by the Sensor Agent.
 
         Returns:
             A string indicating the result of the publishing action.
         """
+        raw_data = as_dict(raw_data)
         if not raw_data:
             logger.warning("Received empty data package. Skipping publishing.")
             return "Skipped: Received empty data."
@@ -40,14 +54,20 @@ class MessengerAgent:
 
         try:
             # Call the tool to write the data to the persistent store (e.g., Firestore)
-            success = save_presentation_data(raw_data)
+            with STAGE_LATENCY.labels('publish').time():
+                if self.publish_mode == "delta":
+                    success = save_presentation_delta(raw_data)
+                else:
+                    success = save_presentation_data(raw_data)
 
             if success:
+                self._notify([raw_data])
                 message = "SUCCESS: Successfully published raw data package to the presentation database."
                 logger.info(message)
                 return message
             else:
                 message = "FAILURE: Failed to save data to the database (Check db_tools.py and connection)."
+                PUBLISH_FAILURES.inc()
                 logger.error(message)
                 return message
 
@@ -57,9 +77,111 @@ class MessengerAgent:
             return error_message
         except Exception as e:
             error_message = f"RUNTIME ERROR: An unexpected error occurred during data publishing: {type(e).__name__}: {e}"
+            PUBLISH_FAILURES.inc()
             logger.error(error_message, exc_info=True)
             return error_message
 
+    def act_batch(self, raw_data_list: list) -> list:
+        """
+        Publishes many packages as one group commit (a single append and fsync).
+
+        Args:
+            raw_data_list: Raw, packaged data dictionaries (or records.DataPackage) from the Sensor Agent(s).
+
+        Returns:
+            One result string per package, in order, as act() would return it.
+        """
+        raw_data_list = [as_dict(raw_data) for raw_data in raw_data_list]
+        results = ["Skipped: Received empty data."] * len(raw_data_list)
+        positions = [i for i, raw_data in enumerate(raw_data_list) if raw_data]
+        if not positions:
+            logger.warning("Received only empty data packages. Skipping publishing.")
+            return results
+
+        logger.info(f"Attempting to group-publish {len(positions)} data packages...")
+        try:
+            with STAGE_LATENCY.labels('publish_batch').time():
+                saved = save_presentation_batch([raw_data_list[i] for i in positions],
+                                                delta=self.publish_mode == "delta")
+        except Exception as e:
+            error_message = f"RUNTIME ERROR: An unexpected error occurred during data publishing: {type(e).__name__}: {e}"
+            logger.error(error_message, exc_info=True)
+            saved = [False] * len(positions)
+            failure = error_message
+        else:
+            failure = "FAILURE: Failed to save data to the database (Check db_tools.py and connection)."
+
+        for position, ok in zip(positions, saved):
+            if ok:
+                results[position] = "SUCCESS: Successfully published raw data package to the presentation database."
+            else:
+                results[position] = failure
+                PUBLISH_FAILURES.inc()
+        self._notify([raw_data_list[position] for position, ok in zip(positions, saved) if ok])
+        logger.info(f"Group publish complete: {sum(saved)}/{len(positions)} packages stored.")
+        return results
+
+    def _notify(self, packages: list):
+        """Hands stored packages to the subscription notifier; delivery happens in the background."""
+        if self.notifier is None:
+            return
+        with STAGE_LATENCY.labels('notify_match').time():
+            for package in packages:
+                try:
+                    self.notifier.publish(package)
+                except Exception as e:
+                    logger.error(f"Failed to match package against subscriptions: {e}", exc_info=True)
+
+
+class BatchPublisher:
+    """
+    Write-behind publisher that group-commits packages from many producer threads.
+
+    Producers call submit() (returns a Future) or act() (blocks for the result, so a
+    BatchPublisher can stand in for a MessengerAgent). A background BatchWorker
+    collects queued packages until `max_batch` are waiting or `max_delay_s` has
+    passed since the first one, then stores them with MessengerAgent.act_batch: one
+    durable write per group, and every caller still gets its own result string.
+    With `max_queue`, submit() blocks while that many packages are waiting.
+    """
+
+    def __init__(self, messenger: MessengerAgent = None, max_batch: int = PUBLISH_BATCH_MAX,
+                 max_delay_s: float = PUBLISH_BATCH_DELAY_S, max_queue: int = 0):
+        self.messenger = messenger or MessengerAgent()
+        self._worker = BatchWorker(self._commit, max_batch, max_delay_s, max_queue=max_queue,
+                                   name='batch-publisher')
+
+    def submit(self, raw_data: dict, timeout: float = None) -> Future:
+        """
+        Queues a package; the Future resolves to the publishing result string.
+
+        Raises:
+            queue.Full: The queue stayed full for `timeout` seconds.
+        """
+        future = Future()
+        self._worker.put((raw_data, future), timeout=timeout)
+        return future
+
+    def act(self, raw_data: dict) -> str:
+        """Publishes one package through the group commit and waits for its result."""
+        return self.submit(raw_data).result()
+
+    def qsize(self) -> int:
+        """Packages waiting to be committed."""
+        return self._worker.qsize()
+
+    def close(self):
+        """Stops accepting packages, commits everything already queued and stops the thread."""
+        self._worker.close()
+
+    def _commit(self, batch: list):
+        try:
+            results = self.messenger.act_batch([raw_data for raw_data, _ in batch])
+        except Exception as e:
+            results = [f"RUNTIME ERROR: Group publish failed: {type(e).__name__}: {e}"] * len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
 
 # --- Example Usage (Requires an implementation of tools/db_tools.py) ---
 
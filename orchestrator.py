@@ -1,12 +1,27 @@
 # orchestrator.py
 
 import time
+import queue
+import signal
+import random
 import logging
+import argparse
+import threading
+import collections
 import json  # Used for pretty printing the final output
-from sensor_agent import SensorAgent
-from messenger_agent import MessengerAgent
-from db_tools import initialize_db, fetch_recent_data  # Need fetch_recent_data now
-from config import GCP_PROJECT_ID  # Assumes config.py exists and is minimal
+from concurrent.futures import ThreadPoolExecutor
+from sensor_agent import SensorAgent, DEFAULT_SOURCES
+from messenger_agent import MessengerAgent, BatchPublisher
+from db_tools import (initialize_db, fetch_recent_data, close_db, start_retention,  # Need fetch_recent_data now
+                      load_aggregates, load_columnar)
+from rate_limit import TokenBucket
+from subscriptions import load_notifier
+from records import DataPackage
+from metrics import STAGE_LATENCY, CYCLES, gauge, start_metrics_server, percentile
+from config import (GCP_PROJECT_ID, MAX_CITY_WORKERS, UPSTREAM_RATE_LIMITS, METRICS_PORT,  # Assumes config.py exists
+                    DAEMON_INTERVAL_S, DAEMON_JITTER_S, DAEMON_QUEUE_SIZE,
+                    RETENTION_FULL_DAYS, RETENTION_HOURLY_DAYS, RETENTION_INTERVAL_S, RETENTION_DAILY_DAYS,
+                    SUBSCRIPTIONS_PATH, WEBHOOK_URL, NOTIFY_BATCH_MAX, NOTIFY_BATCH_DELAY_S)
 
 # --- Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,7 +30,9 @@ logger = logging.getLogger('Orchestrator')
 # --- Agent Initialization ---
 try:
     sensor_agent = SensorAgent()
-    messenger_agent = MessengerAgent()
+    messenger_agent = MessengerAgent(notifier=load_notifier(SUBSCRIPTIONS_PATH, WEBHOOK_URL,
+                                                            max_batch=NOTIFY_BATCH_MAX,
+                                                            max_delay_s=NOTIFY_BATCH_DELAY_S))
 except ImportError as e:
     logger.error(f"Failed to import an agent or tool: {e}")
     exit(1)
@@ -23,49 +40,289 @@ except ImportError as e:
 
 # --- Core Workflow Function ---
 
-def run_neighborhood_watch_cycle(city_to_monitor: str = "Amsterdam"):
+def run_neighborhood_watch_cycle(city_to_monitor: str = "Amsterdam", sensor: SensorAgent = None,
+                                 messenger: MessengerAgent = None) -> bool:
     """
     Executes the autonomous agent cycle: Perceive (Sensor) -> Act (Messenger).
+
+    Args:
+        city_to_monitor: The city/neighborhood to run the cycle for.
+        sensor: Sensor Agent to use; defaults to the module-level agent.
+        messenger: Messenger Agent to use; defaults to the module-level agent.
+
+    Returns:
+        True if the cycle completed, False if it was aborted.
     """
+    with STAGE_LATENCY.labels('cycle').time():
+        completed = _run_cycle(city_to_monitor, sensor or sensor_agent, messenger or messenger_agent)
+    CYCLES.labels('ok' if completed else 'aborted').inc()
+    return completed
+
+
+def _is_empty_package(raw_data_package: dict) -> bool:
+    return not raw_data_package or all(not v for v in raw_data_package.values())
+
+
+def _run_cycle(city_to_monitor: str, sensor: SensorAgent, messenger: MessengerAgent) -> bool:
     logger.info("--- STARTING NEW NEIGHBORHOOD WATCH CYCLE ---")
 
     # 1. PERCEIVE: Sensor Agent collects and packages raw data
     logger.info("Step 1: Sensor Agent is collecting and packaging raw data...")
     try:
-        raw_data_package = sensor_agent.perceive(city=city_to_monitor)
+        raw_data_package = sensor.perceive(city=city_to_monitor)
 
-        if not raw_data_package or all(not v for v in raw_data_package.values()):
+        if _is_empty_package(raw_data_package):
             logger.warning("Sensor Agent returned an empty or insufficient data package. Aborting cycle.")
-            return
+            return False
 
     except Exception as e:
         logger.error(f"Sensor Agent failed during perception: {e}")
-        return
+        return False
 
     # 2. ACT/PRESENT: Messenger Agent publishes the raw package
     logger.info("Step 2: Messenger Agent is publishing the raw data package...")
     try:
-        publication_status = messenger_agent.act(raw_data_package)
+        publication_status = messenger.act(raw_data_package)
         logger.info(f"Cycle completed. Publication Status: {publication_status}")
 
     except Exception as e:
         logger.error(f"Messenger Agent failed during publication: {e}")
-        return
+        return False
 
     logger.info("--- CYCLE COMPLETED SUCCESSFULLY ---")
+    return True
+
+
+# --- Multi-City Sharded Execution ---
+
+def run_multi_city_watch(cities: list, rounds: int = 1, max_workers: int = MAX_CITY_WORKERS,
+                         rate_limits: dict = None) -> dict:
+    """
+    Runs the Perceive -> Act cycle for many cities across a bounded worker pool.
+
+    Cities are served round-robin from a shared queue: a worker takes the city at the
+    front, runs one cycle and re-queues it at the back while it has rounds left, so
+    no city gets a second cycle before every other city has had its turn. Upstream
+    calls from all workers share one token bucket per source.
+
+    Args:
+        cities: The cities/neighborhoods to monitor.
+        rounds: How many cycles to run for each city.
+        max_workers: Number of cities processed concurrently.
+        rate_limits: Requests per second per sensor source; defaults to UPSTREAM_RATE_LIMITS.
+
+    Returns:
+        A throughput summary with cycle counts, cycles per second and p50/p99 latency.
+    """
+    rate_limits = UPSTREAM_RATE_LIMITS if rate_limits is None else rate_limits
+    limiters = {name: TokenBucket(rate) for name, rate in rate_limits.items() if rate}
+    # Each worker may have every source in flight at once, plus stragglers past their deadline
+    sensor = SensorAgent(rate_limiters=limiters, max_workers=max_workers * len(DEFAULT_SOURCES) * 2)
+    # Cities finishing together share one group commit instead of serializing on the store
+    messenger = BatchPublisher(messenger_agent)
+
+    pending = collections.deque((city, rounds) for city in cities)
+    pending_lock = threading.Lock()
+    latencies = []
+    failures = []
+
+    def worker():
+        while True:
+            with pending_lock:
+                if not pending:
+                    return
+                city, remaining = pending.popleft()
+            started = time.monotonic()
+            ok = run_neighborhood_watch_cycle(city, sensor=sensor, messenger=messenger)
+            elapsed = time.monotonic() - started
+            with pending_lock:
+                latencies.append(elapsed)
+                if not ok:
+                    failures.append(city)
+                if remaining > 1:
+                    pending.append((city, remaining - 1))
+
+    logger.info(f"--- STARTING MULTI-CITY WATCH: {len(cities)} cities x {rounds} rounds, {max_workers} workers ---")
+    run_started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='city-worker') as pool:
+            for _ in range(min(max_workers, len(cities))):
+                pool.submit(worker)
+    finally:
+        messenger.close()
+        sensor.close()
+    wall_time = time.monotonic() - run_started
+
+    latencies.sort()
+    summary = {
+        "cities": len(cities),
+        "cycles": len(latencies),
+        "failed_cycles": len(failures),
+        "wall_time_s": round(wall_time, 3),
+        "cycles_per_second": round(len(latencies) / wall_time, 2) if wall_time > 0 else 0.0,
+        "p50_cycle_latency_s": round(percentile(latencies, 0.50), 4),
+        "p99_cycle_latency_s": round(percentile(latencies, 0.99), 4),
+    }
+    logger.info(f"--- MULTI-CITY WATCH COMPLETED: {summary} ---")
+    return summary
+
+
+# --- Resident Daemon Mode ---
+
+def _count_published(future):
+    """Counts a daemon package as a completed or aborted cycle once its group commit is done."""
+    status = future.result()
+    CYCLES.labels('ok' if status.startswith("SUCCESS") else 'aborted').inc()
+
+
+def _close_notifier():
+    """Delivers notifications still queued for subscribers (call before exiting)."""
+    if messenger_agent.notifier is not None:
+        messenger_agent.notifier.close()
+
+
+def run_daemon(cities: list, interval_s: float = DAEMON_INTERVAL_S, jitter_s: float = DAEMON_JITTER_S,
+               queue_size: int = DAEMON_QUEUE_SIZE, max_workers: int = MAX_CITY_WORKERS,
+               stop_event: threading.Event = None, max_ticks: int = None) -> int:
+    """
+    Runs the Perceive -> Act cycle for `cities` every `interval_s` seconds until stopped.
+
+    Scheduling is drift-free: tick k starts at start + jitter + k * interval_s on the
+    monotonic clock, and ticks that were overrun are skipped rather than run late.
+    The pipeline has two stages joined by a bounded BatchPublisher queue: perceive
+    workers enqueue packages while its thread group-commits them, so the next tick's
+    perceive overlaps the previous tick's publish. A full queue blocks perceive
+    (backpressure).
+    SIGTERM/SIGINT stop scheduling; packages already queued are published and the
+    store is flushed before returning. Retention compaction runs in the background
+    for as long as the daemon does.
+
+    Args:
+        cities: The cities/neighborhoods to monitor.
+        interval_s: Seconds between tick starts.
+        jitter_s: Maximum random delay before the first tick.
+        queue_size: Capacity of the perceive -> publish queue.
+        max_workers: Number of cities perceived concurrently.
+        stop_event: Optional event to stop the daemon from another thread.
+        max_ticks: Stop after this many ticks (None runs until signalled).
+
+    Returns:
+        The number of ticks that were run.
+    """
+    stop_event = stop_event or threading.Event()
+
+    previous_handlers = {}
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            previous_handlers[signum] = signal.signal(signum, lambda *_: stop_event.set())
+
+    sensor = SensorAgent(max_workers=max_workers * len(DEFAULT_SOURCES) * 2)
+    # Catch the dashboard aggregates and Parquet tables up once now, so saves only fold in their own records
+    load_aggregates()
+    load_columnar()
+    publisher = BatchPublisher(messenger_agent, max_queue=queue_size)
+    gauge('nw_publish_queue_depth', 'Packages waiting in the daemon publish queue.').set_function(publisher.qsize)
+    start_retention(RETENTION_FULL_DAYS, RETENTION_HOURLY_DAYS, RETENTION_INTERVAL_S, RETENTION_DAILY_DAYS)
+
+    def perceive_and_enqueue(city: str):
+        try:
+            package = sensor.perceive(city=city)
+        except Exception as e:
+            CYCLES.labels('aborted').inc()
+            logger.error(f"Sensor Agent failed during perception of {city}: {e}")
+            return
+        if _is_empty_package(package):
+            CYCLES.labels('aborted').inc()
+            logger.warning(f"Empty data package for {city}; not publishing.")
+            return
+        # Queued packages are held as compact records until the publisher stores them
+        package = DataPackage.from_dict(package)
+        # Blocks while the publisher is behind; gives up only on shutdown
+        while not stop_event.is_set():
+            try:
+                publisher.submit(package, timeout=0.5).add_done_callback(_count_published)
+                return
+            except queue.Full:
+                continue
+        # Shutting down: still hand over what was already collected
+        publisher.submit(package).add_done_callback(_count_published)
+
+    start = time.monotonic() + random.uniform(0.0, jitter_s)
+    logger.info(f"--- DAEMON STARTED: {len(cities)} cities every {interval_s}s (first tick in "
+                f"{start - time.monotonic():.1f}s) ---")
+    ticks = 0
+    tick_index = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='daemon-perceive') as pool:
+            while not stop_event.is_set() and (max_ticks is None or ticks < max_ticks):
+                tick_at = start + tick_index * interval_s
+                if stop_event.wait(max(0.0, tick_at - time.monotonic())):
+                    break
+
+                tick_started = time.monotonic()
+                with STAGE_LATENCY.labels('tick_perceive').time():
+                    for future in [pool.submit(perceive_and_enqueue, city) for city in cities]:
+                        future.result()
+                ticks += 1
+
+                # Next tick on the fixed grid; skip any grid points already passed
+                elapsed_ticks = int((time.monotonic() - start) // interval_s) + 1
+                if elapsed_ticks > tick_index + 1:
+                    logger.warning(f"Tick took {time.monotonic() - tick_started:.1f}s; "
+                                   f"skipping {elapsed_ticks - tick_index - 1} overrun tick(s).")
+                tick_index = max(tick_index + 1, elapsed_ticks)
+    finally:
+        logger.info("--- DAEMON STOPPING: flushing queued packages ---")
+        publisher.close()
+        sensor.close()
+        _close_notifier()
+        close_db()
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        logger.info(f"--- DAEMON STOPPED after {ticks} tick(s) ---")
+    return ticks
 
 
 # --- Main Execution and Display ---
 
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(description="Neighborhood Watch Agent orchestrator")
+    parser.add_argument('--cities', help="Comma-separated cities, or @file with one city per line (multi-city mode)")
+    parser.add_argument('--rounds', type=int, default=1, help="Cycles per city in multi-city mode")
+    parser.add_argument('--workers', type=int, default=MAX_CITY_WORKERS, help="Concurrent cities in multi-city mode")
+    parser.add_argument('--daemon', action='store_true', help="Stay resident and run a cycle every --interval seconds")
+    parser.add_argument('--interval', type=float, default=DAEMON_INTERVAL_S, help="Seconds between daemon ticks")
+    args = parser.parse_args()
+
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+
     # 0. Initialize Database Connection (ensures the data file exists)
     if not initialize_db():
         logger.critical("Failed to initialize local file storage. Cannot proceed.")
         exit(1)
 
+    city_list = []
+    if args.cities:
+        if args.cities.startswith('@'):
+            with open(args.cities[1:]) as f:
+                city_list = [line.strip() for line in f if line.strip()]
+        else:
+            city_list = [c.strip() for c in args.cities.split(',') if c.strip()]
+
+    if args.daemon:
+        run_daemon(city_list or ["My Local Neighborhood"], interval_s=args.interval, max_workers=args.workers)
+        exit(0)
+
+    if city_list:
+        print(json.dumps(run_multi_city_watch(city_list, rounds=args.rounds, max_workers=args.workers), indent=4))
+        _close_notifier()
+        exit(0)
+
     # 1. Run the Agent Cycle Once
     run_neighborhood_watch_cycle(city_to_monitor="My Local Neighborhood")
+    _close_notifier()
 
     # 2. Fetch and Display the Results
     print("\n" + "=" * 80)
@@ -0,0 +1,68 @@
+# tools/rate_limit.py - Token-bucket rate limiting for upstream API calls
+
+import time
+import threading
+
+
+class RateLimited(Exception):
+    """Raised when a call could not obtain a rate-limit token in time."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+    Tokens refill continuously at `rate` per second up to `capacity`; each call
+    takes one token, waiting for a refill if the bucket is empty.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Takes `tokens` if they are available right now."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0, timeout: float = None) -> bool:
+        """
+        Takes `tokens`, blocking until they are available.
+
+        Args:
+            tokens: Number of tokens to take.
+            timeout: Maximum seconds to wait; None waits indefinitely.
+
+        Returns:
+            True if the tokens were taken, False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate if self.rate > 0 else float('inf')
+            if deadline is not None:
+                remaining = deadline - now
+                if remaining <= 0 or wait > remaining:
+                    return False
+            time.sleep(wait)
+
+    def deposit(self, tokens: float = 1.0):
+        """Returns tokens to the bucket (never above capacity)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + tokens)
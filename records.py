@@ -0,0 +1,145 @@
+# tools/records.py - Compact typed records for data packages, weather readings and incidents
+
+import sys
+from collections import namedtuple
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'MISSING'
+
+
+# Marks a field the source dict did not have, so to_dict() reproduces it exactly
+MISSING = _Missing()
+
+_intern = sys.intern
+
+
+def _fields(name: str, fields: tuple):
+    """namedtuple base for a record: the given fields (default MISSING) plus `extra` (default None)."""
+    return namedtuple(name, fields + ('extra',), defaults=(MISSING,) * len(fields) + (None,))
+
+
+class _Record:
+    """
+    Conversions shared by the typed records.
+
+    Records are tuple subclasses without an instance dict: one slot per known
+    field plus `extra` for any other keys, so a record round-trips to the dict
+    it was built from. Fields in INTERNED hold enum-like strings (types,
+    statuses, locations) that are interned when a record is built with
+    from_dict(), so thousands of records share one copy of each.
+    NESTED maps a field to (record class, is_list).
+
+    Records only change how packages are held in memory; on the wire and on
+    disk they stay the plain JSON objects that to_dict() returns.
+    """
+
+    __slots__ = ()
+    INTERNED = frozenset()
+    NESTED = {}
+
+    def __init_subclass__(cls, **kwargs):
+        # Precomputed per class, so the conversions below do no per-field lookups
+        super().__init_subclass__(**kwargs)
+        cls.FIELDS = cls._fields[:-1]
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+        cls._INTERNED_AT = tuple(i for i, name in enumerate(cls.FIELDS) if name in cls.INTERNED)
+        cls._NESTED_AT = tuple((i, cls.NESTED[name]) for i, name in enumerate(cls.FIELDS) if name in cls.NESTED)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Builds a record from its JSON dict shape (nested records included)."""
+        values = [data.get(name, MISSING) for name in cls.FIELDS]
+        if cls._FIELD_SET.issuperset(data):
+            values.append(None)
+        else:
+            values.append({key: value for key, value in data.items() if key not in cls._FIELD_SET})
+        for i in cls._INTERNED_AT:
+            value = values[i]
+            if type(value) is str:
+                values[i] = _intern(value)
+        for i, spec in cls._NESTED_AT:
+            values[i] = _nested_from(spec, values[i])
+        return tuple.__new__(cls, values)
+
+    def to_dict(self) -> dict:
+        """The record in its original JSON dict shape."""
+        values = list(self)
+        for i, _ in self._NESTED_AT:
+            values[i] = _nested_to(values[i])
+        extra = values.pop()
+        if MISSING in values:
+            data = {name: value for name, value in zip(self.FIELDS, values) if value is not MISSING}
+        else:
+            data = dict(zip(self.FIELDS, values))
+        if extra:
+            data.update(extra)
+        return data
+
+    def get(self, name: str, default=None):
+        """dict-style access to a field (or extra key), for code written against the dict shape."""
+        value = getattr(self, name) if name in self._FIELD_SET else (self.extra or {}).get(name, MISSING)
+        return default if value is MISSING else value
+
+
+def _nested_from(spec: tuple, value):
+    """Converts a nested value into records; values of any other shape (None, error strings) are kept as-is."""
+    record_cls, is_list = spec
+    if not is_list:
+        return record_cls.from_dict(value) if type(value) is dict else value
+    if type(value) is not list:
+        return value
+    return [record_cls.from_dict(item) if type(item) is dict else item for item in value]
+
+
+def _nested_to(value):
+    if isinstance(value, _Record):
+        return value.to_dict()
+    if type(value) is list:
+        return [item.to_dict() if isinstance(item, _Record) else item for item in value]
+    return value
+
+
+class WeatherReading(_Record, _fields('WeatherReading', ('source', 'city', 'temperature_c', 'condition',
+                                                          'wind_speed_kph'))):
+    """A weather observation (the mocked shape; other providers' keys are kept in `extra`)."""
+
+    __slots__ = ()
+    INTERNED = frozenset({'source', 'city', 'condition'})
+
+
+class Incident(_Record, _fields('Incident', ('id', 'type', 'status', 'location', 'details', 'impact'))):
+    """A city incident, roadwork or event."""
+
+    __slots__ = ()
+    INTERNED = frozenset({'type', 'status', 'location', 'impact'})
+
+
+class OvUpdate(_Record, _fields('OvUpdate', ('line', 'status', 'details'))):
+    """A public transport (OV) service update."""
+
+    __slots__ = ()
+    INTERNED = frozenset({'line', 'status'})
+
+
+class DataPackage(_Record, _fields('DataPackage', ('fetch_time_utc', 'monitoring_location', 'raw_weather',
+                                                    'raw_incidents', 'raw_ov_updates', 'partial_sources',
+                                                    'cached_sources'))):
+    """The Sensor Agent's package for one city and cycle."""
+
+    __slots__ = ()
+    INTERNED = frozenset({'monitoring_location'})
+    NESTED = {
+        'raw_weather': (WeatherReading, False),
+        'raw_incidents': (Incident, True),
+        'raw_ov_updates': (OvUpdate, True),
+    }
+
+
+def as_dict(package):
+    """Returns a package in its dict shape, whether it is a DataPackage or already a dict."""
+    return package.to_dict() if isinstance(package, DataPackage) else package
+
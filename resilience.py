@@ -0,0 +1,298 @@
+# tools/resilience.py - Tail-latency controls for upstream calls: circuit breakers, hedged requests, retry budgets
+
+import time
+import random
+import logging
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import (UPSTREAM_BREAKER_FAILURES, UPSTREAM_BREAKER_RESET_S, UPSTREAM_HEDGE_QUANTILE,
+                    UPSTREAM_HEDGE_MIN_SAMPLES, UPSTREAM_MAX_RETRIES, UPSTREAM_RETRY_RATIO,
+                    UPSTREAM_RETRY_MIN_PER_S)
+from rate_limit import TokenBucket
+from metrics import counter, gauge, percentile
+
+logger = logging.getLogger('Resilience')
+logger.setLevel(logging.INFO)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+UPSTREAM_CALLS = counter('nw_upstream_calls_total', 'Upstream calls by outcome (ok, failed, stale, '
+                         'short_circuited) and extra attempts (hedged, hedge_won, retried, retry_denied).',
+                         ('upstream', 'outcome'))
+BREAKER_STATE = gauge('nw_upstream_breaker_state', 'Circuit breaker state per upstream '
+                      '(0 closed, 1 half-open, 2 open).', ('upstream',))
+
+
+class CircuitOpenError(Exception):
+    """Raised when an upstream's breaker is open and there is no last known value to serve."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failures in a row the breaker opens and calls fail
+    fast for `reset_timeout_s`. It then lets a single trial call through
+    (half-open): success closes it again, failure re-opens it for another timeout.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = UPSTREAM_BREAKER_FAILURES,
+                 reset_timeout_s: float = UPSTREAM_BREAKER_RESET_S):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout_s = reset_timeout_s
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._state_gauge = BREAKER_STATE.labels(name)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_s:
+                return HALF_OPEN
+            return self._state
+
+    def _set_state(self, state: str):
+        if state != self._state:
+            logger.info(f"Circuit breaker '{self.name}' {self._state} -> {state}.")
+        self._state = state
+        self._state_gauge.set(_STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        """True if a call may go out now (in half-open state, only the one trial call)."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout_s:
+                    return False
+                self._set_state(HALF_OPEN)
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            self._set_state(CLOSED)
+
+    def release(self):
+        """Ends a call that says nothing about the upstream's health (e.g. a 4xx), freeing a half-open trial."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies, for the hedging threshold."""
+
+    def __init__(self, window: int = 200):
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed_s: float):
+        with self._lock:
+            self._samples.append(elapsed_s)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def quantile(self, q: float) -> float:
+        """The q-quantile of the window (nearest rank), or None while it is empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return percentile(samples, q)
+
+
+class RetryBudget:
+    """
+    Caps retries (and hedges) at a fraction of normal traffic.
+
+    Every first attempt deposits `ratio` tokens into a TokenBucket that also
+    refills at `min_per_s`, so a quiet upstream can still be retried; each extra
+    attempt takes a whole token. When an upstream fails everything, extra attempts
+    stop at roughly `ratio` of the request rate instead of multiplying the load
+    on it.
+    """
+
+    def __init__(self, ratio: float = UPSTREAM_RETRY_RATIO, min_per_s: float = UPSTREAM_RETRY_MIN_PER_S,
+                 capacity: float = 10.0):
+        self.ratio = ratio
+        self._bucket = TokenBucket(min_per_s, capacity=capacity)
+
+    def record_request(self):
+        self._bucket.deposit(self.ratio)
+
+    def try_spend(self) -> bool:
+        return self._bucket.try_acquire()
+
+
+class Upstream:
+    """
+    Guards every call to one upstream API.
+
+    * A CircuitBreaker fails fast once the upstream is unhealthy; while it is open,
+      calls return the last value that succeeded for the same key.
+    * Calls still running past the `hedge_quantile` latency (p95 by default) of
+      recent calls get a hedged duplicate; the first response wins.
+    * Failures the `retryable` predicate accepts are retried with jittered
+      exponential backoff, up to `max_retries`, while the RetryBudget allows.
+      Only those failures count toward opening the breaker; any other error
+      (a 4xx response) is raised without touching it.
+    """
+
+    def __init__(self, name: str, breaker: CircuitBreaker = None, budget: RetryBudget = None,
+                 max_retries: int = UPSTREAM_MAX_RETRIES, hedge_quantile: float = UPSTREAM_HEDGE_QUANTILE,
+                 hedge_min_samples: int = UPSTREAM_HEDGE_MIN_SAMPLES, retry_backoff_s: float = 0.05,
+                 retryable=None, max_workers: int = 16):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker(name)
+        self.budget = budget or RetryBudget()
+        self.max_retries = max_retries
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.retry_backoff_s = retry_backoff_s
+        self.retryable = retryable or (lambda exc: True)
+        self.latency = LatencyTracker()
+        self._last_values = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'upstream-{name}')
+        self._outcomes = {}
+
+    def _count(self, outcome: str):
+        child = self._outcomes.get(outcome)
+        if child is None:
+            child = self._outcomes[outcome] = UPSTREAM_CALLS.labels(self.name, outcome)
+        child.inc()
+
+    def hedge_delay_s(self) -> float:
+        """Seconds after which a duplicate request is sent (None until enough latencies are known)."""
+        if self.hedge_quantile is None or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.quantile(self.hedge_quantile)
+
+    def last_value(self, key):
+        with self._lock:
+            return self._last_values.get(key)
+
+    def call(self, key, fetch):
+        """
+        Runs `fetch()` under the breaker, hedging and retry budget.
+
+        Args:
+            key: Identifies the request (e.g. URL and params) for the last known value.
+            fetch: Zero-argument callable doing the actual request.
+
+        Returns:
+            The fetched value, or the last known value for `key` while the breaker is open.
+
+        Raises:
+            CircuitOpenError: The breaker is open and `key` has no last known value.
+            Exception: Whatever the final attempt raised.
+        """
+        self.budget.record_request()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                return self._serve_stale(key)
+            try:
+                value = self._hedged(fetch)
+            except Exception as e:
+                retryable = self.retryable(e)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    # The upstream answered (e.g. 404 for an unknown city); only failures the
+                    # predicate accepts count toward opening the breaker
+                    self.breaker.release()
+                if attempt >= self.max_retries or not retryable:
+                    self._count('failed')
+                    raise
+                if not self.budget.try_spend():
+                    self._count('retry_denied')
+                    self._count('failed')
+                    raise
+                attempt += 1
+                self._count('retried')
+                logger.warning(f"Upstream '{self.name}' failed ({e}); retry {attempt}/{self.max_retries}.")
+                time.sleep(self.retry_backoff_s * (2 ** (attempt - 1)) * random.uniform(0.5, 1.0))
+                continue
+            self.breaker.record_success()
+            with self._lock:
+                self._last_values[key] = value
+            self._count('ok')
+            return value
+
+    def _serve_stale(self, key):
+        value = self.last_value(key)
+        if value is None:
+            self._count('short_circuited')
+            raise CircuitOpenError(f"circuit for upstream '{self.name}' is open")
+        self._count('stale')
+        logger.warning(f"Circuit for upstream '{self.name}' is open; serving the last known value.")
+        return value
+
+    def _timed(self, fetch):
+        started = time.monotonic()
+        value = fetch()
+        self.latency.observe(time.monotonic() - started)
+        return value
+
+    def _hedged(self, fetch):
+        delay = self.hedge_delay_s()
+        if delay is None:
+            return self._timed(fetch)
+
+        # 1. Send the primary request and give it until the latency threshold
+        primary = self._executor.submit(self._timed, fetch)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.budget.try_spend():
+            return primary.result()
+
+        # 2. Still running: send a duplicate and take the first success
+        self._count('hedged')
+        hedge = self._executor.submit(self._timed, fetch)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count('hedge_won')
+                    return future.result()
+                error = future.exception()
+        raise error
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(name: str, **kwargs) -> Upstream:
+    """Returns the process-wide guard for upstream `name`, creating it (with `kwargs`) on first use."""
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        with _upstreams_lock:
+            upstream = _upstreams.get(name)
+            if upstream is None:
+                upstream = _upstreams[name] = Upstream(name, **kwargs)
+    return upstream
@@ -0,0 +1,421 @@
+# tools/retention.py - Tiered retention: full records for a recent window, hourly and daily rollups after that
+
+import os
+import json
+import logging
+import datetime
+import threading
+from collections import Counter
+from log_store import OLDEST_FIRST
+from change_detector import record_location, record_incidents
+from columnar_store import weather_row
+
+logger = logging.getLogger('Retention')
+logger.setLevel(logging.INFO)
+
+HOURLY = 'hourly'
+DAILY = 'daily'
+ROLLUP_FILE = 'rollups.json'
+JOURNAL_FILE = 'rollups.journal'
+# The checkpoint is rewritten once the journal is larger than it (and at least this large)
+CHECKPOINT_MIN_BYTES = 1024 * 1024
+
+
+def _bucket_start(timestamp: datetime.datetime, resolution: str) -> str:
+    if resolution == DAILY:
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+    return timestamp.replace(minute=0, second=0, microsecond=0).isoformat()
+
+
+def _parse(value) -> datetime.datetime:
+    parsed = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    # Stored timestamps are naive local time; compare everything in that frame
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo is not None else parsed
+
+
+def _new_bucket(location: str, bucket_start: str) -> dict:
+    return {
+        "monitoring_location": location,
+        "bucket_start": bucket_start,
+        "records": 0,
+        "temperature_min": None,
+        "temperature_max": None,
+        "temperature_sum": 0.0,
+        "temperature_count": 0,
+        "conditions": {},
+        "incidents": {},
+        "incidents_total": 0,
+    }
+
+
+def _merge(target: dict, source: dict):
+    """Folds one rollup bucket into another (e.g. 24 hourly buckets into a daily one)."""
+    target["records"] += source["records"]
+    for key, pick in (("temperature_min", min), ("temperature_max", max)):
+        if source[key] is not None:
+            target[key] = source[key] if target[key] is None else pick(target[key], source[key])
+    target["temperature_sum"] += source["temperature_sum"]
+    target["temperature_count"] += source["temperature_count"]
+    for key in ("conditions", "incidents"):
+        for name, count in source[key].items():
+            target[key][name] = target[key].get(name, 0) + count
+    target["incidents_total"] += source["incidents_total"]
+
+
+def rollup_of(record: dict) -> dict:
+    """A single-record rollup bucket (hourly), or None if the record has no usable timestamp."""
+    try:
+        timestamp = _parse(record.get('fetch_timestamp'))
+    except (TypeError, ValueError):
+        return None
+    bucket = _new_bucket(record_location(record) or 'unknown', _bucket_start(timestamp, HOURLY))
+    bucket["records"] = 1
+    weather = weather_row(record)
+    if weather is not None:
+        temperature = weather["temperature_c"]
+        if temperature is not None:
+            bucket.update(temperature_min=temperature, temperature_max=temperature,
+                          temperature_sum=temperature, temperature_count=1)
+        if weather["condition"]:
+            bucket["conditions"][str(weather["condition"])] = 1
+    incident_types = Counter(str(incident.get('type', 'Unknown')) for incident in record_incidents(record)
+                             if isinstance(incident, dict) and 'error' not in incident)
+    bucket["incidents"] = dict(incident_types)
+    bucket["incidents_total"] = sum(incident_types.values())
+    return bucket
+
+
+def present(bucket: dict, resolution: str) -> dict:
+    """Shapes a stored bucket for callers, adding the mean temperature and dominant condition."""
+    conditions = bucket["conditions"]
+    return {
+        "resolution": resolution,
+        "monitoring_location": bucket["monitoring_location"],
+        "bucket_start": bucket["bucket_start"],
+        "records": bucket["records"],
+        "temperature_min": bucket["temperature_min"],
+        "temperature_max": bucket["temperature_max"],
+        "temperature_mean": (bucket["temperature_sum"] / bucket["temperature_count"]
+                             if bucket["temperature_count"] else None),
+        "dominant_condition": max(conditions, key=conditions.get) if conditions else None,
+        "incident_counts": dict(bucket["incidents"]),
+        "incidents_total": bucket["incidents_total"],
+    }
+
+
+class RollupStore:
+    """
+    Hourly and daily rollups per monitoring_location.
+
+    They are persisted as a checkpoint (ROLLUP_FILE) plus a journal of JSON lines:
+    each save appends one line holding the full state of the buckets changed since
+    the previous save, the buckets removed, and `rolled_upto_seq`, then fsyncs.
+    A save therefore costs as much as what changed, not the whole history. Once the
+    journal outgrows the checkpoint, the checkpoint is rewritten and the journal
+    emptied. Replaying a journal line sets buckets rather than adding to them, so a
+    line applied twice (after a crash during a checkpoint) is harmless, and a torn
+    last line is discarded. `rolled_upto_seq` records which log records are already
+    folded in, so a compaction interrupted between saving rollups and dropping
+    segments is not counted twice.
+    """
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, ROLLUP_FILE)
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+        self._lock = threading.RLock()
+        self.rolled_upto_seq = 0
+        self._buckets = {HOURLY: {}, DAILY: {}}
+        self._changed = {HOURLY: set(), DAILY: set()}
+        self._removed = {HOURLY: set(), DAILY: set()}
+        self._saved_upto_seq = 0
+        self._checkpoint_bytes = 0
+        self._journal_bytes = 0
+        self.load()
+
+    def load(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    state = json.load(f)
+                self._checkpoint_bytes = os.path.getsize(self.path)
+                self.rolled_upto_seq = state.get("rolled_upto_seq", 0)
+                for resolution in (HOURLY, DAILY):
+                    self._buckets[resolution] = {
+                        (b["monitoring_location"], b["bucket_start"]): b for b in state.get(resolution, [])
+                    }
+            self._replay_journal()
+            self._saved_upto_seq = self.rolled_upto_seq
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        good_bytes = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn last line of an interrupted save
+                good_bytes += len(line)
+                for resolution in (HOURLY, DAILY):
+                    for key in entry.get(f"removed_{resolution}", []):
+                        self._buckets[resolution].pop(tuple(key), None)
+                    for bucket in entry.get(resolution, []):
+                        self._buckets[resolution][(bucket["monitoring_location"], bucket["bucket_start"])] = bucket
+                self.rolled_upto_seq = max(self.rolled_upto_seq, entry.get("rolled_upto_seq", 0))
+        if good_bytes < os.path.getsize(self.journal_path):
+            # Drop the torn line, so the next save does not append to it
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(good_bytes)
+        self._journal_bytes = good_bytes
+
+    def save(self):
+        """Appends the changes since the last save to the journal and fsyncs it (see the class docstring)."""
+        with self._lock:
+            if not any(self._changed.values()) and not any(self._removed.values()) \
+                    and self.rolled_upto_seq == self._saved_upto_seq:
+                return
+            entry = {"rolled_upto_seq": self.rolled_upto_seq}
+            for resolution in (HOURLY, DAILY):
+                entry[resolution] = [self._buckets[resolution][key] for key in sorted(self._changed[resolution])
+                                     if key in self._buckets[resolution]]
+                entry[f"removed_{resolution}"] = [list(key) for key in sorted(self._removed[resolution])]
+            line = (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.journal_path, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_bytes += len(line)
+            self._changed = {HOURLY: set(), DAILY: set()}
+            self._removed = {HOURLY: set(), DAILY: set()}
+            self._saved_upto_seq = self.rolled_upto_seq
+            if self._journal_bytes > max(self._checkpoint_bytes, CHECKPOINT_MIN_BYTES):
+                self.checkpoint()
+
+    def checkpoint(self):
+        """Writes every bucket to the checkpoint atomically (temporary file, then rename) and empties the journal."""
+        with self._lock:
+            state = {"rolled_upto_seq": self.rolled_upto_seq}
+            for resolution in (HOURLY, DAILY):
+                state[resolution] = sorted(self._buckets[resolution].values(),
+                                           key=lambda b: (b["bucket_start"], b["monitoring_location"]))
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(state, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(self.path + '.tmp', self.path)
+            self._checkpoint_bytes = os.path.getsize(self.path)
+            # A crash before this truncate only replays lines the checkpoint already reflects
+            with open(self.journal_path, 'wb') as f:
+                os.fsync(f.fileno())
+            self._journal_bytes = 0
+
+    def add(self, seq: int, record: dict):
+        """Folds one log record into its hourly bucket (records already folded in are ignored)."""
+        with self._lock:
+            if seq < self.rolled_upto_seq:
+                return
+            bucket = rollup_of(record)
+            if bucket is not None:
+                self._fold(HOURLY, bucket)
+            self.rolled_upto_seq = seq + 1
+
+    def _fold(self, resolution: str, bucket: dict):
+        key = (bucket["monitoring_location"], bucket["bucket_start"])
+        target = self._buckets[resolution].get(key)
+        if target is None:
+            self._buckets[resolution][key] = target = _new_bucket(*key)
+        _merge(target, bucket)
+        self._changed[resolution].add(key)
+        self._removed[resolution].discard(key)
+
+    def _remove(self, resolution: str, key: tuple) -> dict:
+        self._changed[resolution].discard(key)
+        self._removed[resolution].add(key)
+        return self._buckets[resolution].pop(key)
+
+    def downsample(self, before: datetime.datetime) -> int:
+        """Moves hourly buckets that start before `before` into daily buckets."""
+        with self._lock:
+            cutoff = before.isoformat()
+            moved = [key for key, bucket in self._buckets[HOURLY].items() if bucket["bucket_start"] < cutoff]
+            for key in moved:
+                bucket = self._remove(HOURLY, key)
+                daily = dict(bucket, bucket_start=_bucket_start(_parse(bucket["bucket_start"]), DAILY))
+                self._fold(DAILY, daily)
+            return len(moved)
+
+    def expire(self, before: datetime.datetime) -> int:
+        """Deletes daily buckets that start before `before`."""
+        with self._lock:
+            cutoff = before.isoformat()
+            expired = [key for key, bucket in self._buckets[DAILY].items() if bucket["bucket_start"] < cutoff]
+            for key in expired:
+                self._remove(DAILY, key)
+            return len(expired)
+
+    def query(self, resolution: str = None, location: str = None, start=None, end=None) -> list:
+        """Rollups oldest first; `resolution` None returns daily then hourly (i.e. chronological)."""
+        start = _parse(start).isoformat() if start is not None else None
+        end = _parse(end).isoformat() if end is not None else None
+        results = []
+        with self._lock:
+            for res in ((resolution,) if resolution else (DAILY, HOURLY)):
+                for bucket in self._buckets[res].values():
+                    if location is not None and bucket["monitoring_location"].casefold() != location.casefold():
+                        continue
+                    if start is not None and bucket["bucket_start"] < start:
+                        continue
+                    if end is not None and bucket["bucket_start"] > end:
+                        continue
+                    results.append(present(bucket, res))
+        results.sort(key=lambda b: (b["bucket_start"], b["monitoring_location"]))
+        return results
+
+
+class RetentionCompactor:
+    """
+    Applies the retention tiers to a SegmentedLogStore off the write path.
+
+    * records newer than `full_days` stay in the log at full resolution;
+    * sealed segments whose newest record is older than that are folded into hourly
+      rollups and deleted;
+    * hourly rollups older than `hourly_days` are merged into daily rollups, which
+      are deleted after `daily_days` (kept indefinitely if it is 0 or None).
+
+    The active segment is never dropped, so writers are not blocked beyond the
+    store lock held while a segment is unlinked. It is sealed once its oldest
+    record is `segment_days` old, so a store too small to fill a segment still
+    ages out: records are kept at most about `full_days + segment_days`. Stores
+    that can split a range anywhere (SQLite) are also sealed right at the cutoff,
+    so records are kept for `full_days`.
+    """
+
+    def __init__(self, store, rollups: RollupStore, full_days: float = 7.0, hourly_days: float = 90.0,
+                 interval_s: float = 3600.0, on_dropped=None, segment_days: float = 1.0,
+                 daily_days: float = 730.0, before_drop=None):
+        self.store = store
+        self.rollups = rollups
+        self.full_days = full_days
+        self.hourly_days = hourly_days
+        self.daily_days = daily_days
+        self.segment_days = segment_days
+        self.interval_s = interval_s
+        self.on_dropped = on_dropped
+        # Called with (base_seq, next_seq) before a range is deleted, e.g. to re-snapshot state kept in it
+        self.before_drop = before_drop
+        self._stop = threading.Event()
+        self._thread = None
+
+    def compact_once(self, now: datetime.datetime = None) -> int:
+        """
+        Runs one retention pass.
+
+        Returns:
+            The number of log records rolled up and dropped.
+        """
+        now = now or datetime.datetime.now()
+        cutoff = now - datetime.timedelta(days=self.full_days)
+        self._seal_if_stale(now)
+        self._seal_at_cutoff(cutoff)
+        dropped = 0
+        for base_seq, next_seq in self.store.sealed_segments():
+            if next_seq <= base_seq:
+                continue
+            # Segments are in time order: stop at the first one still (partly) in the window
+            newest = self._timestamp(next_seq - 1)
+            if newest is not None and newest >= cutoff:
+                break
+
+            # 1. Fold the segment into hourly rollups and persist them
+            for seq, record in self.store.iter_records(OLDEST_FIRST, max(base_seq, self.rollups.rolled_upto_seq)):
+                if seq >= next_seq:
+                    break
+                self.rollups.add(seq, record)
+            self.rollups.save()
+            if self.before_drop is not None:
+                self.before_drop(base_seq, next_seq)
+
+            # 2. Only then delete the raw records
+            count = self.store.drop_segments_before(next_seq)
+            dropped += count
+            if count and self.on_dropped is not None:
+                self.on_dropped(next_seq)
+
+        moved = self.rollups.downsample(now - datetime.timedelta(days=self.hourly_days))
+        expired = self.rollups.expire(now - datetime.timedelta(days=self.daily_days)) if self.daily_days else 0
+        if moved or expired:
+            self.rollups.save()
+        if dropped or moved or expired:
+            logger.info(f"Retention pass rolled up {dropped} records, merged {moved} hourly buckets into daily "
+                        f"and deleted {expired} expired daily buckets.")
+        return dropped
+
+    def _seal_if_stale(self, now: datetime.datetime):
+        """Seals the active segment once its oldest record is `segment_days` old."""
+        sealed = self.store.sealed_segments()
+        active_base = sealed[-1][1] if sealed else self.store.first_seq
+        if active_base >= self.store.next_seq:
+            return
+        oldest = self._timestamp(active_base)
+        if oldest is not None and oldest < now - datetime.timedelta(days=self.segment_days) and self.store.seal():
+            logger.info(f"Sealed the active segment (oldest record {oldest.isoformat()}) for retention.")
+
+    def _seal_at_cutoff(self, cutoff: datetime.datetime):
+        """
+        Ends a range just before the first record inside the full-resolution window, so
+        the older records in that range can be dropped now. Only stores that can split
+        a range there (SQLite) do; the log can seal only the end of its active segment.
+        """
+        sealed = self.store.sealed_segments()
+        active = (sealed[-1][1] if sealed else self.store.first_seq, self.store.next_seq)
+        for base_seq, next_seq in sealed + [active]:
+            newest = self._timestamp(next_seq - 1) if next_seq > base_seq else None
+            if newest is None or newest < cutoff:
+                continue
+            # Records are in time order: binary search for the first one at or after the cutoff
+            low, high = base_seq, next_seq - 1
+            while low < high:
+                middle = (low + high) // 2
+                timestamp = self._timestamp(middle)
+                if timestamp is None:
+                    return
+                if timestamp < cutoff:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low > base_seq and self.store.seal(low):
+                logger.info(f"Split the range at seq {low}, the first record inside the retention window.")
+            return
+        # Every record is older than the cutoff
+        if active[1] > active[0]:
+            self.store.seal()
+
+    def _timestamp(self, seq: int) -> datetime.datetime:
+        """The parsed fetch_timestamp of record `seq`, or None if it is missing or unreadable."""
+        try:
+            return _parse(self.store.read_at(seq).get('fetch_timestamp'))
+        except (IndexError, TypeError, ValueError):
+            return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.compact_once()
+            except Exception as e:
+                logger.error(f"Retention pass failed: {e}", exc_info=True)
+
+    def start(self):
+        """Runs a pass every `interval_s` seconds on a background thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='retention-compactor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
\ No newline at end of file
@@ -1,8 +1,15 @@
 # agents/sensor_agent.py
 
+import time
 import logging
 import datetime
 import random
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from config import SOURCE_DEADLINE_S, CYCLE_BUDGET_S, SOURCE_POLL_INTERVALS
+from rate_limit import RateLimited
+from metrics import STAGE_LATENCY, SOURCE_FETCH_LATENCY, SOURCE_FAILURES, PARTIAL_CYCLES
+from source_registry import SourceRegistry, SOURCE_POLLS, build_registry
+from records import DataPackage
 
 # NOTE: The actual implementation would import from tools.api_tools
 # from tools.api_tools import get_weather, get_city_data
@@ -44,31 +51,88 @@ def mock_get_city_data(city: str) -> list:
     return random.sample(valid_incidents, random.randint(1, 3))
 
 
+def mock_get_ov_updates(city: str) -> list:
+    """Mocks fetching public transport (OV) service updates."""
+    updates = [
+        {"line": "Tram 3", "status": "Delayed", "details": "Minor delay due to technical issue."},
+        {"line": "Bus 22", "status": "Diverted", "details": "Diverted around Kerkstraat roadwork."},
+        {"line": "Metro 51", "status": "On Time", "details": "Running normally."},
+    ]
+    return random.sample(updates, random.randint(0, 2))
+
+
 # --- End of MOCK API TOOLS ---
 
+# Data sources: name -> (package key, fetch function, empty value).
+# In production these would be the tools/api_tools.py fetchers. Each is polled at its
+# own adaptive interval (config.SOURCE_POLL_INTERVALS).
+DEFAULT_SOURCES = {
+    "weather": ("raw_weather", mock_get_weather, dict),
+    "incidents": ("raw_incidents", mock_get_city_data, list),
+    "ov_updates": ("raw_ov_updates", mock_get_ov_updates, list),
+}
+
+
+def _timed_fetch(name: str, fetch, city: str, limiter=None, limiter_timeout: float = None) -> tuple:
+    """Runs one source fetch (after taking a rate-limit token, if limited) and returns (result, elapsed seconds)."""
+    if limiter is not None and not limiter.acquire(timeout=limiter_timeout):
+        raise RateLimited(f"no rate-limit token within {limiter_timeout:.2f}s")
+    started = time.monotonic()
+    result = fetch(city)
+    elapsed = time.monotonic() - started
+    SOURCE_FETCH_LATENCY.labels(name).observe(elapsed)
+    return result, elapsed
+
 
 class SensorAgent:
     """
     The Sensor Agent (Perceive Component).
     Collects raw data from various external APIs and packages it into a
     single, structured dictionary.
+
+    Sources come from a SourceRegistry: by default the DEFAULT_SOURCES with the
+    adaptive intervals of config.SOURCE_POLL_INTERVALS. A `sources` mapping
+    without intervals is polled on every cycle.
     """
 
-    def __init__(self, role: str = "Expert Data Retrieval Specialist"):
+    def __init__(self, role: str = "Expert Data Retrieval Specialist", sources: dict = None,
+                 source_deadline_s: float = SOURCE_DEADLINE_S, cycle_budget_s: float = CYCLE_BUDGET_S,
+                 source_deadlines: dict = None, max_workers: int = None, rate_limiters: dict = None,
+                 registry: SourceRegistry = None):
         self.role = role
+        if registry is None:
+            registry = build_registry(sources) if sources else build_registry(DEFAULT_SOURCES, SOURCE_POLL_INTERVALS)
+        self.registry = registry
+        self.source_deadline_s = source_deadline_s
+        self.cycle_budget_s = cycle_budget_s
+        # Optional per-source overrides of source_deadline_s, keyed by source name
+        self.source_deadlines = dict(source_deadlines or {})
+        # Optional shared TokenBucket per source name, so many cities respect one upstream limit
+        self.rate_limiters = dict(rate_limiters or {})
+        # Sized so that fetches still running past their deadline do not starve the next cycle
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or 4 * max(1, len(self.registry)),
+                                            thread_name_prefix='sensor-fetch')
         logger.info(f"Sensor Agent initialized with role: {self.role}")
 
-    def perceive(self, city: str) -> dict:
+    def perceive(self, city: str, as_record: bool = False):
         """
-        Executes external API calls and consolidates the raw, unstructured data.
+        Executes external API calls concurrently and consolidates the raw, unstructured data.
+        Only sources that are due for this city are polled; the others contribute their
+        latest value, listed under "cached_sources" with when it was polled and its age.
+        Each polled source has its own deadline and the whole step is capped by the cycle
+        budget. Sources that miss their deadline or fail are listed under "partial_sources".
 
         Args:
             city: The primary city/neighborhood to monitor.
+            as_record: Return a compact records.DataPackage instead of a dict, for
+                callers holding many packages at once.
 
         Returns:
             A dictionary containing all collected raw data, packaged for the Messenger Agent.
         """
         logger.info(f"Starting perception cycle for {city}...")
+        started = time.monotonic()
+        cycle_deadline = started + self.cycle_budget_s
 
         # 1. Initialize the main data package
         data_package = {
@@ -76,35 +140,78 @@ class SensorAgent:
             "monitoring_location": city,
             "raw_weather": {},
             "raw_incidents": [],
-            "raw_ov_updates": []  # Placeholder for future data streams
+            "raw_ov_updates": [],
+            "partial_sources": {},  # source name -> "timeout", "rate_limited" or "error"
+            "cached_sources": {}    # source name -> {"fetched_at_utc", "age_s"} of a reused value
         }
 
-        # 2. Fetch Weather Data (using mock)
-        try:
-            # In production: weather_data = get_weather(city)
-            weather_data = mock_get_weather(city)
-            data_package["raw_weather"] = weather_data
-            logger.info(f"Fetched weather: {weather_data.get('condition')}, {weather_data.get('temperature_c')}C")
-        except Exception as e:
-            logger.error(f"Failed to fetch weather data: {e}")
-            data_package["raw_weather"] = {"error": str(e)}
-
-        # 3. Fetch City Incidents/Events (using mock)
-        try:
-            # In production: city_incidents = get_city_data(city)
-            city_incidents = mock_get_city_data(city)
-            data_package["raw_incidents"] = city_incidents
-            logger.info(f"Fetched {len(city_incidents)} raw incidents/events.")
-        except Exception as e:
-            logger.error(f"Failed to fetch city incidents data: {e}")
-            data_package["raw_incidents"] = [{"error": str(e)}]
-
-        # 4. Final Data Validation and Packaging
+        # 2. Sources that are not due yet are served from (a copy of) their latest value
+        due = self.registry.due(city, started)
+        for source in self.registry:
+            if source not in due:
+                data_package[source.package_key], data_package["cached_sources"][source.name] = \
+                    source.cached(city, started)
+                SOURCE_POLLS.labels(source.name, 'cached').inc()
+
+        # 3. Fan out: start every due source fetch at once
+        deadlines = {
+            source.name: min(started + self.source_deadlines.get(source.name, self.source_deadline_s), cycle_deadline)
+            for source in due
+        }
+        futures = {
+            source.name: (source, self._executor.submit(_timed_fetch, source.name, source.fetch, city,
+                                                        self.rate_limiters.get(source.name),
+                                                        deadlines[source.name] - started))
+            for source in due
+        }
+
+        # 4. Collect each result against its own absolute deadline; since all fetches run
+        #    in parallel, the cycle takes as long as the slowest source (or the budget).
+        for name, (source, future) in futures.items():
+            package_key, empty = source.package_key, source.empty
+            deadline = deadlines[name]
+            try:
+                result, elapsed = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                data_package[package_key] = result
+                changed = source.observe(city, result)
+                logger.info(f"Fetched {name} in {elapsed:.3f}s ({'changed' if changed else 'unchanged'}, "
+                            f"next poll in {source.interval_s(city):g}s).")
+            except FutureTimeoutError:
+                future.cancel()
+                source.failed(city)
+                logger.warning(f"Source '{name}' missed its deadline; marking package as partial.")
+                data_package[package_key] = empty()
+                data_package["partial_sources"][name] = "timeout"
+            except RateLimited as e:
+                source.failed(city)
+                logger.warning(f"Source '{name}' was rate limited ({e}); marking package as partial.")
+                data_package[package_key] = empty()
+                data_package["partial_sources"][name] = "rate_limited"
+            except Exception as e:
+                source.failed(city)
+                logger.error(f"Failed to fetch {name} data: {e}")
+                data_package[package_key] = {"error": str(e)} if empty is dict else [{"error": str(e)}]
+                data_package["partial_sources"][name] = "error"
+
+        for name, reason in data_package["partial_sources"].items():
+            SOURCE_FAILURES.labels(name, reason).inc()
+        if data_package["partial_sources"]:
+            PARTIAL_CYCLES.inc()
+
+        # 5. Final Data Validation and Packaging
         if not data_package["raw_weather"] and not data_package["raw_incidents"]:
             logger.warning("No data was successfully retrieved in this cycle.")
 
-        logger.info("Raw data collection complete. Returning packaged data.")
-        return data_package
+        STAGE_LATENCY.labels('perceive').observe(time.monotonic() - started)
+        logger.info(f"Raw data collection complete in {time.monotonic() - started:.3f}s. Returning packaged data.")
+        return DataPackage.from_dict(data_package) if as_record else data_package
+
+    def close(self):
+        """
+        Shuts down the fetch threads. Fetches still running past their deadline
+        finish in the background; the agent cannot perceive afterwards.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
 
 # --- Example Usage (Testing) ---
@@ -122,6 +229,8 @@ if __name__ == '__main__':
     print(f"Monitoring: {data_output.get('monitoring_location')}")
     print(f"Weather Keys: {list(data_output['raw_weather'].keys())}")
     print(f"Incident Count: {len(data_output['raw_incidents'])}")
+    print(f"Partial Sources: {data_output['partial_sources']}")
+    print(f"Cached Sources: {data_output['cached_sources']}")
 
     # print("\nFull Data Output:")
     # import json
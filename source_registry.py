@@ -0,0 +1,183 @@
+# tools/source_registry.py - Registry of data sources with adaptive per-source polling intervals
+
+import copy
+import time
+import logging
+import datetime
+import threading
+from change_detector import content_hash
+from metrics import counter
+
+logger = logging.getLogger('SourceRegistry')
+logger.setLevel(logging.INFO)
+
+DEFAULT_BACKOFF_FACTOR = 1.5   # interval growth per unchanged response
+DEFAULT_SPEEDUP_FACTOR = 0.5   # interval shrink per changed response
+
+SOURCE_POLLS = counter('nw_source_polls_total', 'Source polls by outcome (changed, unchanged, failed) '
+                       'and cycles served from the latest value (cached).', ('source', 'outcome'))
+
+
+class _CityState:
+    __slots__ = ('value', 'value_hash', 'fetched_at_utc', 'fetched_at', 'interval_s', 'next_due')
+
+    def __init__(self, interval_s: float):
+        self.value = None
+        self.value_hash = None
+        self.fetched_at_utc = None
+        self.fetched_at = None   # monotonic time of the poll, for ages
+        self.interval_s = interval_s
+        self.next_due = 0.0
+
+
+class DataSource:
+    """
+    One upstream feed polled per city at an adaptive interval.
+
+    The interval starts at `min_interval_s`. Each response is hashed: a changed
+    value shrinks the interval by `speedup_factor` (down to the minimum), an
+    unchanged one grows it by `backoff_factor` (up to the maximum), so slow
+    feeds are polled rarely while fast-moving ones stay fresh. A failed poll
+    is retried after the minimum interval.
+    """
+
+    def __init__(self, name: str, package_key: str, fetch, empty=dict, min_interval_s: float = 0.0,
+                 max_interval_s: float = 0.0, backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                 speedup_factor: float = DEFAULT_SPEEDUP_FACTOR):
+        self.name = name
+        self.package_key = package_key
+        self.fetch = fetch
+        self.empty = empty
+        self.min_interval_s = float(min_interval_s)
+        self.max_interval_s = max(float(max_interval_s), self.min_interval_s)
+        self.backoff_factor = backoff_factor
+        self.speedup_factor = speedup_factor
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _state(self, city: str) -> _CityState:
+        state = self._states.get(city)
+        if state is None:
+            state = self._states[city] = _CityState(self.min_interval_s)
+        return state
+
+    def is_due(self, city: str, now: float = None) -> bool:
+        """True if the city has no value yet or its polling interval has elapsed."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._state(city)
+            return state.value_hash is None or now >= state.next_due
+
+    def observe(self, city: str, value, now: float = None) -> bool:
+        """
+        Records a successful poll and adapts the interval.
+
+        Returns:
+            True if the value differs from the previous one.
+        """
+        now = time.monotonic() if now is None else now
+        value_hash = content_hash(value)
+        with self._lock:
+            state = self._state(city)
+            changed = value_hash != state.value_hash
+            if state.value_hash is not None:
+                factor = self.speedup_factor if changed else self.backoff_factor
+                state.interval_s = min(self.max_interval_s, max(self.min_interval_s, state.interval_s * factor))
+            state.value = value
+            state.value_hash = value_hash
+            state.fetched_at_utc = datetime.datetime.utcnow().isoformat() + "Z"
+            state.fetched_at = now
+            state.next_due = now + state.interval_s
+        SOURCE_POLLS.labels(self.name, 'changed' if changed else 'unchanged').inc()
+        return changed
+
+    def failed(self, city: str, now: float = None):
+        """Records a failed poll; the source is retried after the minimum interval."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._state(city)
+            state.next_due = now + self.min_interval_s
+        SOURCE_POLLS.labels(self.name, 'failed').inc()
+
+    def latest(self, city: str):
+        """
+        A copy of the most recent successfully polled value for the city (None before
+        the first poll), so packages built from it never share mutable state.
+        """
+        with self._lock:
+            state = self._states.get(city)
+            return copy.deepcopy(state.value) if state is not None else None
+
+    def cached(self, city: str, now: float = None) -> tuple:
+        """
+        The latest value for a cycle that does not poll the source, and where it came from.
+
+        Returns:
+            (copy of the latest value, {"fetched_at_utc": when it was polled, "age_s": seconds
+            since}), or (None, None) before the first successful poll.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._states.get(city)
+            if state is None or state.fetched_at is None:
+                return None, None
+            return copy.deepcopy(state.value), {"fetched_at_utc": state.fetched_at_utc,
+                                                "age_s": round(now - state.fetched_at, 3)}
+
+    def interval_s(self, city: str) -> float:
+        """The city's current polling interval."""
+        with self._lock:
+            return self._state(city).interval_s
+
+
+class SourceRegistry:
+    """The set of data sources a SensorAgent polls, keyed by source name."""
+
+    def __init__(self, sources: list = None):
+        self._sources = {}
+        for source in sources or []:
+            self.register(source)
+
+    def register(self, source: DataSource):
+        """Adds (or replaces) a source; it is polled from the next cycle on."""
+        self._sources[source.name] = source
+        logger.info(f"Registered source '{source.name}' polled every "
+                    f"{source.min_interval_s:g}-{source.max_interval_s:g}s.")
+
+    def unregister(self, name: str):
+        self._sources.pop(name, None)
+
+    def get(self, name: str) -> DataSource:
+        return self._sources[name]
+
+    def __iter__(self):
+        return iter(list(self._sources.values()))
+
+    def __len__(self):
+        return len(self._sources)
+
+    def names(self) -> list:
+        return list(self._sources)
+
+    def due(self, city: str, now: float = None) -> list:
+        """The sources that should be polled for `city` now."""
+        now = time.monotonic() if now is None else now
+        return [source for source in self if source.is_due(city, now)]
+
+
+def build_registry(sources: dict, intervals: dict = None, backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                   speedup_factor: float = DEFAULT_SPEEDUP_FACTOR) -> SourceRegistry:
+    """
+    Builds a registry from the SensorAgent sources mapping.
+
+    Args:
+        sources: name -> (package key, fetch function, empty value factory).
+        intervals: name -> (min, max) polling interval in seconds. Sources without
+            an entry are polled on every cycle.
+    """
+    intervals = intervals or {}
+    return SourceRegistry([
+        DataSource(name, package_key, fetch, empty, *intervals.get(name, (0.0, 0.0)),
+                   backoff_factor=backoff_factor, speedup_factor=speedup_factor)
+        for name, (package_key, fetch, empty) in sources.items()
+    ])
\ No newline at end of file
@@ -0,0 +1,321 @@
+# tools/storage_backends.py - Storage backend interface with segmented-log and SQLite (WAL) implementations
+
+import os
+import abc
+import sqlite3
+import logging
+import threading
+from metrics import STORE_WRITE_LATENCY
+from config import STORAGE_SEGMENT_MB, STORAGE_SEGMENT_ROWS
+from log_store import SegmentedLogStore, NEWEST_FIRST, OLDEST_FIRST, encode_record, decode_record
+
+logger = logging.getLogger('StorageBackends')
+logger.setLevel(logging.INFO)
+
+BACKEND_LOG = 'log'
+BACKEND_SQLITE = 'sqlite'
+SQLITE_FILE = 'alerts.sqlite3'
+
+_COMMIT_LATENCY = STORE_WRITE_LATENCY.labels('sqlite_commit')
+
+
+class StorageBackend(abc.ABC):
+    """
+    What db_tools needs from a record store. Records get dense, increasing sequence
+    numbers starting at 0; retention may drop the oldest ones, after which
+    `first_seq` moves up but the remaining numbers stay the same.
+    """
+
+    # --- Lifecycle ---
+
+    @abc.abstractmethod
+    def open(self):
+        """Opens (or creates) the store; safe to call repeatedly."""
+
+    @abc.abstractmethod
+    def close(self):
+        """Flushes and releases the store; it is reopened on next use."""
+
+    @abc.abstractmethod
+    def refresh(self) -> bool:
+        """Picks up changes made by other processes; True if there were any."""
+
+    # --- Writes ---
+
+    def append(self, record: dict) -> int:
+        """Appends one record and returns its sequence number."""
+        return self.append_many([record])[0]
+
+    @abc.abstractmethod
+    def append_many(self, records: list) -> list:
+        """Appends records atomically (all or nothing) and returns their sequence numbers."""
+
+    @abc.abstractmethod
+    def flush(self):
+        """Forces appended records to stable storage."""
+
+    # --- Reads ---
+
+    @property
+    @abc.abstractmethod
+    def first_seq(self) -> int:
+        """Sequence number of the oldest stored record."""
+
+    @property
+    @abc.abstractmethod
+    def next_seq(self) -> int:
+        """Sequence number the next appended record will get."""
+
+    @property
+    def count(self) -> int:
+        return self.next_seq - self.first_seq
+
+    @property
+    @abc.abstractmethod
+    def size_bytes(self) -> int:
+        """Bytes used on disk."""
+
+    @abc.abstractmethod
+    def read_at(self, seq: int) -> dict:
+        """The record with the given sequence number (IndexError if absent)."""
+
+    @abc.abstractmethod
+    def iter_records(self, order: str = NEWEST_FIRST, start_seq: int = None):
+        """Lazily yields (seq, record) pairs in either order, from `start_seq` (inclusive)."""
+
+    def scan(self, start_seq: int = 0):
+        """Yields (seq, record) pairs oldest first."""
+        return self.iter_records(OLDEST_FIRST, start_seq)
+
+    def read_last(self, limit: int) -> list:
+        """Up to `limit` of the newest (seq, record) pairs, newest first."""
+        results = []
+        if limit <= 0:
+            return results
+        for item in self.iter_records(NEWEST_FIRST):
+            results.append(item)
+            if len(results) >= limit:
+                break
+        return results
+
+    # --- Retention ---
+
+    @abc.abstractmethod
+    def sealed_segments(self) -> list:
+        """(base_seq, next_seq) ranges, oldest first, that retention may drop as a whole."""
+
+    @abc.abstractmethod
+    def drop_segments_before(self, seq: int) -> int:
+        """Drops whole sealed ranges below `seq`; returns the number of records dropped."""
+
+    def seal(self, upto: int = None) -> bool:
+        """
+        Ends a range at sequence number `upto` (default: after the newest record), so
+        retention can drop the records before it once they are old; True if it did.
+        """
+        return False
+
+
+# The segmented log already provides this interface
+StorageBackend.register(SegmentedLogStore)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Records in a SQLite database in WAL mode, for several writer processes plus readers.
+
+    * WAL lets readers run concurrently with a writer and always see committed rows.
+    * Each append is one `BEGIN IMMEDIATE` transaction: writers take the write lock up
+      front and queue on `busy_timeout` instead of failing with SQLITE_BUSY midway.
+    * `synchronous=NORMAL` syncs the WAL at checkpoints rather than every commit,
+      matching the batched fsync of the log store; flush() forces a checkpoint.
+
+    Sequence numbers are the AUTOINCREMENT id minus one, so they are never reused.
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 10000, segment_rows: int = 100000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        # Granularity at which retention drops old rows
+        self.segment_rows = segment_rows
+        self._conn = None
+        self._lock = threading.RLock()
+        self._data_version = None
+
+    # --- Lifecycle ---
+
+    def open(self):
+        with self._lock:
+            if self._conn is not None:
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0,
+                                   isolation_level=None, check_same_thread=False)
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS records "
+                         "(id INTEGER PRIMARY KEY AUTOINCREMENT, body BLOB NOT NULL)")
+            # Range ends added by seal(), on top of the fixed segment_rows boundaries
+            conn.execute("CREATE TABLE IF NOT EXISTS seals (next_seq INTEGER PRIMARY KEY)")
+            self._conn = conn
+            self._data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            logger.info(f"Opened SQLite store at {self.path} with {self.count} records.")
+
+    def close(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.close()
+            self._conn = None
+
+    def refresh(self) -> bool:
+        with self._lock:
+            self.open()
+            # data_version changes whenever another connection commits
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            changed = version != self._data_version
+            self._data_version = version
+            return changed
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            self.open()
+            return self._conn.execute(sql, params).fetchall()
+
+    # --- Writes ---
+
+    def append_many(self, records: list) -> list:
+        bodies = [(encode_record(record)[:-1],) for record in records]
+        if not bodies:
+            return []
+        with self._lock:
+            self.open()
+            with _COMMIT_LATENCY.time():
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.executemany("INSERT INTO records (body) VALUES (?)", bodies)
+                    last_rowid = self._conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            # The write lock was held for the whole insert, so the ids are consecutive
+            first = last_rowid - len(bodies)
+            return list(range(first, last_rowid))
+
+    def flush(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    # --- Reads ---
+
+    @property
+    def first_seq(self) -> int:
+        row = self._query("SELECT MIN(id) FROM records")[0]
+        return row[0] - 1 if row[0] is not None else self.next_seq
+
+    @property
+    def next_seq(self) -> int:
+        row = self._query("SELECT seq FROM sqlite_sequence WHERE name = 'records'")
+        return row[0][0] if row else 0
+
+    @property
+    def size_bytes(self) -> int:
+        page_count = self._query("PRAGMA page_count")[0][0]
+        page_size = self._query("PRAGMA page_size")[0][0]
+        wal_path = self.path + '-wal'
+        return page_count * page_size + (os.path.getsize(wal_path) if os.path.exists(wal_path) else 0)
+
+    def read_at(self, seq: int) -> dict:
+        rows = self._query("SELECT body FROM records WHERE id = ?", (seq + 1,))
+        if not rows:
+            raise IndexError(f"Sequence number {seq} is not in the store.")
+        return decode_record(rows[0][0])
+
+    def iter_records(self, order: str = NEWEST_FIRST, start_seq: int = None, page_rows: int = 500):
+        """
+        Lazily yields (seq, record) pairs, fetching `page_rows` at a time by key range,
+        so no read transaction stays open between pages.
+        """
+        if order not in (NEWEST_FIRST, OLDEST_FIRST):
+            raise ValueError(f"Unknown order {order!r}; use {NEWEST_FIRST!r} or {OLDEST_FIRST!r}.")
+        end_rowid = self.next_seq  # records appended after this point are not visited
+        if order == NEWEST_FIRST:
+            rowid = end_rowid if start_seq is None else min(start_seq + 1, end_rowid)
+            sql = "SELECT id, body FROM records WHERE id <= ? ORDER BY id DESC LIMIT ?"
+        else:
+            rowid = 1 if start_seq is None else start_seq + 1
+            sql = "SELECT id, body FROM records WHERE id >= ? AND id <= ? ORDER BY id LIMIT ?"
+        while True:
+            params = (rowid, page_rows) if order == NEWEST_FIRST else (rowid, end_rowid, page_rows)
+            rows = self._query(sql, params)
+            if not rows:
+                return
+            for row_id, body in rows:
+                yield row_id - 1, decode_record(body)
+            rowid = rows[-1][0] - 1 if order == NEWEST_FIRST else rows[-1][0] + 1
+
+    # --- Retention ---
+
+    def sealed_segments(self) -> list:
+        # Ranges end at every multiple of segment_rows and at every seal() point; the
+        # rows after the last end are the active range, like the log's active segment
+        with self._lock:
+            first, next_seq = self.first_seq, self.next_seq
+            ends = {row[0] for row in self._query("SELECT next_seq FROM seals WHERE next_seq > ? AND next_seq <= ?",
+                                                  (first, next_seq))}
+        ends.update(range(first - first % self.segment_rows + self.segment_rows, next_seq + 1, self.segment_rows))
+        ranges = []
+        base = first
+        for end in sorted(ends):
+            ranges.append((base, end))
+            base = end
+        return ranges
+
+    def seal(self, upto: int = None) -> bool:
+        """
+        Ends a range at `upto` (default: after the newest record). Rows can be deleted
+        by any id range, so unlike the log this may also split an older range.
+        """
+        with self._lock:
+            self.open()
+            next_seq = self.next_seq
+            upto = next_seq if upto is None else upto
+            if not self.first_seq < upto <= next_seq or any(end == upto for _, end in self.sealed_segments()):
+                return False
+            self._conn.execute("INSERT OR IGNORE INTO seals (next_seq) VALUES (?)", (upto,))
+            return True
+
+    def drop_segments_before(self, seq: int) -> int:
+        with self._lock:
+            self.open()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute("DELETE FROM records WHERE id <= ?", (seq,))
+                self._conn.execute("DELETE FROM seals WHERE next_seq <= ?", (seq,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            if cursor.rowcount:
+                logger.info(f"Dropped {cursor.rowcount} records before seq {seq}.")
+            return cursor.rowcount
+
+
+def open_backend(name: str, directory: str) -> StorageBackend:
+    """
+    Creates the storage backend `name` rooted at `directory`.
+
+    Args:
+        name: BACKEND_LOG (segmented JSON-lines log, the default) or BACKEND_SQLITE.
+        directory: Directory holding the log segments or the SQLite database.
+    """
+    if name == BACKEND_SQLITE:
+        return SQLiteBackend(os.path.join(directory, SQLITE_FILE), segment_rows=STORAGE_SEGMENT_ROWS)
+    if name == BACKEND_LOG:
+        # Several orchestrator processes may share the directory
+        return SegmentedLogStore(directory, max_segment_bytes=int(STORAGE_SEGMENT_MB * 1024 * 1024),
+                                 process_lock=True)
+    raise ValueError(f"Unknown storage backend {name!r}; use {BACKEND_LOG!r} or {BACKEND_SQLITE!r}.")
\ No newline at end of file
@@ -0,0 +1,229 @@
+# tools/stub_server.py - Local stand-in for the weather and city data APIs
+
+import time
+import gzip
+import json
+import random
+import logging
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('StubServer')
+logger.setLevel(logging.INFO)
+
+SAMPLE_INCIDENTS = [
+    {"id": "I101", "type": "ROADWORK", "status": "PLANNED", "location": "Kerkstraat near #25",
+     "details": "Major road resurfacing scheduled for tomorrow, 08:00 - 18:00."},
+    {"id": "I102", "type": "INCIDENT", "status": "ACTIVE", "location": "Vondelpark West entrance",
+     "details": "Police activity reported, area secured. Possible traffic delays."},
+    {"id": "I103", "type": "ROADWORK", "status": "COMPLETE", "location": "Old Town Bridge",
+     "details": "Bridge repair finished yesterday."},
+]
+
+
+class StubState:
+    """Mutable content served by the stub; bump the incident feed to simulate an update."""
+
+    def __init__(self, latency_s: float = 0.0, jitter_s: float = 0.0):
+        # Every response is delayed by latency_s plus a uniform 0..jitter_s
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        # Fault injection (see set_faults); GET paths ending in one of fault_paths are affected
+        self.error_rate = 0.0
+        self.error_status = 503
+        self.slow_rate = 0.0
+        self.slow_s = 0.0
+        self.fault_paths = ()
+        self.faults_injected = 0
+        self.incidents = list(SAMPLE_INCIDENTS)
+        self.incidents_version = 1
+        self.incidents_modified = formatdate(usegmt=True)
+        self.requests_served = 0
+        self.not_modified_served = 0
+        # Webhook stand-in: every POSTed batch of notifications is kept here
+        self.webhook_batches = []
+        self._lock = threading.Lock()
+
+    def bump_incidents(self, incidents: list = None):
+        with self._lock:
+            self.incidents = list(incidents) if incidents is not None else self.incidents + [{
+                "id": f"I{100 + len(self.incidents) + 1}", "type": "INCIDENT", "status": "ACTIVE",
+                "location": "Main Street", "details": "New incident reported."}]
+            self.incidents_version += 1
+            self.incidents_modified = formatdate(usegmt=True)
+
+    def set_faults(self, error_rate: float = 0.0, slow_rate: float = 0.0, slow_s: float = 0.0,
+                   error_status: int = 503, paths: tuple = ('/weather', '/incidents')):
+        """
+        Makes GET responses fail or stall at random, to exercise upstream resilience.
+
+        Args:
+            error_rate: Fraction of requests answered with `error_status`.
+            slow_rate: Fraction of requests delayed by an extra `slow_s` (a latency tail).
+            paths: Path suffixes the faults apply to.
+        """
+        with self._lock:
+            self.error_rate = error_rate
+            self.slow_rate = slow_rate
+            self.slow_s = slow_s
+            self.error_status = error_status
+            self.fault_paths = tuple(paths)
+
+    def draw_fault(self, path: str) -> tuple:
+        """(extra delay in seconds, error status or None) for one request."""
+        with self._lock:
+            if not self.fault_paths or not path.endswith(self.fault_paths):
+                return 0.0, None
+            delay = self.slow_s if random.random() < self.slow_rate else 0.0
+            status = self.error_status if random.random() < self.error_rate else None
+            if delay or status:
+                self.faults_injected += 1
+            return delay, status
+
+    def receive_webhook(self, batch):
+        with self._lock:
+            self.webhook_batches.append(batch)
+
+    @property
+    def webhook_notifications(self) -> int:
+        with self._lock:
+            return sum(len(batch) if isinstance(batch, list) else 1 for batch in self.webhook_batches)
+
+    def count(self, not_modified: bool):
+        with self._lock:
+            self.requests_served += 1
+            if not_modified:
+                self.not_modified_served += 1
+
+
+def _not_modified_since(modified: str, since: str) -> bool:
+    """True if the HTTP date `modified` is not later than the If-Modified-Since date `since`."""
+    if not since:
+        return False
+    try:
+        return parsedate_to_datetime(modified) <= parsedate_to_datetime(since)
+    except (TypeError, ValueError):
+        return False
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    # Headers and body go out in separate writes; without this, Nagle + delayed ACK
+    # add ~40ms to every keep-alive response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        state = self.server.state
+        if state.latency_s or state.jitter_s:
+            time.sleep(state.latency_s + random.uniform(0.0, state.jitter_s))
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        fault_delay_s, fault_status = state.draw_fault(parsed.path)
+        if fault_delay_s:
+            time.sleep(fault_delay_s)
+        if fault_status:
+            self._send_json({"error": "injected fault"}, status=fault_status)
+            return
+
+        if parsed.path.endswith('/weather'):
+            city = query.get('q', ['Unknown'])[0]
+            # Weather changes on every call, so it never carries validators
+            self._send_json({"name": city, "main": {"temp": round(random.uniform(5.0, 25.0), 1)},
+                             "weather": [{"main": random.choice(["Clear", "Clouds", "Rain"])}],
+                             "wind": {"speed": random.randint(1, 12)}})
+        elif parsed.path.endswith('/incidents'):
+            etag = f'"incidents-v{state.incidents_version}"'
+            # If-None-Match takes precedence; If-Modified-Since only counts without it
+            if_none_match = self.headers.get('If-None-Match')
+            if_modified_since = self.headers.get('If-Modified-Since')
+            if (if_none_match == etag if if_none_match is not None
+                    else _not_modified_since(state.incidents_modified, if_modified_since)):
+                state.count(not_modified=True)
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self._send_json(state.incidents, etag=etag, last_modified=state.incidents_modified)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if not parsed.path.endswith('/webhook'):
+            self._send_json({"error": "not found"}, status=404)
+            return
+        try:
+            self.server.state.receive_webhook(json.loads(body or b'null'))
+        except ValueError:
+            self._send_json({"error": "invalid JSON"}, status=400)
+            return
+        self._send_json({"received": True})
+
+    def _send_json(self, payload, status: int = 200, etag: str = None, last_modified: str = None):
+        self.server.state.count(not_modified=False)
+        body = json.dumps(payload).encode('utf-8')
+        gzipped = 'gzip' in (self.headers.get('Accept-Encoding') or '')
+        if gzipped:
+            body = gzip.compress(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        if etag:
+            self.send_header('ETag', etag)
+        if last_modified:
+            self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (e.g. timed out on an injected slow response)
+            logger.debug("Client closed the connection before the response was sent.")
+
+
+def start_stub_server(host: str = '127.0.0.1', port: int = 0, latency_s: float = 0.0, jitter_s: float = 0.0,
+                      error_rate: float = 0.0, slow_rate: float = 0.0, slow_s: float = 0.0) -> tuple:
+    """
+    Starts the stub API server on a background thread.
+
+    Args:
+        host: Interface to bind.
+        port: Port to bind; 0 picks a free one.
+        latency_s: Fixed delay added to every response.
+        jitter_s: Extra uniformly random delay (0..jitter_s) per response.
+        error_rate, slow_rate, slow_s: Injected faults, see StubState.set_faults.
+
+    Returns:
+        (server, base_url); call server.shutdown() to stop it. server.state holds the
+        served content and request counters.
+    """
+    server = ThreadingHTTPServer((host, port), StubRequestHandler)
+    server.daemon_threads = True
+    server.state = StubState(latency_s=latency_s, jitter_s=jitter_s)
+    server.state.set_faults(error_rate=error_rate, slow_rate=slow_rate, slow_s=slow_s)
+    thread = threading.Thread(target=server.serve_forever, name='stub-api-server', daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    logger.info(f"Stub API server listening on {base_url}")
+    return server, base_url
+
+
+if __name__ == '__main__':
+    # Point WEATHER_API_URL at <base>/weather and CITY_DATA_API_URL at <base>/incidents,
+    # and WEBHOOK_URL at <base>/webhook
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    stub, url = start_stub_server(port=8765)
+    print(f"Stub API server running at {url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.shutdown()
@@ -0,0 +1,381 @@
+# tools/subscriptions.py - Matching published incidents against many subscriptions, with batched delivery
+
+import os
+import json
+import math
+import logging
+import threading
+import numpy as np
+from geo_proximity import Gazetteer, haversine_matrix, METERS_PER_DEGREE_LAT
+from alert_index import normalize_key, location_tokens
+from change_detector import content_hash
+from http_transport import get_transport
+from metrics import counter
+from batching import BatchWorker
+
+logger = logging.getLogger('Subscriptions')
+logger.setLevel(logging.INFO)
+
+DEFAULT_CELL_M = 2000.0
+_EMPTY = np.empty(0, dtype=np.int64)
+
+NOTIFICATIONS = counter('nw_notifications_total', 'Subscriber notifications by delivery result.', ('result',))
+
+
+class Subscription:
+    """
+    A subscriber's interest: incidents within `radius_m` of a point, optionally
+    restricted to some incident types and to details mentioning some keywords.
+
+    Args:
+        subscription_id: Unique id, echoed in every notification.
+        lat, lon: Center of the subscriber's area.
+        radius_m: Radius of the area in meters.
+        incident_types: Incident `type` values of interest (case-insensitive); empty means any.
+        keywords: Words of which at least one must appear in the incident `details`; empty means any.
+    """
+
+    __slots__ = ('subscription_id', 'lat', 'lon', 'radius_m', 'incident_types', 'keywords')
+
+    def __init__(self, subscription_id: str, lat: float, lon: float, radius_m: float,
+                 incident_types=(), keywords=()):
+        self.subscription_id = str(subscription_id)
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.radius_m = float(radius_m)
+        self.incident_types = frozenset(normalize_key(t) for t in incident_types)
+        self.keywords = frozenset(token for keyword in keywords for token in location_tokens(keyword))
+
+    @classmethod
+    def from_dict(cls, data: dict, gazetteer: Gazetteer = None):
+        """
+        Builds a subscription from JSON, e.g.
+        {"id": "s1", "neighborhood": "Vondelpark", "radius_m": 800, "types": ["Roadwork"], "keywords": ["closure"]}.
+        The center is either "lat"/"lon" or a "neighborhood" name resolved with the gazetteer.
+        """
+        if data.get('lat') is not None and data.get('lon') is not None:
+            lat, lon = data['lat'], data['lon']
+        else:
+            coords = (gazetteer or Gazetteer()).resolve(data.get('neighborhood'))
+            if coords is None:
+                raise ValueError(f"Unknown neighborhood {data.get('neighborhood')!r} in subscription {data.get('id')}.")
+            lat, lon = coords
+        return cls(data['id'], lat, lon, data.get('radius_m', 1000.0),
+                   data.get('types') or (), data.get('keywords') or ())
+
+
+def _has_any_keyword(built: dict, candidates: np.ndarray, token_ids: list) -> np.ndarray:
+    """Per candidate, whether any of its keywords is one of `token_ids`; reads only the candidates' keywords."""
+    starts = built["keyword_offsets"][candidates]
+    lengths = built["keyword_offsets"][candidates + 1] - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(len(candidates), dtype=bool)
+    # Positions of every candidate's keywords in the flat array, and the candidate each belongs to
+    owners = np.repeat(np.arange(len(candidates)), lengths)
+    positions = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths) + starts[owners]
+    hits = np.isin(built["keywords"][positions], token_ids)
+    return np.bincount(owners[hits], minlength=len(candidates)) > 0
+
+
+class SubscriptionIndex:
+    """
+    Finds the subscriptions matching an incident without visiting every subscription.
+
+    * Spatial grid: each subscription is listed in every cell (`cell_m` wide) that its
+      circle's bounding box touches, so an incident only needs the candidates of
+      its own cell; exact distances are then checked in one vectorized call.
+    * Type and keyword filters cost O(candidates), whatever the total number of
+      subscriptions: a boolean mask over all subscriptions per incident type (types
+      are few) is indexed with the candidates, and each candidate's keyword ids
+      (a flat array with per-subscription offsets, as keywords are open-ended) are
+      compared with the ids of the incident's words.
+
+    The arrays are rebuilt lazily after subscriptions are added or removed.
+    """
+
+    def __init__(self, cell_m: float = DEFAULT_CELL_M, gazetteer: Gazetteer = None):
+        self.cell_m = float(cell_m)
+        self.gazetteer = gazetteer or Gazetteer()
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._built = None
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def add(self, subscription: Subscription):
+        """Adds or replaces a subscription (by id)."""
+        with self._lock:
+            self._subscriptions[subscription.subscription_id] = subscription
+            self._built = None
+
+    def add_many(self, subscriptions):
+        with self._lock:
+            for subscription in subscriptions:
+                self._subscriptions[subscription.subscription_id] = subscription
+            self._built = None
+
+    def remove(self, subscription_id: str):
+        with self._lock:
+            if self._subscriptions.pop(str(subscription_id), None) is not None:
+                self._built = None
+
+    def _build(self) -> dict:
+        with self._lock:
+            if self._built is not None:
+                return self._built
+            subs = list(self._subscriptions.values())
+            lats = np.fromiter((s.lat for s in subs), dtype=float, count=len(subs))
+            lons = np.fromiter((s.lon for s in subs), dtype=float, count=len(subs))
+            radii = np.fromiter((s.radius_m for s in subs), dtype=float, count=len(subs))
+
+            cell_lat = self.cell_m / METERS_PER_DEGREE_LAT
+            # Size longitude cells for the highest latitude, where degrees are narrowest
+            max_abs_lat = min(float(np.max(np.abs(lats))) if len(subs) else 0.0, 89.0)
+            cell_lon = self.cell_m / (METERS_PER_DEGREE_LAT * math.cos(math.radians(max_abs_lat)))
+            radius_lat = radii / METERS_PER_DEGREE_LAT
+            radius_lon = radii / (METERS_PER_DEGREE_LAT * np.maximum(np.cos(np.radians(np.abs(lats) + radius_lat)), 1e-6))
+            row_lo = np.floor((lats - radius_lat) / cell_lat).astype(np.int64)
+            row_hi = np.floor((lats + radius_lat) / cell_lat).astype(np.int64)
+            col_lo = np.floor((lons - radius_lon) / cell_lon).astype(np.int64)
+            col_hi = np.floor((lons + radius_lon) / cell_lon).astype(np.int64)
+
+            cells = {}
+            by_type = {}
+            keyword_ids = {}
+            keywords = []
+            keyword_offsets = np.zeros(len(subs) + 1, dtype=np.int64)
+            for number, sub in enumerate(subs):
+                for row in range(row_lo[number], row_hi[number] + 1):
+                    for col in range(col_lo[number], col_hi[number] + 1):
+                        cells.setdefault((row, col), []).append(number)
+                for incident_type in sub.incident_types:
+                    by_type.setdefault(incident_type, []).append(number)
+                for keyword in sub.keywords:
+                    keywords.append(keyword_ids.setdefault(keyword, len(keyword_ids)))
+                keyword_offsets[number + 1] = len(keywords)
+
+            type_masks = {}
+            for incident_type, members in by_type.items():
+                mask = np.zeros(len(subs), dtype=bool)
+                mask[members] = True
+                type_masks[incident_type] = mask
+
+            self._built = {
+                "subscriptions": subs,
+                "lats": lats,
+                "lons": lons,
+                "radii": radii,
+                "cell_lat": cell_lat,
+                "cell_lon": cell_lon,
+                "cells": {key: np.asarray(members, dtype=np.int64) for key, members in cells.items()},
+                "type_masks": type_masks,
+                "keyword_ids": keyword_ids,
+                "keywords": np.asarray(keywords, dtype=np.int64),
+                "keyword_offsets": keyword_offsets,
+                "any_type": np.fromiter((not s.incident_types for s in subs), dtype=bool, count=len(subs)),
+                "any_keyword": np.fromiter((not s.keywords for s in subs), dtype=bool, count=len(subs)),
+            }
+            logger.info(f"Built subscription index: {len(subs)} subscriptions over {len(cells)} grid cells.")
+            return self._built
+
+    def match_incident(self, incident: dict, coords: tuple = None) -> list:
+        """
+        Returns (subscription, distance_m) for every subscription the incident matches.
+
+        Args:
+            incident: Incident dict with `type`, `location` and `details`.
+            coords: (lat, lon) of the incident; geocoded from `location` if omitted.
+        """
+        if not isinstance(incident, dict):
+            return []
+        coords = coords or self.gazetteer.resolve(incident.get('location'))
+        if coords is None:
+            return []
+        built = self._build()
+        lat, lon = coords
+        candidates = built["cells"].get((int(math.floor(lat / built["cell_lat"])),
+                                         int(math.floor(lon / built["cell_lon"]))), _EMPTY)
+        if not len(candidates):
+            return []
+
+        # Type filter: subscriptions for this type, or for any type
+        ok = built["any_type"][candidates]
+        type_mask = built["type_masks"].get(normalize_key(incident.get('type', '')))
+        if type_mask is not None:
+            ok = ok | type_mask[candidates]
+        # Keyword filter: subscriptions sharing a word with the details, or without keywords
+        token_ids = [built["keyword_ids"][token] for token in location_tokens(incident.get('details'))
+                     if token in built["keyword_ids"]]
+        keyword_ok = built["any_keyword"][candidates]
+        if token_ids:
+            keyword_ok = keyword_ok | _has_any_keyword(built, candidates, token_ids)
+        candidates = candidates[ok & keyword_ok]
+        if not len(candidates):
+            return []
+
+        distances = haversine_matrix([lat], [lon], built["lats"][candidates], built["lons"][candidates])[0]
+        hits = distances <= built["radii"][candidates]
+        subs = built["subscriptions"]
+        return [(subs[number], float(distance))
+                for number, distance in zip(candidates[hits].tolist(), distances[hits].tolist())]
+
+    def match(self, package: dict, incidents: list = None) -> list:
+        """
+        Matches a package's incidents (or the given subset) against all subscriptions.
+
+        Returns:
+            Notification dicts, one per (subscription, incident) match.
+        """
+        incidents = incidents if incidents is not None else package.get('raw_incidents') or []
+        incidents = [incident for incident in incidents if isinstance(incident, dict) and 'error' not in incident]
+        if not incidents or not self._subscriptions:
+            return []
+        lats, lons = self.gazetteer.resolve_many([incident.get('location') for incident in incidents])
+        notifications = []
+        for incident, lat, lon in zip(incidents, lats.tolist(), lons.tolist()):
+            if math.isnan(lat):
+                continue
+            for subscription, distance in self.match_incident(incident, (lat, lon)):
+                notifications.append({
+                    "subscription_id": subscription.subscription_id,
+                    "monitoring_location": package.get('monitoring_location'),
+                    "fetch_time_utc": package.get('fetch_time_utc'),
+                    "distance_m": round(distance, 1),
+                    "incident": incident,
+                })
+        return notifications
+
+
+# --- Delivery ---
+
+class MemorySink:
+    """Collects delivered batches in memory (tests, benchmarks)."""
+
+    def __init__(self):
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def __call__(self, notifications: list):
+        with self._lock:
+            self.batches.append(list(notifications))
+
+    @property
+    def delivered(self) -> int:
+        return sum(len(batch) for batch in self.batches)
+
+
+class WebhookSink:
+    """POSTs each batch as one JSON array to a webhook URL over the shared keep-alive session."""
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def __call__(self, notifications: list):
+        get_transport().post_json(self.url, notifications)
+
+
+class NotificationDispatcher:
+    """
+    Delivers notifications off the publish path.
+    A background BatchWorker drains the queue into batches of up to `max_batch`
+    (waiting at most `max_delay_s` for a batch to fill) and hands each batch to
+    the sink in one call, i.e. one webhook request per batch.
+    """
+
+    def __init__(self, sink, max_batch: int = 500, max_delay_s: float = 0.05):
+        self.sink = sink
+        self._worker = BatchWorker(self._deliver, max_batch, max_delay_s, name='notification-dispatcher')
+
+    def submit(self, notifications: list):
+        for notification in notifications:
+            self._worker.put(notification)
+
+    def close(self):
+        """Delivers everything already queued and stops the thread."""
+        self._worker.close()
+
+    def _deliver(self, batch: list):
+        try:
+            self.sink(batch)
+            NOTIFICATIONS.labels('delivered').inc(len(batch))
+        except Exception as e:
+            NOTIFICATIONS.labels('failed').inc(len(batch))
+            logger.error(f"Failed to deliver {len(batch)} notifications: {e}")
+
+
+class SubscriptionNotifier:
+    """
+    Pushes new and changed incidents of each published package to matching subscribers.
+    Incidents already seen in the previous package of the same location are not sent again.
+    A package whose incidents source failed (listed in partial_sources) sends nothing and
+    leaves the seen set as it was, so the outage does not re-send every incident afterwards.
+    """
+
+    def __init__(self, index: SubscriptionIndex, dispatcher: NotificationDispatcher):
+        self.index = index
+        self.dispatcher = dispatcher
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def _new_incidents(self, package: dict) -> list:
+        if 'incidents' in (package.get('partial_sources') or {}):
+            return []
+        incidents = [incident for incident in package.get('raw_incidents') or [] if isinstance(incident, dict)]
+        hashes = [content_hash(incident) for incident in incidents]
+        location = package.get('monitoring_location')
+        with self._lock:
+            previous = self._seen.get(location, frozenset())
+            self._seen[location] = frozenset(hashes)
+        return [incident for incident, h in zip(incidents, hashes) if h not in previous]
+
+    def publish(self, package: dict) -> int:
+        """
+        Matches the package's new incidents and queues the notifications.
+
+        Returns:
+            The number of notifications queued.
+        """
+        incidents = self._new_incidents(package)
+        if not incidents:
+            return 0
+        notifications = self.index.match(package, incidents)
+        if notifications:
+            self.dispatcher.submit(notifications)
+        return len(notifications)
+
+    def close(self):
+        self.dispatcher.close()
+
+
+def load_subscriptions(path: str, gazetteer: Gazetteer = None) -> list:
+    """Reads subscriptions from a JSON file holding a list of subscription objects."""
+    gazetteer = gazetteer or Gazetteer()
+    with open(path, 'r') as f:
+        entries = json.load(f)
+    subscriptions = []
+    for entry in entries:
+        try:
+            subscriptions.append(Subscription.from_dict(entry, gazetteer))
+        except (KeyError, ValueError) as e:
+            logger.warning(f"Skipping subscription: {e}")
+    return subscriptions
+
+
+def load_notifier(path: str, webhook_url: str, gazetteer: Gazetteer = None, max_batch: int = 500,
+                  max_delay_s: float = 0.05):
+    """
+    Builds the notifier for the Messenger Agent, or returns None when there is
+    no subscriptions file or no webhook URL configured.
+    """
+    if not webhook_url or not path or not os.path.exists(path):
+        return None
+    try:
+        index = SubscriptionIndex(gazetteer=gazetteer)
+        index.add_many(load_subscriptions(path, index.gazetteer))
+        logger.info(f"Loaded {len(index)} subscriptions from {path}; notifying {webhook_url}.")
+        return SubscriptionNotifier(index, NotificationDispatcher(WebhookSink(webhook_url), max_batch, max_delay_s))
+    except Exception as e:
+        logger.error(f"Failed to load subscriptions from {path}: {e}", exc_info=True)
+        return None
\ No newline at end of file
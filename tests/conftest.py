@@ -0,0 +1,38 @@
+# tests/conftest.py - Shared fixtures: the repository root on sys.path, the stub API server, a transport and a scratch store
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_tools  # noqa: E402
+from http_transport import HttpTransport  # noqa: E402
+from stub_server import start_stub_server  # noqa: E402
+
+
+@pytest.fixture
+def stub():
+    """A fresh stub API server per test; yields (server, base_url)."""
+    server, base_url = start_stub_server()
+    try:
+        yield server, base_url
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def transport():
+    """A fresh HttpTransport (own session and conditional-GET cache) per test."""
+    transport = HttpTransport(timeout=5)
+    yield transport
+    transport.close()
+
+
+@pytest.fixture
+def db(tmp_path):
+    """db_tools pointed at an empty store under tmp_path (log backend) for one test."""
+    db_tools.configure_storage(str(tmp_path / 'alerts_log'), backend='log')
+    yield db_tools
+    db_tools.close_db()
@@ -0,0 +1,40 @@
+# tests/test_columnar.py - Parquet tables kept current by the publishing process
+
+import time
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from columnar_store import ColumnarStore, WEATHER_TABLE  # noqa: E402
+
+
+def _package(city: str, temperature: float) -> dict:
+    return {"monitoring_location": city, "raw_weather": {"temperature_c": temperature, "condition": "Clear"},
+            "raw_incidents": [{"id": "I1", "type": "INCIDENT", "location": "Main Street"}]}
+
+
+def test_loaded_tables_take_saves_incrementally(db):
+    assert db.load_columnar()
+    columnar = db._columnar
+    for i in range(3):
+        assert db.save_presentation_data(_package("Amsterdam", 10.0 + i))
+
+    # Flattened on the save path: nothing is left for a reader to catch up
+    assert columnar.next_seq == db.get_store().next_seq
+    assert columnar.catch_up(db.get_store().scan(columnar.next_seq)) == 0
+    assert len(db.fetch_weather_frame()) == 3
+    assert len(db.fetch_incidents_frame()) == 3
+
+
+def test_tables_flush_after_interval(tmp_path):
+    columnar = ColumnarStore(str(tmp_path), flush_rows=1000, flush_interval_s=0.05)
+    record = {"id": "r", "fetch_timestamp": "2026-01-01T00:00:00", "raw_payload": _package("Amsterdam", 12.0)}
+    columnar.append([0], [record])
+    assert columnar.watermark == 0
+
+    time.sleep(0.06)
+    columnar.append([1], [record])
+    # Both rows are written out though far fewer than flush_rows arrived
+    assert columnar.watermark == 2
+    assert ColumnarStore(str(tmp_path)).load_table(WEATHER_TABLE).num_rows == 2
+    columnar.close()
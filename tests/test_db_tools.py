@@ -0,0 +1,28 @@
+# tests/test_db_tools.py - The recent-reads cache is isolated from its callers
+
+
+def _package(city: str) -> dict:
+    return {"monitoring_location": city, "raw_weather": {"temperature_c": 11.0}, "raw_incidents": []}
+
+
+def test_recent_cache_is_isolated_from_saved_packages(db):
+    db.fetch_recent_data(5)  # loads the cache, so the save below pushes onto it
+    package = _package("Amsterdam")
+    assert db.save_presentation_data(package)
+
+    # The publisher reuses its dict for the next cycle
+    package["raw_weather"]["temperature_c"] = 99.0
+    package["raw_incidents"].append({"id": "I9"})
+    (result,) = db.fetch_recent_data(5)
+    assert result["payload"]["raw_weather"] == {"temperature_c": 11.0}
+    assert result["payload"]["raw_incidents"] == []
+
+
+def test_recent_cache_is_isolated_from_readers(db):
+    assert db.save_presentation_data(_package("Amsterdam"))
+    first = db.fetch_recent_data(5)
+    first[0]["payload"]["raw_weather"]["temperature_c"] = -1.0
+    first[0]["payload"]["monitoring_location"] = "Edited"
+
+    (result,) = db.fetch_recent_data(5)
+    assert result["payload"] == _package("Amsterdam")
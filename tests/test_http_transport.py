@@ -0,0 +1,113 @@
+# tests/test_http_transport.py - Conditional-GET caching, cache eviction and retry classification
+
+import pytest
+import requests
+from http_transport import HttpTransport, is_retryable
+
+
+def test_etag_304_reuses_cached_payload(stub, transport):
+    server, base_url = stub
+    first = transport.fetch(f"{base_url}/incidents", params={"city": "Amsterdam"})
+    second = transport.fetch(f"{base_url}/incidents", params={"city": "Amsterdam"})
+
+    assert not first.not_modified and first.status_code == 200
+    assert second.not_modified and second.status_code == 304
+    assert second.payload is first.payload
+    assert server.state.not_modified_served == 1
+
+
+def test_changed_feed_is_downloaded_again(stub, transport):
+    server, base_url = stub
+    transport.fetch(f"{base_url}/incidents")
+    server.state.bump_incidents()
+    response = transport.fetch(f"{base_url}/incidents")
+
+    assert not response.not_modified
+    assert len(response.payload) == 4
+    # The new validators are cached, so the next call is a 304 again
+    assert transport.fetch(f"{base_url}/incidents").not_modified
+
+
+def test_if_modified_since_304_without_etag(stub, transport):
+    server, base_url = stub
+    transport.fetch(f"{base_url}/incidents")
+    # Revalidate on Last-Modified alone
+    (entry,) = transport._cache.values()
+    entry.etag = None
+
+    response = transport.fetch(f"{base_url}/incidents")
+    assert response.not_modified
+    assert server.state.not_modified_served == 1
+
+
+def test_responses_without_validators_are_not_cached(stub, transport):
+    server, base_url = stub
+    transport.fetch(f"{base_url}/weather", params={"q": "Amsterdam"})
+    transport.fetch(f"{base_url}/weather", params={"q": "Amsterdam"})
+
+    assert not transport._cache
+    assert server.state.not_modified_served == 0
+
+
+def test_lru_evicts_least_recently_used(stub):
+    server, base_url = stub
+    transport = HttpTransport(timeout=5, cache_entries=2)
+    try:
+        url = f"{base_url}/incidents"
+        transport.fetch(url, params={"city": "a"})
+        transport.fetch(url, params={"city": "b"})
+        # A 304 counts as a use, so "a" becomes the most recent and "b" the oldest
+        assert transport.fetch(url, params={"city": "a"}).not_modified
+        transport.fetch(url, params={"city": "c"})
+
+        assert len(transport._cache) == 2
+        assert transport.fetch(url, params={"city": "a"}).not_modified
+        assert not transport.fetch(url, params={"city": "b"}).not_modified
+    finally:
+        transport.close()
+
+
+def test_http_errors_raise(stub, transport):
+    server, base_url = stub
+    with pytest.raises(requests.exceptions.HTTPError):
+        transport.fetch(f"{base_url}/unknown")
+
+
+def _http_error(transport, url) -> Exception:
+    with pytest.raises(requests.exceptions.HTTPError) as info:
+        transport.fetch(url)
+    return info.value
+
+
+@pytest.mark.parametrize("status, retryable", [(500, True), (503, True), (429, True),
+                                               (400, False), (404, False)])
+def test_is_retryable_by_status(stub, transport, status, retryable):
+    server, base_url = stub
+    server.state.set_faults(error_rate=1.0, error_status=status)
+    assert is_retryable(_http_error(transport, f"{base_url}/incidents")) is retryable
+
+
+def test_connection_error_is_retryable(stub, transport):
+    server, base_url = stub
+    # Nothing listens on the port any more
+    server.shutdown()
+    server.server_close()
+    with pytest.raises(requests.exceptions.ConnectionError) as info:
+        transport.fetch(f"{base_url}/incidents")
+    assert is_retryable(info.value)
+
+
+def test_other_errors_are_not_retryable():
+    assert not is_retryable(ValueError("bad payload"))
+
+
+def test_timeout_is_retryable(stub):
+    server, base_url = stub
+    server.state.set_faults(slow_rate=1.0, slow_s=0.5)
+    transport = HttpTransport(timeout=0.1)
+    try:
+        with pytest.raises(requests.exceptions.Timeout) as info:
+            transport.fetch(f"{base_url}/incidents")
+    finally:
+        transport.close()
+    assert is_retryable(info.value)
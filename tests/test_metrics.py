@@ -0,0 +1,22 @@
+# tests/test_metrics.py - The shared nearest-rank percentile
+
+from metrics import percentile
+from resilience import LatencyTracker
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 0.50) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile(values, 1.0) == 100
+    assert percentile(values, 0.0) == 1
+    assert percentile([7.0], 0.99) == 7.0
+    assert percentile([], 0.5) == 0.0
+
+
+def test_latency_tracker_uses_the_same_percentile():
+    tracker = LatencyTracker()
+    for value in range(1, 11):
+        tracker.observe(float(value))
+    assert tracker.quantile(0.5) == percentile([float(v) for v in range(1, 11)], 0.5) == 5.0
+    assert LatencyTracker().quantile(0.5) is None
@@ -0,0 +1,178 @@
+# tests/test_resilience.py - Circuit breaker, hedging and retry budget against the fault-injecting stub
+
+import time
+import pytest
+import requests
+from http_transport import is_retryable
+from resilience import (CircuitBreaker, CircuitOpenError, RetryBudget, Upstream, UPSTREAM_CALLS,
+                        CLOSED, OPEN, HALF_OPEN)
+
+
+def _outcomes(upstream: Upstream, outcome: str) -> float:
+    return UPSTREAM_CALLS.labels(upstream.name, outcome).value
+
+
+def _upstream(name: str, **kwargs) -> Upstream:
+    # No hedging and no backoff unless a test asks for them
+    kwargs.setdefault('hedge_quantile', None)
+    kwargs.setdefault('retry_backoff_s', 0.0)
+    return Upstream(name, retryable=is_retryable, **kwargs)
+
+
+# --- Circuit breaker ---
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker('test-breaker-cycle', failure_threshold=3, reset_timeout_s=0.1)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.15)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    # Only the one trial call goes out while half-open
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker('test-breaker-trial', failure_threshold=1, reset_timeout_s=0.1)
+    breaker.record_failure()
+    time.sleep(0.15)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_open_breaker_serves_last_known_value(stub, transport):
+    server, base_url = stub
+    url = f"{base_url}/incidents"
+    upstream = _upstream('test-stale', max_retries=0,
+                         breaker=CircuitBreaker('test-stale', failure_threshold=2, reset_timeout_s=0.2))
+    fresh = upstream.call(url, lambda: transport.get_json(url))
+
+    server.state.set_faults(error_rate=1.0, error_status=503)
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.HTTPError):
+            upstream.call(url, lambda: transport.get_json(url))
+    assert upstream.breaker.state == OPEN
+
+    served = server.state.requests_served
+    assert upstream.call(url, lambda: transport.get_json(url)) == fresh
+    with pytest.raises(CircuitOpenError):
+        upstream.call('other-key', lambda: transport.get_json(url))
+    # Fails fast: nothing reached the upstream while open
+    assert server.state.requests_served == served
+    assert _outcomes(upstream, 'stale') == 1
+    assert _outcomes(upstream, 'short_circuited') == 1
+
+    # After the reset timeout a successful trial closes the breaker again
+    server.state.set_faults()
+    time.sleep(0.25)
+    assert upstream.call(url, lambda: transport.get_json(url)) == fresh
+    assert upstream.breaker.state == CLOSED
+
+
+def test_client_errors_do_not_open_breaker(stub, transport):
+    server, base_url = stub
+    url = f"{base_url}/incidents"
+    upstream = _upstream('test-4xx', max_retries=3,
+                         breaker=CircuitBreaker('test-4xx', failure_threshold=2, reset_timeout_s=0.1))
+    server.state.set_faults(error_rate=1.0, error_status=404)
+    for _ in range(5):
+        with pytest.raises(requests.exceptions.HTTPError):
+            upstream.call(url, lambda: transport.get_json(url))
+
+    assert upstream.breaker.state == CLOSED
+    # Not retried either
+    assert server.state.requests_served == 5
+    assert _outcomes(upstream, 'retried') == 0
+
+
+def test_client_error_releases_half_open_trial(stub, transport):
+    server, base_url = stub
+    url = f"{base_url}/incidents"
+    upstream = _upstream('test-4xx-trial', max_retries=0,
+                         breaker=CircuitBreaker('test-4xx-trial', failure_threshold=1, reset_timeout_s=0.1))
+    server.state.set_faults(error_rate=1.0, error_status=503)
+    with pytest.raises(requests.exceptions.HTTPError):
+        upstream.call(url, lambda: transport.get_json(url))
+    assert upstream.breaker.state == OPEN
+
+    time.sleep(0.15)
+    server.state.set_faults(error_rate=1.0, error_status=404)
+    with pytest.raises(requests.exceptions.HTTPError):
+        upstream.call(url, lambda: transport.get_json(url))
+    # The trial neither re-opened nor closed the breaker, and the next call may go out
+    assert upstream.breaker.state == HALF_OPEN
+    server.state.set_faults()
+    upstream.call(url, lambda: transport.get_json(url))
+    assert upstream.breaker.state == CLOSED
+
+
+# --- Hedging ---
+
+def test_hedge_wins_over_slow_primary(stub, transport):
+    server, base_url = stub
+    upstream = _upstream('test-hedge', hedge_quantile=0.5, hedge_min_samples=5)
+    fast_url = f"{base_url}/weather"
+    for _ in range(10):
+        upstream.call(fast_url, lambda: transport.get_json(fast_url, params={"q": "Amsterdam"}))
+    assert upstream.hedge_delay_s() < 0.5
+
+    # The primary request stalls on the slow path; its hedged duplicate takes the fast one
+    server.state.set_faults(slow_rate=1.0, slow_s=2.0, paths=('/incidents',))
+    urls = iter([f"{base_url}/incidents", fast_url])
+    # Warm-up calls past the p50 may have been hedged too; count only this call
+    hedged, hedge_won = _outcomes(upstream, 'hedged'), _outcomes(upstream, 'hedge_won')
+    started = time.monotonic()
+    value = upstream.call('hedged', lambda: transport.get_json(next(urls), params={"q": "Amsterdam"}))
+
+    assert time.monotonic() - started < 1.0
+    assert value["name"] == "Amsterdam"
+    assert _outcomes(upstream, 'hedged') == hedged + 1
+    assert _outcomes(upstream, 'hedge_won') == hedge_won + 1
+
+
+# --- Retry budget ---
+
+def test_retries_stop_when_budget_is_spent(stub, transport):
+    server, base_url = stub
+    url = f"{base_url}/incidents"
+    # One token and no refill: a single retry, then the budget is exhausted
+    upstream = _upstream('test-budget', max_retries=5, budget=RetryBudget(ratio=0.0, min_per_s=0.0, capacity=1.0),
+                         breaker=CircuitBreaker('test-budget', failure_threshold=100))
+    server.state.set_faults(error_rate=1.0, error_status=503)
+    with pytest.raises(requests.exceptions.HTTPError):
+        upstream.call(url, lambda: transport.get_json(url))
+
+    assert server.state.requests_served == 2
+    assert _outcomes(upstream, 'retried') == 1
+    assert _outcomes(upstream, 'retry_denied') == 1
+    assert _outcomes(upstream, 'failed') == 1
+
+
+def test_retries_recover_from_transient_errors(stub, transport):
+    server, base_url = stub
+    url = f"{base_url}/incidents"
+    upstream = _upstream('test-retry', max_retries=2, budget=RetryBudget(ratio=0.0, min_per_s=0.0, capacity=5.0))
+    calls = []
+
+    def fetch():
+        # Fail the first attempt only
+        server.state.set_faults(error_rate=1.0 if not calls else 0.0, error_status=503)
+        calls.append(1)
+        return transport.get_json(url)
+
+    assert len(upstream.call(url, fetch)) == 3
+    assert _outcomes(upstream, 'retried') == 1
+    assert _outcomes(upstream, 'ok') == 1
@@ -0,0 +1,118 @@
+# tests/test_retention.py - Retention of small stores on both storage backends
+
+import datetime
+import pytest
+from log_store import SegmentedLogStore
+from storage_backends import SQLiteBackend
+from retention import RetentionCompactor, RollupStore, HOURLY
+
+NOW = datetime.datetime(2026, 1, 31, 12, 0)
+
+
+def _open_store(backend: str, directory: str):
+    if backend == 'sqlite':
+        return SQLiteBackend(str(directory / 'alerts.sqlite3'))
+    return SegmentedLogStore(str(directory / 'log'))
+
+
+def _record(timestamp: datetime.datetime) -> dict:
+    return {"fetch_timestamp": timestamp.isoformat(), "id": timestamp.strftime("%Y%m%d%H%M%S%f"),
+            "raw_payload": {"monitoring_location": "Amsterdam, NL",
+                            "raw_weather": {"temperature_c": 12.0, "condition": "Clear"},
+                            "raw_incidents": []}}
+
+
+@pytest.mark.parametrize("backend", ['log', 'sqlite'])
+def test_small_store_ages_out(tmp_path, backend):
+    # Four records a day for 30 days, far fewer than a segment holds, with a retention pass after each day
+    store = _open_store(backend, tmp_path)
+    rollups = RollupStore(str(tmp_path))
+    compactor = RetentionCompactor(store, rollups, full_days=7, hourly_days=90, segment_days=1)
+    start = NOW - datetime.timedelta(days=30)
+    dropped = 0
+    for day in range(30):
+        timestamps = [start + datetime.timedelta(days=day, hours=6 * i) for i in range(4)]
+        store.append_many([_record(timestamp) for timestamp in timestamps])
+        dropped += compactor.compact_once(timestamps[-1])
+
+    kept = [record for _, record in store.scan(store.first_seq)]
+    oldest = min(datetime.datetime.fromisoformat(record["fetch_timestamp"]) for record in kept)
+    assert dropped + len(kept) == 120
+    assert sum(bucket["records"] for bucket in rollups.query(HOURLY)) == dropped
+    # Kept for full_days, plus up to segment_days where a segment cannot be split
+    assert oldest >= NOW - datetime.timedelta(days=7 + 1 + 1)
+    store.close()
+
+
+def test_sqlite_backfill_is_split_at_cutoff(tmp_path):
+    # 124 records over 30 days written at once: a single range, split at the cutoff
+    store = SQLiteBackend(str(tmp_path / 'alerts.sqlite3'))
+    start = NOW - datetime.timedelta(days=30)
+    step = datetime.timedelta(days=30) / 124
+    store.append_many([_record(start + step * i) for i in range(124)])
+
+    dropped = RetentionCompactor(store, RollupStore(str(tmp_path)), full_days=7, hourly_days=90).compact_once(NOW)
+
+    cutoff = NOW - datetime.timedelta(days=7)
+    kept = [record for _, record in store.scan(store.first_seq)]
+    assert dropped == sum(1 for i in range(124) if start + step * i < cutoff)
+    assert dropped + len(kept) == 124
+    assert all(datetime.datetime.fromisoformat(record["fetch_timestamp"]) >= cutoff for record in kept)
+    store.close()
+
+
+def test_sqlite_seal_splits_ranges(tmp_path):
+    store = SQLiteBackend(str(tmp_path / 'alerts.sqlite3'), segment_rows=100)
+    store.append_many([_record(NOW)] * 250)
+    assert store.sealed_segments() == [(0, 100), (100, 200)]
+
+    assert store.seal(150)
+    assert store.seal()
+    assert not store.seal()
+    assert store.sealed_segments() == [(0, 100), (100, 150), (150, 200), (200, 250)]
+
+    assert store.drop_segments_before(150) == 150
+    assert store.sealed_segments() == [(150, 200), (200, 250)]
+    store.close()
+
+
+def _append_dated(db, package: dict, timestamp: datetime.datetime):
+    """Stores a package the way save_presentation_delta does, but dated `timestamp`."""
+    kind, body = db._detector.diff(package)
+    record = db._make_record(body, kind)
+    record["fetch_timestamp"] = timestamp.isoformat()
+    db.get_store().append(record)
+
+
+def test_delta_chains_survive_dropped_snapshots(db):
+    old = datetime.datetime.now() - datetime.timedelta(days=10)
+    incident = {"id": "I1", "type": "INCIDENT", "status": "ACTIVE", "location": "Main Street"}
+    package_a = {"monitoring_location": "A", "raw_weather": {"t": 1}, "raw_incidents": [], "raw_ov_updates": []}
+    package_b = {"monitoring_location": "B", "raw_weather": {"t": 5}, "raw_incidents": [], "raw_ov_updates": []}
+    _append_dated(db, package_a, old)
+    _append_dated(db, dict(package_a, raw_incidents=[incident]), old)
+    _append_dated(db, package_b, old)
+    db.get_store().seal()
+    assert db.save_presentation_delta(dict(package_a, raw_weather={"t": 2}, raw_incidents=[incident]))
+
+    before_a, before_b = db.rebuild_snapshot("A"), db.rebuild_snapshot("B")
+    assert before_a["raw_weather"] == {"t": 2} and before_a["raw_incidents"] == [incident]
+
+    assert db.compact_history(7, 90) == 3
+    # A's kept delta and B's unchanged state are still rebuilt from consolidated snapshots
+    assert db.rebuild_snapshot("A") == before_a
+    assert db.rebuild_snapshot("B") == before_b == package_b
+    # Nothing to re-base on the next pass
+    assert db.compact_history(7, 90) == 0
+    assert db.rebuild_snapshot("A") == before_a
+
+
+def test_full_snapshots_are_not_rebased(db):
+    old = datetime.datetime.now() - datetime.timedelta(days=10)
+    record = db._make_record({"monitoring_location": "A", "raw_weather": {"t": 1}})
+    record["fetch_timestamp"] = old.isoformat()
+    db.get_store().append(record)
+    db.get_store().seal()
+
+    assert db.compact_history(7, 90) == 1
+    assert db.get_store().count == 0
@@ -0,0 +1,39 @@
+# tests/test_subscriptions.py - Subscription index matches agree with a brute-force check
+
+import random
+from geo_proximity import haversine_matrix
+from alert_index import normalize_key, location_tokens
+from subscriptions import Subscription, SubscriptionIndex
+
+TYPES = ["Roadwork", "Event", "Incident"]
+KEYWORDS = ["closure", "police", "delay", "bridge"]
+
+
+def _brute_force(subscriptions: list, incident: dict, lat: float, lon: float) -> set:
+    words = set(location_tokens(incident.get('details')))
+    matched = set()
+    for sub in subscriptions:
+        if sub.incident_types and normalize_key(incident['type']) not in sub.incident_types:
+            continue
+        if sub.keywords and not sub.keywords & words:
+            continue
+        if haversine_matrix([lat], [lon], [sub.lat], [sub.lon])[0][0] <= sub.radius_m:
+            matched.add(sub.subscription_id)
+    return matched
+
+
+def test_match_incident_agrees_with_brute_force():
+    rng = random.Random(7)
+    subscriptions = [
+        Subscription(f"s{i}", rng.uniform(52.35, 52.38), rng.uniform(4.87, 4.91), rng.choice([200.0, 800.0, 2000.0]),
+                     rng.sample(TYPES, rng.randint(0, 2)), rng.sample(KEYWORDS, rng.randint(0, 3)))
+        for i in range(2000)
+    ]
+    index = SubscriptionIndex()
+    index.add_many(subscriptions)
+    for _ in range(50):
+        lat, lon = rng.uniform(52.35, 52.38), rng.uniform(4.87, 4.91)
+        incident = {"type": rng.choice(TYPES + ["Other"]), "location": "somewhere",
+                    "details": " ".join(rng.sample(KEYWORDS + ["road", "park"], rng.randint(0, 3)))}
+        matched = {sub.subscription_id for sub, _ in index.match_incident(incident, (lat, lon))}
+        assert matched == _brute_force(subscriptions, incident, lat, lon)